@@ -27,6 +27,7 @@ from contextlib import nullcontext
 
 from billiard.einfo import ExceptionInfo
 from celery import Task, exceptions, states as celery_states
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.utils import translation
@@ -42,8 +43,15 @@ from ESSArch_Core.db.utils import check_db_connection
 from ESSArch_Core.essxml.Generator.xmlGenerator import parseContent
 from ESSArch_Core.ip.models import EventIP, InformationPackage
 from ESSArch_Core.profiles.utils import fill_specification_data
-from ESSArch_Core.WorkflowEngine.models import ProcessStep, ProcessTask
-from ESSArch_Core.WorkflowEngine.util import get_result
+from ESSArch_Core.WorkflowEngine.models import (
+    ProcessStep,
+    ProcessTask,
+    update_step_status,
+)
+from ESSArch_Core.WorkflowEngine.util import (
+    get_result,
+    get_workflow_context_version,
+)
 
 User = get_user_model()
 
@@ -80,13 +88,10 @@ class DBTask(Task):
         for k, v in self.result_params.items():
             kwargs[k] = get_result(self.step, v)
 
-        try:
-            user = User.objects.get(pk=self.responsible)
-            if user.user_profile is not None:
-                with translation.override(user.user_profile.language):
-                    return self._run(*args, **kwargs)
-        except User.DoesNotExist:
-            pass
+        self.workflow_context = self.get_workflow_context()
+        if self.workflow_context['language'] is not None:
+            with translation.override(self.workflow_context['language']):
+                return self._run(*args, **kwargs)
 
         return self._run(*args, **kwargs)
 
@@ -123,6 +128,14 @@ class DBTask(Task):
     def step(self):
         return self.headers.get('step')
 
+    @property
+    def processtask(self):
+        return self.headers.get('processtask')
+
+    @property
+    def workflow(self):
+        return self.headers.get('workflow')
+
     @property
     def step_pos(self):
         return self.headers.get('step_pos')
@@ -139,8 +152,41 @@ class DBTask(Task):
     def eager(self):
         return self.request.is_eager
 
-    def _run(self, *args, **kwargs):
-        self.extra_data = {}
+    def get_workflow_context_cache_key(self):
+        if not getattr(settings, 'WORKFLOW_CONTEXT_CACHE_TIMEOUT', 0):
+            return None
+
+        return 'workflow_context_{}_{}_{}_{}_{}'.format(
+            self.workflow, self.ip, self.responsible,
+            get_workflow_context_version(), get_workflow_context_version(self.ip) if self.ip else None,
+        )
+
+    def get_workflow_context(self):
+        """
+        Returns the data shared by the tasks of the workflow: the information
+        package and its specification data, the username and language of the
+        responsible user and the merged contexts of the steps.
+
+        The context is cached per workflow, information package and user
+        until invalidate_workflow_context is called
+        """
+
+        cache_key = self.get_workflow_context_cache_key()
+        if cache_key is not None:
+            context = cache.get(cache_key)
+            if context is not None:
+                return context
+
+        context = {'ip': None, 'data': {}, 'username': None, 'language': None, 'steps': {}}
+
+        try:
+            user = User.objects.select_related('user_profile').get(pk=self.responsible)
+            context['username'] = user.username
+            if user.user_profile is not None:
+                context['language'] = user.user_profile.language
+        except User.DoesNotExist:
+            pass
+
         if self.ip:
             try:
                 for attempt in Retrying(stop=stop_after_delay(30), wait=wait_random_exponential(multiplier=1, max=60)):
@@ -153,19 +199,56 @@ class DBTask(Task):
 - retry'.format(self.name, self.task_id, self.step, self.ip))
                             raise e
             except RetryError:
+                # don't cache the context, the information package might
+                # exist when the next task runs
+                return context
+
+            context['ip'] = str(ip)
+            context['data'] = fill_specification_data(ip=ip, sa=ip.submission_agreement).to_dict()
+
+        if cache_key is not None:
+            cache.set(cache_key, context, settings.WORKFLOW_CONTEXT_CACHE_TIMEOUT)
+
+        return context
+
+    def get_step_context(self):
+        """
+        Returns the contexts of the step and its ancestors merged, from the
+        workflow context if available
+        """
+
+        steps = self.workflow_context['steps']
+        if self.step in steps:
+            return steps[self.step]
+
+        step_context = {}
+        try:
+            step = ProcessStep.objects.get(pk=self.step)
+            for ancestor in step.get_ancestors(include_self=True):
+                step_context.update(ancestor.context)
+        except ProcessStep.DoesNotExist:
+            self.logger.warning('Exception in _run_task for task: {} ({}), step_id: {}, DoesNotExist when get \
+step, (self.ip: {})'.format(self.name, self.task_id, self.step, self.ip))
+            return step_context
+
+        steps[self.step] = step_context
+        cache_key = self.get_workflow_context_cache_key()
+        if cache_key is not None:
+            cache.set(cache_key, self.workflow_context, settings.WORKFLOW_CONTEXT_CACHE_TIMEOUT)
+
+        return step_context
+
+    def _run(self, *args, **kwargs):
+        self.extra_data = {}
+        if self.ip:
+            if self.workflow_context['ip'] is None:
                 self.logger.warning('RetryError in _run for task: {} ({}), step_id: {}, \
 DoesNotExist when get ip: {} - try to _run_task without IP'.format(self.name, self.task_id, self.step, self.ip))
                 return self._run_task(*args, **kwargs)
 
-            ip.refresh_from_db()
-            updated_data = fill_specification_data(ip=ip, sa=ip.submission_agreement)
-            updated_data_dict = updated_data.to_dict()
-            self.extra_data.update(updated_data_dict)
-            # if self.name == 'ESSArch_Core.tasks.ValidateXMLFile':
-            #     self.logger.info('dbtask: {} - ip: {}, updated_data: {}'.format(self.name, ip, repr(updated_data)))
-            #     self.logger.info('dbtask: {} - ip: {}, updated_data_dict: {}'.format(self.name, ip,
-            #                                                                           repr(updated_data_dict)))
-            #     self.logger.info('dbtask: {} - ip: {}, extra_data: {}'.format(self.name, ip, repr(self.extra_data)))
+            ip = InformationPackage(pk=self.ip)
+            ip_str = self.workflow_context['ip']
+            self.extra_data.update(self.workflow_context['data'])
 
             if self.parallel:
                 cm = nullcontext()
@@ -176,17 +259,18 @@ DoesNotExist when get ip: {} - try to _run_task without IP'.format(self.name, se
                     if not self.parallel:
                         self.logger.warning(
                             'IP: {} is already locked when task: {} ({}) try to acquire lock'.format(
-                                ip, self.name, self.task_id))
+                                ip_str, self.name, self.task_id))
                     else:
                         self.logger.warning(
                             'IP: {} is already locked when task: {} ({}) try to run task in parallel'.format(
-                                ip, self.name, self.task_id))
+                                ip_str, self.name, self.task_id))
                 with cm:
                     if not self.parallel:
-                        self.logger.info('Task: {} ({}) acquired lock for IP {}'.format(self.name, self.task_id, ip))
+                        self.logger.info('Task: {} ({}) acquired lock for IP {}'.format(
+                            self.name, self.task_id, ip_str))
                     else:
                         self.logger.info('Task: {} ({}) is running in parallel for IP: {}'.format(
-                            self.name, self.task_id, ip))
+                            self.name, self.task_id, ip_str))
                     try:
                         for attempt in Retrying(stop=stop_after_delay(30),
                                                 wait=wait_random_exponential(multiplier=1, max=60)):
@@ -210,10 +294,10 @@ when get ProcessTask'.format(self.name, self.task_id, self.step, self.ip))
                     else:
                         r = self._run_task(*args, **kwargs)
                 if not self.parallel:
-                    self.logger.info('{} released lock for IP: {}'.format(self.task_id, str(ip)))
+                    self.logger.info('{} released lock for IP: {}'.format(self.task_id, ip_str))
             except LockNotOwnedError:
                 self.logger.warning('Task: {} ({}) LockNotOwnedError for IP: {}'.format(
-                    self.name, self.task_id, str(ip)))
+                    self.name, self.task_id, ip_str))
                 r = None
             return r
 
@@ -221,13 +305,7 @@ when get ProcessTask'.format(self.name, self.task_id, self.step, self.ip))
 
     def _run_task(self, *args, **kwargs):
         if self.step is not None:
-            try:
-                step = ProcessStep.objects.get(pk=self.step)
-                for ancestor in step.get_ancestors(include_self=True):
-                    self.extra_data.update(ancestor.context)
-            except ProcessStep.DoesNotExist:
-                self.logger.warning('Exception in _run_task for task: {} ({}), step_id: {}, DoesNotExist when get \
-step, (self.ip: {})'.format(self.name, self.task_id, self.step, self.ip))
+            self.extra_data.update(self.get_step_context())
 
         try:
             if self.eager:
@@ -250,6 +328,8 @@ step, (self.ip: {})'.format(self.name, self.task_id, self.step, self.ip))
                     exception=self.backend.prepare_exception(e),
                     traceback=einfo.traceback,
                 )
+                if self.step is not None:
+                    update_step_status(self.step)
                 self.logger.error('Task with flag "allow failure" failed with exception {}'.format(einfo.exception))
                 return None
 
@@ -265,21 +345,6 @@ step, (self.ip: {})'.format(self.name, self.task_id, self.step, self.ip))
 
         self.backend.update_state(task_id, meta, state, request=self.request, **kwargs)
 
-    def after_return(self, status, retval, task_id, args, kwargs, einfo):
-        if self.step is None:
-            return
-
-        try:
-            step = ProcessStep.objects.get(pk=self.step)
-        except ProcessStep.DoesNotExist:
-            return
-
-        # with cache_lock(step.cache_lock_key):
-        with cache.lock(step.cache_lock_key, timeout=60):
-            step.clear_cache()
-
-        return super().after_return(status, retval, task_id, args, kwargs, einfo)
-
     def create_event(self, status, msg, retval, einfo):
         check_db_connection()
         if status == celery_states.SUCCESS:
@@ -294,16 +359,24 @@ step, (self.ip: {})'.format(self.name, self.task_id, self.step, self.ip))
         if outcome_detail_note is None:
             outcome_detail_note = ''
 
-        try:
-            agent = User.objects.values_list('username', flat=True).get(pk=self.responsible)
-        except User.DoesNotExist:
-            agent = None
+        workflow_context = getattr(self, 'workflow_context', None)
+        if workflow_context is not None:
+            agent = workflow_context['username']
+        else:
+            try:
+                agent = User.objects.values_list('username', flat=True).get(pk=self.responsible)
+            except User.DoesNotExist:
+                agent = None
+
+        task = self.processtask
+        if task is None:
+            task = ProcessTask.objects.values_list('pk', flat=True).get(celery_id=self.task_id)
 
         extra = {
             'event_type': self.event_type,
             'object': self.ip,
             'agent': agent,
-            'task': ProcessTask.objects.get(celery_id=self.task_id).pk,
+            'task': task,
             'outcome': outcome
         }
         self.logger.log(level, outcome_detail_note, extra=extra)
@@ -351,11 +424,11 @@ step, (self.ip: {})'.format(self.name, self.task_id, self.step, self.ip))
             self.update_state(task_id=self.task_id, state=celery_states.SUCCESS)
             self.backend.store_result(self.task_id, retval, celery_states.SUCCESS)
 
-    def set_progress(self, progress, total=None):
+    def set_progress(self, progress, total=None, **meta):
         if not self.track:
             return
 
-        self.update_state(meta={'current': progress, 'total': total})
+        self.update_state(meta={'current': progress, 'total': total, **meta})
 
     def parse_params(self, *params):
         return tuple([parseContent(param, self.extra_data) for param in params])
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.14 on 2026-10-18 13:18
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+# copy of ESSArch_Core.WorkflowEngine.models.calculate_step_state at the time of this migration
+def calculate_step_state(task_states, child_states):
+    total = sum(count for count, _progress in task_states.values()) + len(child_states)
+    if total == 0:
+        return 'PENDING', 0
+
+    progress = sum(progress or 0 for _count, progress in task_states.values())
+    progress += sum(child_progress for _status, child_progress in child_states)
+    progress = progress / total
+
+    if 'FAILURE' in task_states:
+        return 'FAILURE', progress
+
+    if 'REVOKED' in task_states:
+        return 'REVOKED', progress
+
+    status = 'SUCCESS'
+
+    if 'PENDING' in task_states:
+        if 'SUCCESS' in task_states:
+            status = 'STARTED'
+        else:
+            status = 'PENDING'
+
+    if 'STARTED' in task_states:
+        status = 'STARTED'
+
+    partially_done = False
+    for child_status, _child_progress in child_states:
+        if child_status == 'STARTED':
+            status = child_status
+        if child_status == 'SUCCESS':
+            partially_done = True
+        if child_status == 'PENDING' and status != 'STARTED':
+            if partially_done:
+                status = 'STARTED'
+            else:
+                status = child_status
+        if child_status == 'FAILURE':
+            return child_status, progress
+
+    return status, progress
+
+
+def calculate_step_states(apps, schema_editor):
+    ProcessStep = apps.get_model("WorkflowEngine", "ProcessStep")
+    ProcessTask = apps.get_model("WorkflowEngine", "ProcessTask")
+
+    # child steps are calculated before their parents
+    for step in ProcessStep.objects.only('id').order_by('-level').iterator(chunk_size=1000):
+        task_states = {
+            row['status']: (row['count'], row['progress'])
+            for row in ProcessTask.objects.filter(
+                processstep_id=step.pk, retried__isnull=True,
+            ).values('status').annotate(count=Count('id'), progress=Sum('progress')).order_by()
+        }
+        child_states = list(ProcessStep.objects.filter(parent_id=step.pk).order_by(
+            'parent_pos', 'time_created',
+        ).values_list('status', 'progress'))
+        status, progress = calculate_step_state(task_states, child_states)
+        ProcessStep.objects.filter(pk=step.pk).update(status=status, progress=progress)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WorkflowEngine', '0089_alter_processstep_queue_alter_processtask_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processstep',
+            name='progress',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='processstep',
+            name='status',
+            field=models.CharField(choices=[('FAILURE', 'FAILURE'), ('PENDING', 'PENDING'), ('RECEIVED', 'RECEIVED'), ('RETRY', 'RETRY'), ('REVOKED', 'REVOKED'), ('STARTED', 'STARTED'), ('SUCCESS', 'SUCCESS')], default='PENDING', editable=False, max_length=50, verbose_name='state'),
+        ),
+        migrations.RunPython(calculate_step_states, migrations.RunPython.noop),
+    ]
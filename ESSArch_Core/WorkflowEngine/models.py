@@ -33,9 +33,9 @@ from urllib.parse import urljoin
 import tblib
 from celery import chain, current_app, group, states as celery_states
 from celery.result import EagerResult
-from django.core.cache import cache
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Count, Sum
+from django.db.models.query_utils import DeferredAttribute
 from django.urls import reverse
 from django.utils.translation import gettext as _
 from mptt.models import MPTTModel, TreeForeignKey
@@ -79,6 +79,8 @@ def create_sub_task(t, step=None, immutable=True, link_error=None):
         'allow_failure': t.allow_failure,
         'result_params': t.result_params,
         'parallel': t.processstep.parallel if t.processstep else False,
+        'processtask': str(t.pk),
+        'workflow': step.tree_id if step is not None else None,
     }
     headers_hack = {'headers': headers}
 
@@ -99,6 +101,117 @@ def create_sub_task(t, step=None, immutable=True, link_error=None):
     return res
 
 
+def calculate_step_state(task_states, child_states):
+    """
+    Calculates the status and progress of a step
+
+    Args:
+        task_states: The number of tasks and the sum of their progress for
+                     each status of the tasks in the step, ignoring retries
+        child_states: The status and progress of each child step, in order
+
+    Returns:
+        The status and progress of the step. The progress is the average of
+        the progress of the tasks and child steps, the status is decided by
+        five scenarios:
+
+        * If there are no child steps nor tasks, then PENDING.
+        * If there are child steps or tasks and they are all pending,
+          then PENDING.
+        * If a child step or task has started, then STARTED.
+        * If a child step or task has failed, then FAILURE.
+        * If all child steps and tasks have succeeded, then SUCCESS.
+    """
+
+    total = sum(count for count, _progress in task_states.values()) + len(child_states)
+    if total == 0:
+        return celery_states.PENDING, 0
+
+    progress = sum(progress or 0 for _count, progress in task_states.values())
+    progress += sum(child_progress for _status, child_progress in child_states)
+    progress = progress / total
+
+    if celery_states.FAILURE in task_states:
+        return celery_states.FAILURE, progress
+
+    if celery_states.REVOKED in task_states:
+        return celery_states.REVOKED, progress
+
+    status = celery_states.SUCCESS
+
+    if celery_states.PENDING in task_states:
+        if celery_states.SUCCESS in task_states:
+            status = celery_states.STARTED
+        else:
+            status = celery_states.PENDING
+
+    if celery_states.STARTED in task_states:
+        status = celery_states.STARTED
+
+    partially_done = False
+    for child_status, _child_progress in child_states:
+        if child_status == celery_states.STARTED:
+            status = child_status
+        if child_status == celery_states.SUCCESS:
+            partially_done = True
+        if child_status == celery_states.PENDING and status != celery_states.STARTED:
+            if partially_done:
+                status = celery_states.STARTED
+            else:
+                status = child_status
+        if child_status == celery_states.FAILURE:
+            return child_status, progress
+
+    return status, progress
+
+
+def update_step_status(step_id):
+    """
+    Recalculates the stored status and progress of the step from its tasks
+    and child steps, and then of each ancestor until one is unchanged
+
+    Args:
+        step_id: The id of the step
+
+    Returns:
+        The new status and progress of the step
+    """
+
+    result = None
+
+    with transaction.atomic():
+        while step_id is not None:
+            try:
+                step = ProcessStep.objects.select_for_update().only(
+                    'parent', 'status', 'progress',
+                ).get(pk=step_id)
+            except ProcessStep.DoesNotExist:
+                break
+
+            task_states = {
+                row['status']: (row['count'], row['progress'])
+                for row in ProcessTask.objects.filter(
+                    processstep_id=step_id, retried__isnull=True,
+                ).values('status').annotate(count=Count('id'), progress=Sum('progress')).order_by()
+            }
+            child_states = list(step.child_steps.values_list('status', 'progress'))
+            status, progress = calculate_step_state(task_states, child_states)
+
+            if result is None:
+                result = (status, progress)
+
+            if (status, progress) == (step.status, step.progress):
+                break
+
+            ProcessStep.objects.filter(pk=step_id).update(status=status, progress=progress)
+            step_id = step.parent_id
+
+    if result is None:
+        return celery_states.PENDING, 0
+
+    return result
+
+
 class Process(models.Model):
     _states = list(zip(
         celery_states.ALL_STATES, celery_states.ALL_STATES
@@ -135,9 +248,22 @@ class ProcessStep(MPTTModel, Process):
     parallel = models.BooleanField(default=False)
     on_error = models.ManyToManyField('ProcessTask', related_name='steps_on_errors')
     context = models.JSONField(default=dict, null=True)
+    status = models.CharField(
+        _('state'), max_length=50, default=celery_states.PENDING, choices=Process.STATE_CHOICES, editable=False,
+    )
+    progress = models.FloatField(default=0, editable=False)
     descendants = MPTTDescendants()
     subtree = MPTTSubtree()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the parent in the database, used to only update the status of the
+        # parents when the step is moved. mptt always saves the parent and
+        # updates its own copy before the step is saved
+        instance._loaded_parent_id = instance.__dict__.get('parent_id', DeferredAttribute)
+        return instance
+
     def get_pos(self):
         return self.parent_pos
 
@@ -146,28 +272,28 @@ class ProcessStep(MPTTModel, Process):
         return ProcessTask.objects.filter(processstep__in=steps)
 
     def add_tasks(self, *tasks):
-        self.clear_cache()
         self.tasks.add(*tasks)
+        self.update_status()
 
     def remove_tasks(self, *tasks):
-        self.clear_cache()
         self.tasks.remove(*tasks)
+        self.update_status()
 
     def clear_tasks(self):
-        self.clear_cache()
         self.tasks.clear()
+        self.update_status()
 
     def add_child_steps(self, *steps):
-        self.clear_cache()
         self.child_steps.add(*steps)
+        self.update_status()
 
     def remove_child_steps(self, *steps):
-        self.clear_cache()
         self.child_steps.remove(*steps)
+        self.update_status()
 
     def clear_child_steps(self):
-        self.clear_cache()
         self.child_steps.clear()
+        self.update_status()
 
     def task_set(self):
         """
@@ -178,16 +304,20 @@ class ProcessStep(MPTTModel, Process):
         """
         return self.tasks.filter(retried__isnull=True).order_by("processstep_pos")
 
-    def clear_cache(self):
+    def update_status(self):
         """
-        Clears the cache for this step and all its ancestors
+        Recalculates the status and progress of this step and its ancestors
         """
 
-        cache.delete(self.cache_status_key)
-        cache.delete(self.cache_progress_key)
+        self.status, self.progress = update_step_status(self.pk)
 
-        if self.parent:
-            self.parent.clear_cache()
+    def _get_user_field_names(self):
+        # status and progress are maintained by update_step_status, don't
+        # overwrite them with the values read when the step was loaded
+        return [
+            name for name in super()._get_user_field_names()
+            if name not in ('status', 'progress')
+        ]
 
     def get_part_root(self):
         """
@@ -365,18 +495,6 @@ class ProcessStep(MPTTModel, Process):
 
         return self.run_children(tasks, child_steps, direct)
 
-    @property
-    def cache_lock_key(self):
-        return '%s_lock' % str(self.pk)
-
-    @property
-    def cache_status_key(self):
-        return '%s_status' % str(self.pk)
-
-    @property
-    def cache_progress_key(self):
-        return '%s_progress' % str(self.pk)
-
     @property
     def time_started(self):
         try:
@@ -403,133 +521,6 @@ class ProcessStep(MPTTModel, Process):
         except ProcessTask.DoesNotExist:
             return None
 
-    @property
-    def progress(self):
-        """
-        Gets the progress of the step based on its child steps and tasks
-
-        Args:
-
-        Returns:
-            The progress calculated by progress/total where progress simply is
-            the progress (0-100) of all the underlying tasks and the total is
-            |child_steps| + |tasks|
-        """
-
-        with cache.lock(self.cache_lock_key, timeout=60):
-            cached = cache.get(self.cache_progress_key)
-
-            if cached is not None:
-                return cached
-
-            if not self.child_steps.exists() and not self.tasks.exists():
-                progress = 0
-                cache.set(self.cache_progress_key, progress)
-                return progress
-
-            child_steps = self.child_steps.all()
-            progress = 0
-            task_data = self.tasks.filter(retried__isnull=True).aggregate(
-                progress=Sum('progress'),
-                task_count=Count('id')
-            )
-
-            total = len(child_steps) + task_data['task_count']
-
-            if total == 0:
-                cache.set(self.cache_progress_key, 100)
-                return 100
-
-            progress += sum([c.progress for c in child_steps])
-
-            try:
-                progress += task_data['progress']
-            except Exception:
-                pass
-
-            try:
-                res = progress / total
-                cache.set(self.cache_progress_key, res)
-                return res
-            except Exception:
-                cache.set(self.cache_progress_key, 0)
-                return 0
-
-    @property
-    def status(self):
-        """
-        Gets the status of the step based on its child steps and tasks
-
-        Args:
-
-        Returns:
-            Can be one of the following:
-            SUCCESS, STARTED, FAILURE, PENDING
-
-            Which is decided by five scenarios:
-
-            * If there are no child steps nor tasks, then SUCCESS.
-            * If there are child steps or tasks and they are all pending,
-              then PENDING.
-            * If a child step or task has started, then STARTED.
-            * If a child step or task has failed, then FAILURE.
-            * If all child steps and tasks have succeeded, then SUCCESS.
-        """
-
-        with cache.lock(self.cache_lock_key, timeout=60):
-            cached = cache.get(self.cache_status_key)
-
-            if cached is not None:
-                return cached
-
-            child_steps = self.child_steps.all()
-            tasks = self.tasks.filter(retried__isnull=True)
-            status = celery_states.SUCCESS
-            partially_done = False
-
-            if not child_steps.exists() and not tasks.exists():
-                status = celery_states.PENDING
-                cache.set(self.cache_status_key, status)
-                return status
-
-            if tasks.filter(status=celery_states.FAILURE).exists():
-                cache.set(self.cache_status_key, celery_states.FAILURE)
-                return celery_states.FAILURE
-
-            if tasks.filter(status=celery_states.REVOKED).exists():
-                cache.set(self.cache_status_key, celery_states.REVOKED)
-                return celery_states.REVOKED
-
-            if tasks.filter(status=celery_states.SUCCESS).exists():
-                partially_done = True
-
-            if tasks.filter(status=celery_states.PENDING).exists():
-                if partially_done:
-                    status = celery_states.STARTED
-                else:
-                    status = celery_states.PENDING
-
-            if tasks.filter(status=celery_states.STARTED).exists():
-                status = celery_states.STARTED
-
-            partially_done = False
-            for cs in child_steps.only('parent').iterator(chunk_size=1000):
-                if cs.status == celery_states.STARTED:
-                    status = cs.status
-                if cs.status == celery_states.SUCCESS:
-                    partially_done = True
-                if (cs.status == celery_states.PENDING and status != celery_states.STARTED):
-                    if partially_done:
-                        status = celery_states.STARTED
-                    else:
-                        status = cs.status
-                if cs.status == celery_states.FAILURE:
-                    cache.set(self.cache_status_key, cs.status)
-                    return cs.status
-
-            cache.set(self.cache_status_key, status)
-            return status
-
     class Meta:
         db_table = 'ProcessStep'
         ordering = ('parent_pos', 'time_created')
@@ -747,6 +738,8 @@ class ProcessTask(Process):
             'step_pos': self.processstep_pos, 'hidden': self.hidden,
             'allow_failure': self.allow_failure,
             'parallel': self.processstep.parallel if self.processstep else False,
+            'processtask': str(self.pk),
+            'workflow': self.processstep.tree_id if self.processstep else None,
         }
 
         on_error_tasks = self.on_error(manager='by_step_pos').all()
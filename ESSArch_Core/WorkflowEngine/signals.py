@@ -1,11 +1,39 @@
 import logging
 
-from celery.signals import task_received, task_revoked
-from django.db.models.signals import post_save, pre_save
+from celery.signals import (
+    task_postrun,
+    task_received,
+    task_revoked,
+    worker_process_shutdown,
+)
+from django.db.models.query_utils import DeferredAttribute
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_save,
+)
 from django.dispatch import receiver
 
+from ESSArch_Core.auth.models import UserProfile
+from ESSArch_Core.configuration.models import Parameter, Path, StoragePolicy
 from ESSArch_Core.db.utils import check_db_connection
-from ESSArch_Core.WorkflowEngine.models import ProcessStep, ProcessTask
+from ESSArch_Core.ip.models import Agent, AgentNote, InformationPackage
+from ESSArch_Core.log.dbhandler import flush_buffered_handlers
+from ESSArch_Core.profiles.models import (
+    Profile,
+    ProfileIP,
+    ProfileIPData,
+    ProfileSA,
+    SubmissionAgreement,
+    SubmissionAgreementIPData,
+)
+from ESSArch_Core.WorkflowEngine.models import (
+    ProcessStep,
+    ProcessTask,
+    update_step_status,
+)
+from ESSArch_Core.WorkflowEngine.util import invalidate_workflow_context
 
 
 @receiver(pre_save, sender=ProcessTask)
@@ -15,19 +43,107 @@ def task_pre_save(sender, instance, **kwargs):
 
 
 @receiver(post_save, sender=ProcessTask)
-def task_post_save(sender, instance, created, **kwargs):
-    try:
-        instance.processstep.clear_cache()
-    except AttributeError:
-        pass
+def task_post_save(sender, instance, created, update_fields=None, **kwargs):
+    if instance.processstep_id is None:
+        return
+
+    if update_fields is not None and not {'status', 'progress', 'processstep', 'retried'} & set(update_fields):
+        return
+
+    update_step_status(instance.processstep_id)
+
+
+@receiver(post_delete, sender=ProcessTask)
+def task_post_delete(sender, instance, origin=None, **kwargs):
+    if instance.processstep_id is None:
+        return
+
+    # tasks deleted together with their step or information package leave no
+    # step behind to update
+    if getattr(origin, 'model', type(origin)) is not ProcessTask:
+        return
+
+    update_step_status(instance.processstep_id)
 
 
 @receiver(post_save, sender=ProcessStep)
-def step_post_save(sender, instance, created, **kwargs):
-    try:
-        instance.parent.clear_cache()
-    except AttributeError:
-        pass
+def step_post_save(sender, instance, created, update_fields=None, **kwargs):
+    if not created and (update_fields is None or {'context', 'parent'} & set(update_fields)):
+        invalidate_workflow_context(instance.information_package_id)
+
+    if update_fields is not None and 'parent' not in update_fields:
+        return
+
+    old_parent_id = None if created else getattr(instance, '_loaded_parent_id', DeferredAttribute)
+    instance._loaded_parent_id = instance.parent_id
+
+    if old_parent_id == instance.parent_id:
+        return
+
+    # the old parent is unknown if it wasn't loaded
+    if old_parent_id is not None and old_parent_id is not DeferredAttribute:
+        update_step_status(old_parent_id)
+
+    if instance.parent_id is not None:
+        update_step_status(instance.parent_id)
+
+
+@receiver(post_delete, sender=ProcessStep)
+def step_post_delete(sender, instance, **kwargs):
+    if instance.parent_id is not None:
+        update_step_status(instance.parent_id)
+
+
+@receiver(post_save, sender=InformationPackage)
+@receiver(post_delete, sender=InformationPackage)
+def ip_changed(sender, instance, **kwargs):
+    invalidate_workflow_context(instance.pk)
+
+
+@receiver(post_save, sender=ProfileIP)
+@receiver(post_delete, sender=ProfileIP)
+def profile_ip_changed(sender, instance, **kwargs):
+    invalidate_workflow_context(instance.ip_id)
+
+
+@receiver(post_save, sender=ProfileIPData)
+def profile_ip_data_post_save(sender, instance, **kwargs):
+    ip_id = ProfileIP.objects.filter(pk=instance.relation_id).values_list('ip_id', flat=True).first()
+    invalidate_workflow_context(ip_id)
+
+
+@receiver(post_save, sender=SubmissionAgreementIPData)
+@receiver(post_delete, sender=SubmissionAgreementIPData)
+def submission_agreement_ip_data_changed(sender, instance, **kwargs):
+    invalidate_workflow_context(instance.information_package_id)
+
+
+@receiver(m2m_changed, sender=InformationPackage.agents.through)
+def ip_agents_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+
+    if not reverse:
+        invalidate_workflow_context(instance.pk)
+    elif pk_set:
+        for ip_id in pk_set:
+            invalidate_workflow_context(ip_id)
+    else:
+        # all information packages of the agent were removed
+        invalidate_workflow_context()
+
+
+@receiver(post_save, sender=Agent)
+@receiver(post_save, sender=AgentNote)
+@receiver(post_save, sender=Parameter)
+@receiver(post_save, sender=Path)
+@receiver(post_save, sender=Profile)
+@receiver(post_save, sender=ProfileSA)
+@receiver(post_save, sender=StoragePolicy)
+@receiver(post_save, sender=SubmissionAgreement)
+@receiver(post_save, sender=UserProfile)
+def shared_workflow_context_changed(sender, instance, **kwargs):
+    invalidate_workflow_context()
 
 
 @task_received.connect
@@ -48,3 +164,14 @@ def task_received_handler(request=None, **kwargs):
 def task_revoked_handler(request=None, **kwargs):
     logger = logging.getLogger('essarch')
     logger.debug('{} signal task_revoked'.format(request.id))
+
+
+@task_postrun.connect
+def task_postrun_handler(**kwargs):
+    # make sure all events of the task are written before the next task starts
+    flush_buffered_handlers()
+
+
+@worker_process_shutdown.connect
+def worker_process_shutdown_handler(**kwargs):
+    flush_buffered_handlers()
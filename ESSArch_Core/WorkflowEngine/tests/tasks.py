@@ -73,3 +73,8 @@ def WithEvent(self, bar, foo=None):
     self.create_success_event(msg)
 
     return foo
+
+
+@app.task(bind=True)
+def GetExtraData(self, key):
+    return self.extra_data.get(key)
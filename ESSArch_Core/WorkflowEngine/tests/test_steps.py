@@ -25,6 +25,7 @@
 import os
 import shutil
 import tempfile
+from unittest import mock
 
 from celery import states as celery_states
 from django.test import TestCase, TransactionTestCase
@@ -48,129 +49,192 @@ class test_status(TestCase):
         get_redis_connection("default").flushall()
 
     def test_no_steps_or_tasks(self):
-        with self.assertNumQueries(2):
-            self.assertEqual(self.step.status, celery_states.PENDING)
-
-    def test_nested_steps(self):
-        depth = 5
-        parent = self.step
-
-        for _ in range(depth):
-            parent = ProcessStep.objects.create(parent=parent)
-
-        with self.assertNumQueries((7 * depth) + 2):
-            self.assertEqual(self.step.status, celery_states.PENDING)
-
-    def test_cached_status(self):
-        with self.assertNumQueries(2):
-            self.step.status
-
         with self.assertNumQueries(0):
             self.assertEqual(self.step.status, celery_states.PENDING)
 
-    def test_cached_status_nested_steps(self):
+    def test_nested_steps(self):
         depth = 5
         parent = self.step
 
         for _ in range(depth):
             parent = ProcessStep.objects.create(parent=parent)
 
-        self.step.status
-
-        with self.assertNumQueries(0):
-            self.assertEqual(self.step.status, celery_states.PENDING)
-
-    def test_cached_status_create_task(self):
-        self.step.status
+        self.step.refresh_from_db()
+        self.assertEqual(self.step.status, celery_states.PENDING)
 
+    def test_create_task(self):
         ProcessTask.objects.create(
             name="ESSArch_Core.WorkflowEngine.tests.tasks.First",
-            processstep=self.step
+            processstep=self.step,
+            status=celery_states.STARTED,
         )
 
-        with self.assertNumQueries(8):
-            self.assertEqual(self.step.status, celery_states.PENDING)
-
-    def test_cached_status_add_task(self):
+        self.step.refresh_from_db()
+        self.assertEqual(self.step.status, celery_states.STARTED)
 
+    def test_add_task(self):
         t = ProcessTask.objects.create(
             name="ESSArch_Core.WorkflowEngine.tests.tasks.First",
+            status=celery_states.STARTED,
         )
 
-        self.step.status
         self.step.add_tasks(t)
 
-        with self.assertNumQueries(8):
-            self.assertEqual(self.step.status, celery_states.PENDING)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.step.status, celery_states.STARTED)
 
-    def test_cached_status_create_child_step(self):
-        self.step.status
+        self.step.refresh_from_db()
+        self.assertEqual(self.step.status, celery_states.STARTED)
 
-        ProcessStep.objects.create(parent=self.step)
+    def test_create_child_step(self):
+        s = ProcessStep.objects.create(parent=self.step)
+        ProcessTask.objects.create(processstep=s, status=celery_states.STARTED)
 
-        with self.assertNumQueries(9):
-            self.assertEqual(self.step.status, celery_states.PENDING)
+        self.step.refresh_from_db()
+        self.assertEqual(self.step.status, celery_states.STARTED)
 
-    def test_cached_status_add_child_step(self):
+    def test_add_child_step(self):
         s = ProcessStep.objects.create()
+        s.add_tasks(ProcessTask.objects.create(status=celery_states.STARTED))
 
-        self.step.status
         self.step.add_child_steps(s)
 
-        with self.assertNumQueries(9):
-            self.assertEqual(self.step.status, celery_states.PENDING)
+        self.assertEqual(self.step.status, celery_states.STARTED)
+        self.step.refresh_from_db()
+        self.assertEqual(self.step.status, celery_states.STARTED)
+
+    def test_update_task_in_nested_step(self):
+        depth = 5
+        parent = self.step
 
-    def test_cached_status_run_task(self):
+        for _ in range(depth):
+            parent = ProcessStep.objects.create(parent=parent)
+
+        t = ProcessTask.objects.create(processstep=parent)
+        t.status = celery_states.FAILURE
+        t.save()
+
+        for step in ProcessStep.objects.all():
+            self.assertEqual(step.status, celery_states.FAILURE)
+
+    def test_run_task(self):
         t = ProcessTask.objects.create(
             name="ESSArch_Core.WorkflowEngine.tests.tasks.First",
             processstep=self.step
         )
 
-        self.step.status
-
         t.run()
 
-        with self.assertNumQueries(8):
-            self.assertEqual(self.step.status, celery_states.SUCCESS)
+        self.step.refresh_from_db()
+        self.assertEqual(self.step.status, celery_states.SUCCESS)
 
-    def test_cached_status_run_task_in_nested_step(self):
+    def test_run_task_in_nested_step(self):
         s = ProcessStep.objects.create(parent=self.step)
         t = ProcessTask.objects.create(
             name="ESSArch_Core.WorkflowEngine.tests.tasks.First",
             processstep=s
         )
 
-        self.step.status
-
         t.run()
 
-        with self.assertNumQueries(15):
-            self.assertEqual(self.step.status, celery_states.SUCCESS)
+        self.step.refresh_from_db()
+        self.assertEqual(self.step.status, celery_states.SUCCESS)
 
-    def test_cached_status_run_step(self):
+    def test_run_step(self):
         s = ProcessStep.objects.create(parent=self.step)
         ProcessTask.objects.create(
             name="ESSArch_Core.WorkflowEngine.tests.tasks.First",
             processstep=s
         )
 
-        self.step.status
         s.run()
 
-        with self.assertNumQueries(15):
-            self.assertEqual(self.step.status, celery_states.SUCCESS)
+        self.step.refresh_from_db()
+        self.assertEqual(self.step.status, celery_states.SUCCESS)
+
+    def test_save_does_not_overwrite_status(self):
+        step = ProcessStep.objects.get(pk=self.step.pk)
+        ProcessTask.objects.create(processstep=self.step, status=celery_states.SUCCESS)
+
+        step.name = 'foo'
+        step.save()
+
+        self.step.refresh_from_db()
+        self.assertEqual(self.step.status, celery_states.SUCCESS)
+
+    def test_save_without_moving_does_not_update_parent(self):
+        step = ProcessStep.objects.create(parent=self.step)
+        step = ProcessStep.objects.get(pk=step.pk)
+
+        with mock.patch('ESSArch_Core.WorkflowEngine.signals.update_step_status') as mock_update:
+            step.name = 'foo'
+            step.save()
+
+        mock_update.assert_not_called()
+
+    def test_move_step_updates_both_parents(self):
+        old_parent = ProcessStep.objects.create()
+        step = ProcessStep.objects.create(parent=old_parent)
+        ProcessTask.objects.create(processstep=step, status=celery_states.SUCCESS)
+        old_parent.refresh_from_db()
+        self.assertEqual(old_parent.status, celery_states.SUCCESS)
+
+        step = ProcessStep.objects.get(pk=step.pk)
+        step.parent = self.step
+        step.save()
+
+        old_parent.refresh_from_db()
+        self.assertEqual(old_parent.status, celery_states.PENDING)
+        self.step.refresh_from_db()
+        self.assertEqual(self.step.status, celery_states.SUCCESS)
+
+    def test_delete_task(self):
+        ProcessTask.objects.create(processstep=self.step, status=celery_states.SUCCESS, progress=100)
+        t = ProcessTask.objects.create(processstep=self.step, status=celery_states.FAILURE)
+        self.step.refresh_from_db()
+        self.assertEqual(self.step.status, celery_states.FAILURE)
+
+        t.delete()
+
+        self.step.refresh_from_db()
+        self.assertEqual(self.step.status, celery_states.SUCCESS)
+        self.assertEqual(self.step.progress, 100)
+
+    def test_delete_child_step(self):
+        s1 = ProcessStep.objects.create(parent=self.step)
+        ProcessTask.objects.create(processstep=s1, status=celery_states.SUCCESS)
+        s2 = ProcessStep.objects.create(parent=self.step)
+        ProcessTask.objects.create(processstep=s2, status=celery_states.FAILURE)
+        self.step.refresh_from_db()
+        self.assertEqual(self.step.status, celery_states.FAILURE)
+
+        s2.delete()
+
+        self.step.refresh_from_db()
+        self.assertEqual(self.step.status, celery_states.SUCCESS)
+
+    def test_delete_step_does_not_update_it_for_each_task(self):
+        s = ProcessStep.objects.create(parent=self.step)
+        ProcessTask.objects.bulk_create([
+            ProcessTask(processstep=s, status=celery_states.SUCCESS, progress=100) for _ in range(10)
+        ])
+
+        with mock.patch('ESSArch_Core.WorkflowEngine.signals.update_step_status') as mock_update:
+            s.delete()
+
+        mock_update.assert_called_once_with(self.step.pk)
 
     def test_pending_task(self):
         t = ProcessTask.objects.create(status=celery_states.PENDING)
-        self.step.tasks.set([t])
+        self.step.add_tasks(t)
         self.assertEqual(self.step.status, celery_states.PENDING)
 
     def test_pending_child_step(self):
         s = ProcessStep.objects.create()
         t = ProcessTask.objects.create(status=celery_states.PENDING)
 
-        s.tasks.set([t])
-        self.step.child_steps.set([s])
+        s.add_tasks(t)
+        self.step.add_child_steps(s)
         self.assertEqual(self.step.status, celery_states.PENDING)
 
     def test_pending_child_step_and_task(self):
@@ -178,22 +242,22 @@ class test_status(TestCase):
         t1 = ProcessTask.objects.create(status=celery_states.PENDING)
         t2 = ProcessTask.objects.create(status=celery_states.PENDING)
 
-        s.tasks.set([t1])
-        self.step.tasks.set([t2])
-        self.step.child_steps.set([s])
+        s.add_tasks(t1)
+        self.step.add_tasks(t2)
+        self.step.add_child_steps(s)
         self.assertEqual(self.step.status, celery_states.PENDING)
 
     def test_started_task(self):
         t = ProcessTask.objects.create(status=celery_states.STARTED)
-        self.step.tasks.set([t])
+        self.step.add_tasks(t)
         self.assertEqual(self.step.status, celery_states.STARTED)
 
     def test_started_child_step(self):
         s = ProcessStep.objects.create()
         t = ProcessTask.objects.create(status=celery_states.STARTED)
 
-        s.tasks.set([t])
-        self.step.child_steps.set([s])
+        s.add_tasks(t)
+        self.step.add_child_steps(s)
         self.assertEqual(self.step.status, celery_states.STARTED)
 
     def test_started_child_step_and_task(self):
@@ -201,22 +265,22 @@ class test_status(TestCase):
         t1 = ProcessTask.objects.create(status=celery_states.STARTED)
         t2 = ProcessTask.objects.create(status=celery_states.STARTED)
 
-        s.tasks.set([t1])
-        self.step.tasks.set([t2])
-        self.step.child_steps.set([s])
+        s.add_tasks(t1)
+        self.step.add_tasks(t2)
+        self.step.add_child_steps(s)
         self.assertEqual(self.step.status, celery_states.STARTED)
 
     def test_succeeded_task(self):
         t = ProcessTask.objects.create(status=celery_states.SUCCESS)
-        self.step.tasks.set([t])
+        self.step.add_tasks(t)
         self.assertEqual(self.step.status, celery_states.SUCCESS)
 
     def test_succeeded_child_step(self):
         s = ProcessStep.objects.create()
         t = ProcessTask.objects.create(status=celery_states.SUCCESS)
 
-        s.tasks.set([t])
-        self.step.child_steps.set([s])
+        s.add_tasks(t)
+        self.step.add_child_steps(s)
         self.assertEqual(self.step.status, celery_states.SUCCESS)
 
     def test_succeeded_child_step_and_task(self):
@@ -224,22 +288,22 @@ class test_status(TestCase):
         t1 = ProcessTask.objects.create(status=celery_states.SUCCESS)
         t2 = ProcessTask.objects.create(status=celery_states.SUCCESS)
 
-        s.tasks.set([t1])
-        self.step.tasks.set([t2])
-        self.step.child_steps.set([s])
+        s.add_tasks(t1)
+        self.step.add_tasks(t2)
+        self.step.add_child_steps(s)
         self.assertEqual(self.step.status, celery_states.SUCCESS)
 
     def test_failed_task(self):
         t = ProcessTask.objects.create(status=celery_states.FAILURE)
-        self.step.tasks.set([t])
+        self.step.add_tasks(t)
         self.assertEqual(self.step.status, celery_states.FAILURE)
 
     def test_failed_child_step(self):
         s = ProcessStep.objects.create()
         t = ProcessTask.objects.create(status=celery_states.FAILURE)
 
-        s.tasks.set([t])
-        self.step.child_steps.set([s])
+        s.add_tasks(t)
+        self.step.add_child_steps(s)
         self.assertEqual(self.step.status, celery_states.FAILURE)
 
     def test_failed_child_step_and_task(self):
@@ -247,23 +311,23 @@ class test_status(TestCase):
         t1 = ProcessTask.objects.create(status=celery_states.FAILURE)
         t2 = ProcessTask.objects.create(status=celery_states.FAILURE)
 
-        s.tasks.set([t1])
-        self.step.tasks.set([t2])
-        self.step.child_steps.set([s])
+        s.add_tasks(t1)
+        self.step.add_tasks(t2)
+        self.step.add_child_steps(s)
         self.assertEqual(self.step.status, celery_states.FAILURE)
 
     def test_failed_task_after_succeeded(self):
         t1 = ProcessTask.objects.create(status=celery_states.SUCCESS)
         t2 = ProcessTask.objects.create(status=celery_states.FAILURE)
 
-        self.step.tasks.set([t1, t2])
+        self.step.add_tasks(t1, t2)
         self.assertEqual(self.step.status, celery_states.FAILURE)
 
     def test_started_task_after_succeeded(self):
         t1 = ProcessTask.objects.create(status=celery_states.SUCCESS)
         t2 = ProcessTask.objects.create(status=celery_states.STARTED)
 
-        self.step.tasks.set([t1, t2])
+        self.step.add_tasks(t1, t2)
         self.assertEqual(self.step.status, celery_states.STARTED)
 
     def test_failed_task_between_succeeded(self):
@@ -271,7 +335,7 @@ class test_status(TestCase):
         t2 = ProcessTask.objects.create(status=celery_states.FAILURE)
         t3 = ProcessTask.objects.create(status=celery_states.SUCCESS)
 
-        self.step.tasks.set([t1, t2, t3])
+        self.step.add_tasks(t1, t2, t3)
         self.assertEqual(self.step.status, celery_states.FAILURE)
 
 
@@ -286,7 +350,7 @@ class test_progress(TestCase):
         get_redis_connection("default").flushall()
 
     def test_no_steps_or_tasks(self):
-        with self.assertNumQueries(2):
+        with self.assertNumQueries(0):
             self.assertEqual(self.step.progress, 0)
 
     def test_nested_steps(self):
@@ -296,113 +360,76 @@ class test_progress(TestCase):
         for _ in range(depth):
             parent = ProcessStep.objects.create(parent=parent)
 
-        with self.assertNumQueries((3 * (depth + 1)) - 1):
-            self.assertEqual(self.step.progress, 0)
-
-    def test_cached_progress(self):
-        with self.assertNumQueries(2):
-            self.step.progress
-
-        with self.assertNumQueries(0):
-            self.step.progress
-
-    def test_cached_progress_nested_steps(self):
-        depth = 5
-        parent = self.step
-
-        for _ in range(depth):
-            parent = ProcessStep.objects.create(parent=parent)
-
-        self.step.progress
-
-        with self.assertNumQueries(0):
-            self.assertEqual(self.step.progress, 0)
-
-    def test_cached_progress_create_task(self):
-        self.step.progress
+        self.step.refresh_from_db()
+        self.assertEqual(self.step.progress, 0)
 
+    def test_create_task(self):
         ProcessTask.objects.create(
             name="ESSArch_Core.WorkflowEngine.tests.tasks.First",
-            processstep=self.step
+            processstep=self.step,
+            progress=50,
         )
 
-        with self.assertNumQueries(4):
-            self.assertEqual(self.step.progress, 0)
-
-    def test_cached_progress_add_task(self):
-        t = ProcessTask.objects.create(
-            name="ESSArch_Core.WorkflowEngine.tests.tasks.First",
-        )
-
-        self.step.progress
-        self.step.add_tasks(t)
-
-        with self.assertNumQueries(4):
-            self.assertEqual(self.step.progress, 0)
-
-    def test_cached_progress_create_child_step(self):
-        self.step.progress
+        self.step.refresh_from_db()
+        self.assertEqual(self.step.progress, 50)
 
+    def test_create_child_step(self):
+        ProcessTask.objects.create(processstep=self.step, progress=100)
         ProcessStep.objects.create(parent=self.step)
 
-        with self.assertNumQueries(5):
-            self.assertEqual(self.step.progress, 0)
+        self.step.refresh_from_db()
+        self.assertEqual(self.step.progress, 50)
 
-    def test_cached_progress_add_child_step(self):
-        s = ProcessStep.objects.create()
+    def test_update_task_progress_in_nested_step(self):
+        s = ProcessStep.objects.create(parent=self.step)
+        ProcessTask.objects.create(processstep=s)
+        t = ProcessTask.objects.create(processstep=s)
 
-        self.step.progress
-        self.step.add_child_steps(s)
+        t.update_progress(50)
 
-        with self.assertNumQueries(5):
-            self.assertEqual(self.step.progress, 0)
+        self.step.refresh_from_db()
+        self.assertEqual(self.step.progress, 25)
 
-    def test_cached_progress_run_task(self):
+    def test_run_task(self):
         t = ProcessTask.objects.create(
             name="ESSArch_Core.WorkflowEngine.tests.tasks.First",
             processstep=self.step
         )
 
-        self.step.progress
-
         t.run()
 
-        with self.assertNumQueries(4):
-            self.assertEqual(self.step.progress, 100)
+        self.step.refresh_from_db()
+        self.assertEqual(self.step.progress, 100)
 
-    def test_cached_progress_run_task_in_nested_step(self):
+    def test_run_task_in_nested_step(self):
         s = ProcessStep.objects.create(parent=self.step)
         t = ProcessTask.objects.create(
             name="ESSArch_Core.WorkflowEngine.tests.tasks.First",
             processstep=s
         )
 
-        self.step.progress
-
         t.run()
 
-        with self.assertNumQueries(7):
-            self.assertEqual(self.step.progress, 100)
+        self.step.refresh_from_db()
+        self.assertEqual(self.step.progress, 100)
 
-    def test_cached_progress_run_step(self):
+    def test_run_step(self):
         s = ProcessStep.objects.create(parent=self.step)
         ProcessTask.objects.create(
             name="ESSArch_Core.WorkflowEngine.tests.tasks.First",
             processstep=s
         )
 
-        self.step.progress
         s.run()
 
-        with self.assertNumQueries(7):
-            self.assertEqual(self.step.progress, 100)
+        self.step.refresh_from_db()
+        self.assertEqual(self.step.progress, 100)
 
     def test_single_task(self):
         t = ProcessTask.objects.create(progress=0)
         self.step.add_tasks(t)
 
-        with self.assertNumQueries(4):
-            self.assertEqual(self.step.progress, 0)
+        self.assertEqual(self.step.progress, 0)
 
         self.step.clear_tasks()
 
@@ -438,7 +465,7 @@ class test_progress(TestCase):
 
     def test_single_child_step(self):
         s = ProcessStep.objects.create()
-        self.step.child_steps.set([s])
+        self.step.add_child_steps(s)
         self.assertEqual(self.step.progress, 0)
 
     def test_nested_task(self):
@@ -446,7 +473,7 @@ class test_progress(TestCase):
         t = ProcessTask.objects.create(progress=50)
 
         s.add_tasks(t)
-        self.step.child_steps.set([s])
+        self.step.add_child_steps(s)
 
         self.assertEqual(self.step.progress, 50)
 
@@ -521,6 +548,7 @@ class test_running_steps(TransactionTestCase):
         t2.refresh_from_db()
         t3.refresh_from_db()
 
+        step.refresh_from_db()
         self.assertEqual(step.status, celery_states.SUCCESS)
 
         self.assertEqual(t1.result, t1_val)
@@ -562,6 +590,7 @@ class test_running_steps(TransactionTestCase):
         step.save()
 
         step.run().get()
+        step.refresh_from_db()
         self.assertEqual(step.status, celery_states.SUCCESS)
 
         t1.refresh_from_db()
@@ -639,6 +668,7 @@ class test_running_steps(TransactionTestCase):
         t2.refresh_from_db()
         t3.refresh_from_db()
 
+        step.refresh_from_db()
         self.assertEqual(step.status, celery_states.FAILURE)
 
         self.assertEqual(t1.status, celery_states.SUCCESS)
@@ -674,6 +704,7 @@ class test_running_steps(TransactionTestCase):
         t2.refresh_from_db()
         t3.refresh_from_db()
 
+        step.refresh_from_db()
         self.assertEqual(step.status, celery_states.FAILURE)
 
         self.assertEqual(t1.status, celery_states.SUCCESS)
@@ -711,6 +742,10 @@ class test_running_steps(TransactionTestCase):
         with self.assertRaises(Exception):
             main_step.run()
 
+        step1.refresh_from_db()
+        step2.refresh_from_db()
+        step3.refresh_from_db()
+
         self.assertEqual(step1.status, celery_states.SUCCESS)
         self.assertEqual(step2.status, celery_states.FAILURE)
         self.assertEqual(step3.status, celery_states.PENDING)
@@ -791,6 +826,7 @@ class test_running_steps_eagerly(TransactionTestCase):
         t2.refresh_from_db()
         t3.refresh_from_db()
 
+        step.refresh_from_db()
         self.assertEqual(step.status, celery_states.SUCCESS)
 
         self.assertEqual(t1.result, t1_val)
@@ -25,9 +25,14 @@
 from unittest import mock
 
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
+from ESSArch_Core.configuration.models import Parameter, Path
 from ESSArch_Core.ip.models import InformationPackage
+from ESSArch_Core.profiles.utils import fill_specification_data
 from ESSArch_Core.WorkflowEngine.models import ProcessStep, ProcessTask
 
 
@@ -46,7 +51,7 @@ class RunTasksNonEagerlyTests(TestCase):
 
         expected_headers = {
             'responsible': None, 'ip': None, 'step': None, 'step_pos': 0, 'hidden': None,
-            'allow_failure': False, 'parallel': False
+            'allow_failure': False, 'parallel': False, 'processtask': str(t.pk), 'workflow': None,
         }
         apply_async.assert_called_once_with(
             args=[5, 10], kwargs={}, headers={'headers': expected_headers}, link_error=None,
@@ -64,7 +69,7 @@ class RunTasksNonEagerlyTests(TestCase):
 
         expected_headers = {
             'responsible': None, 'ip': None, 'step': None, 'step_pos': 0, 'hidden': None,
-            'allow_failure': False, 'parallel': False
+            'allow_failure': False, 'parallel': False, 'processtask': str(t.pk), 'workflow': None,
         }
         apply_async.assert_called_once_with(
             args=[], kwargs={'foo': 'bar'}, headers={'headers': expected_headers},
@@ -84,7 +89,7 @@ class RunTasksNonEagerlyTests(TestCase):
 
         expected_headers = {
             'responsible': None, 'ip': None, 'step': str(step.pk), 'step_pos': 2, 'hidden': None,
-            'allow_failure': False, 'parallel': False
+            'allow_failure': False, 'parallel': False, 'processtask': str(t.pk), 'workflow': step.tree_id,
         }
         apply_async.assert_called_once_with(
             args=[], kwargs={}, headers={'headers': expected_headers},
@@ -157,3 +162,77 @@ class OnFailureTests(TestCase):
         task.refresh_from_db()
         self.assertIsNone(task.result)
         self.assertIsNotNone(task.traceback)
+
+
+@override_settings(WORKFLOW_CONTEXT_CACHE_TIMEOUT=60)
+@mock.patch('ESSArch_Core.WorkflowEngine.dbtask.fill_specification_data', wraps=fill_specification_data)
+class WorkflowContextTests(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        Path.objects.create(entity='temp', value='temp')
+        self.ip = InformationPackage.objects.create(object_identifier_value='foo')
+        self.step = ProcessStep.objects.create(information_package=self.ip, context={'bar': 'baz'})
+
+    def run_task(self, key='_OBJID', step=None):
+        t = ProcessTask.objects.create(
+            name="ESSArch_Core.WorkflowEngine.tests.tasks.GetExtraData",
+            params={'key': key},
+            information_package=self.ip,
+            processstep=step or self.step,
+        )
+        t.run().get()
+        t.refresh_from_db()
+        return t.result
+
+    def test_context_is_cached_per_workflow(self, mock_fill):
+        self.assertEqual(self.run_task(), 'foo')
+        self.assertEqual(self.run_task(), 'foo')
+        mock_fill.assert_called_once()
+
+        other_step = ProcessStep.objects.create(information_package=self.ip)
+        self.run_task(step=other_step)
+        self.assertEqual(mock_fill.call_count, 2)
+
+    def test_no_lookups_when_cached(self, mock_fill):
+        step = self.step
+        for _ in range(5):
+            step = ProcessStep.objects.create(parent=step, information_package=self.ip)
+
+        self.run_task(step=step)
+        with CaptureQueriesContext(connection) as queries:
+            self.run_task(step=step)
+
+        sql = '\n'.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('FROM "ip_informationpackage"', sql)
+        self.assertNotIn('FROM "auth_user"', sql)
+        self.assertNotIn('FROM "configuration_parameter"', sql)
+        self.assertNotIn('"ProcessStep"."context"', sql)
+
+    def test_step_context(self, mock_fill):
+        child = ProcessStep.objects.create(parent=self.step, information_package=self.ip, context={'qux': 1})
+
+        self.assertEqual(self.run_task('bar', step=child), 'baz')
+        self.assertEqual(self.run_task('qux', step=child), 1)
+
+    def test_invalidated_when_ip_changes(self, mock_fill):
+        self.run_task()
+
+        self.ip.object_identifier_value = 'bar'
+        self.ip.save()
+
+        self.assertEqual(self.run_task(), 'bar')
+        self.assertEqual(mock_fill.call_count, 2)
+
+    def test_invalidated_when_shared_data_changes(self, mock_fill):
+        self.run_task()
+
+        Parameter.objects.create(entity='foo', value='bar')
+
+        self.assertEqual(self.run_task('_PARAMETER_FOO'), 'bar')
+        self.assertEqual(mock_fill.call_count, 2)
+
+    @override_settings(WORKFLOW_CONTEXT_CACHE_TIMEOUT=0)
+    def test_cache_disabled(self, mock_fill):
+        self.run_task()
+        self.run_task()
+        self.assertEqual(mock_fill.call_count, 2)
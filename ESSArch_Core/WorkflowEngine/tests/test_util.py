@@ -1,6 +1,15 @@
+from unittest import mock
+
+from celery import states as celery_states
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
-from ESSArch_Core.WorkflowEngine.models import ProcessStep, ProcessTask
+from ESSArch_Core.WorkflowEngine.models import (
+    ProcessStep,
+    ProcessTask,
+    update_step_status,
+)
 from ESSArch_Core.WorkflowEngine.util import create_workflow
 
 
@@ -203,6 +212,31 @@ class CreateWorkflowTestCase(TestCase):
         self.assertEqual(task.on_error.count(), 1)
         self.assertEqual(task.on_error.get().name, spec[0]['on_error'][0]['name'])
 
+    def test_root_on_error_task_status(self):
+        spec = [
+            {
+                "name": "ESSArch_Core.WorkflowEngine.tests.tasks.First",
+                "label": "Foo Bar Task",
+            },
+        ]
+        on_error = [
+            {
+                "name": "ESSArch_Core.WorkflowEngine.tests.tasks.Second",
+                "label": "Foo Bar Task2",
+            },
+        ]
+
+        update_status = ProcessStep.update_status
+        with mock.patch.object(ProcessStep, 'update_status', autospec=True, side_effect=update_status) as update:
+            root_step = create_workflow(spec, on_error=on_error)
+        update.assert_called_once_with(root_step)
+        stored = ProcessStep.objects.values_list('status', 'progress').get(pk=root_step.pk)
+
+        self.assertEqual(root_step.tasks.filter(status=celery_states.SUCCESS).count(), 1)
+        self.assertEqual(stored, update_step_status(root_step.pk))
+        self.assertEqual(stored, (root_step.status, root_step.progress))
+        self.assertGreater(root_step.progress, 0)
+
     def test_on_error_step(self):
         spec = [
             {
@@ -242,3 +276,85 @@ class CreateWorkflowTestCase(TestCase):
         self.assertEqual(child_step.tasks.count(), 2)
         self.assertEqual(child_step.on_error.count(), 1)
         self.assertEqual(child_step.on_error.get().name, spec[0]['on_error'][0]['name'])
+
+    def test_tree_fields(self):
+        spec = [
+            {
+                "step": True,
+                "name": "step_a",
+                "children": [
+                    {
+                        "step": True,
+                        "name": "step_aa",
+                        "children": [
+                            {"name": "ESSArch_Core.WorkflowEngine.tests.tasks.First"},
+                        ]
+                    },
+                    {"name": "ESSArch_Core.WorkflowEngine.tests.tasks.First"},
+                ]
+            },
+            {
+                "step": True,
+                "name": "step_b",
+                "children": [
+                    {"name": "ESSArch_Core.WorkflowEngine.tests.tasks.First"},
+                ]
+            },
+        ]
+
+        root_step = create_workflow(spec)
+        other_root_step = create_workflow(spec)
+        self.assertNotEqual(root_step.tree_id, other_root_step.tree_id)
+
+        sub_root_step = create_workflow(spec, top_root_step=root_step)
+        self.assertEqual(sub_root_step.parent, root_step)
+        self.assertEqual(sub_root_step.parent_pos, 3)
+
+        for step in ProcessStep.objects.all():
+            self.assertEqual(
+                set(step.get_descendants().values_list('pk', flat=True)),
+                self.get_descendant_ids(step),
+            )
+            if step.parent is not None:
+                self.assertEqual(step.level, step.parent.level + 1)
+                self.assertEqual(step.tree_id, step.parent.tree_id)
+
+        root_step.refresh_from_db()
+        self.assertEqual(root_step.get_descendant_count(), 7)
+        self.assertEqual(
+            list(root_step.get_children().values_list('name', flat=True)),
+            ['step_a', 'step_b', ''],
+        )
+
+    def get_descendant_ids(self, step):
+        ids = set()
+        for child in ProcessStep.objects.filter(parent=step):
+            ids.add(child.pk)
+            ids |= self.get_descendant_ids(child)
+        return ids
+
+    def test_number_of_queries_is_independent_of_size(self):
+        def spec(size):
+            return [
+                {
+                    "step": True,
+                    "name": "step_{}".format(i),
+                    "on_error": [{"name": "ESSArch_Core.WorkflowEngine.tests.tasks.Second", "label": "On-error"}],
+                    "children": [
+                        {
+                            "name": "ESSArch_Core.WorkflowEngine.tests.tasks.First",
+                            "on_error": [{"name": "ESSArch_Core.WorkflowEngine.tests.tasks.Second", "label": "Err"}],
+                        },
+                    ]
+                } for i in range(size)
+            ]
+
+        create_workflow(spec(1))
+        with CaptureQueriesContext(connection) as queries:
+            create_workflow(spec(2))
+
+        with self.assertNumQueries(len(queries)):
+            create_workflow(spec(10))
+
+        self.assertEqual(ProcessStep.objects.filter(on_error__isnull=False).count(), 13)
+        self.assertEqual(ProcessTask.objects.filter(on_error__isnull=False).count(), 13)
@@ -1,9 +1,11 @@
 import importlib
 import logging
+from collections import defaultdict
 
 from celery import states as celery_states
 from django.core.cache import cache
 from django.db import OperationalError, transaction
+from django.db.models import F, Max
 from tenacity import (
     RetryError,
     Retrying,
@@ -15,7 +17,35 @@ from tenacity import (
     wait_random_exponential,
 )
 
-from ESSArch_Core.WorkflowEngine.models import ProcessStep, ProcessTask
+from ESSArch_Core.util import get_cache_version, invalidate_cache_version
+from ESSArch_Core.WorkflowEngine.models import (
+    ProcessStep,
+    ProcessTask,
+    calculate_step_state,
+)
+
+WORKFLOW_CONTEXT_VERSION_KEY = 'workflow_context_version'
+
+
+def _get_workflow_context_version_key(ip_id=None):
+    if ip_id is None:
+        return WORKFLOW_CONTEXT_VERSION_KEY
+
+    return '{}_{}'.format(WORKFLOW_CONTEXT_VERSION_KEY, ip_id)
+
+
+def get_workflow_context_version(ip_id=None):
+    """
+    Returns the current version of the data shared by all workflows, or of
+    the data of a single information package. Workflow contexts are cached
+    using these versions until invalidate_workflow_context is called.
+    """
+
+    return get_cache_version(_get_workflow_context_version_key(ip_id))
+
+
+def invalidate_workflow_context(ip_id=None):
+    invalidate_cache_version(_get_workflow_context_version_key(ip_id))
 
 
 @retry(retry=retry_if_exception_type(ValueError), reraise=True,
@@ -64,77 +94,170 @@ def _create_on_error_tasks(parent, errors, ip=None, responsible=None, eager=Fals
         )
 
 
-def _create_step(parent, flow, ip, responsible, context=None):
-    if context is None:
-        context = {}
-    for e_idx, flow_entry in enumerate(flow):
-        if not flow_entry.get('if', True):
-            continue
-
-        if flow_entry.get('step', False):
-            if flow_entry.get('from') is not None:
-                method = getattr(ip, flow_entry.get('from'))
-                children = method()
-            elif len(flow_entry.get('children', [])) > 0:
-                children = flow_entry.get('children', [])
-            else:
-                # no child steps or tasks in step, no need to create step
+class _WorkflowTree:
+    """
+    Steps and tasks of a workflow built in memory, to be saved with a few
+    bulk queries
+    """
+
+    def __init__(self, root, ip, responsible):
+        self.root = root
+        self.ip = ip
+        self.responsible = responsible
+        self.child_steps = defaultdict(list)
+        self.tasks = defaultdict(list)
+        self.step_on_error = []
+        self.task_on_error = []
+
+    def add_on_error_tasks(self, step, errors, owner=None, **kwargs):
+        on_error_tasks = list(_create_on_error_tasks(
+            step, errors, ip=self.ip, responsible=self.responsible, **kwargs
+        ))
+        self.tasks[step].extend(on_error_tasks)
+        if owner is None:
+            self.step_on_error.extend((step, task) for task in on_error_tasks)
+        else:
+            self.task_on_error.extend((owner, task) for task in on_error_tasks)
+
+    def add_flow(self, parent, flow, context=None):
+        if context is None:
+            context = {}
+        for e_idx, flow_entry in enumerate(flow):
+            if not flow_entry.get('if', True):
                 continue
 
-            child_s = ProcessStep.objects.create(
-                name=flow_entry['name'],
-                parallel=flow_entry.get('parallel', False),
-                parent=parent,
-                parent_pos=e_idx,
-                eager=parent.eager,
-                information_package=ip,
-                context=context,
-                responsible=responsible,
-                queue=flow_entry.get('queue') or parent.queue,
-            )
-
-            on_error_tasks = list(_create_on_error_tasks(
-                child_s, flow_entry.get('on_error', []), ip=ip, responsible=responsible,
-                eager=parent.eager
-            ))
-            ProcessTask.objects.bulk_create(on_error_tasks)
-            child_s.on_error.add(*on_error_tasks)
-
-            _create_step(child_s, children, ip, responsible, context=context)
-        else:
-            name = flow_entry['name']
-
-            [module, klass] = name.rsplit('.', 1)
-            if not hasattr(importlib.import_module(module), klass):
-                raise ValueError('Unknown task "{}"'.format(name))
-
-            args = flow_entry.get('args', [])
-            params = flow_entry.get('params', {})
-            result_params = flow_entry.get('result_params', {})
-            task = ProcessTask.objects.create(
-                name=name,
-                queue=flow_entry.get('queue') or parent.queue,
-                reference=flow_entry.get('reference', None),
-                label=flow_entry.get('label'),
-                args=args,
-                params=params,
-                result_params=result_params,
-                eager=parent.eager,
-                allow_failure=flow_entry.get('allow_failure', False),
-                information_package=ip,
-                responsible=responsible,
-                processstep=parent,
-                processstep_pos=e_idx,
-                hidden=flow_entry.get('hidden', False),
-                run_if=flow_entry.get('run_if', ''),
-                log=flow_entry.get('log'),
-            )
-
-            on_error_tasks = list(
-                _create_on_error_tasks(parent, flow_entry.get('on_error', []), ip=ip, responsible=responsible)
-            )
-            ProcessTask.objects.bulk_create(on_error_tasks)
-            task.on_error.add(*on_error_tasks)
+            if flow_entry.get('step', False):
+                if flow_entry.get('from') is not None:
+                    method = getattr(self.ip, flow_entry.get('from'))
+                    children = method()
+                elif len(flow_entry.get('children', [])) > 0:
+                    children = flow_entry.get('children', [])
+                else:
+                    # no child steps or tasks in step, no need to create step
+                    continue
+
+                child_s = ProcessStep(
+                    name=flow_entry['name'],
+                    parallel=flow_entry.get('parallel', False),
+                    parent=parent,
+                    parent_pos=e_idx,
+                    eager=parent.eager,
+                    information_package=self.ip,
+                    context=context,
+                    responsible=self.responsible,
+                    queue=flow_entry.get('queue') or parent.queue,
+                )
+                self.child_steps[parent].append(child_s)
+
+                self.add_on_error_tasks(child_s, flow_entry.get('on_error', []), eager=parent.eager)
+                self.add_flow(child_s, children, context=context)
+            else:
+                name = flow_entry['name']
+
+                [module, klass] = name.rsplit('.', 1)
+                if not hasattr(importlib.import_module(module), klass):
+                    raise ValueError('Unknown task "{}"'.format(name))
+
+                args = flow_entry.get('args', [])
+                params = flow_entry.get('params', {})
+                result_params = flow_entry.get('result_params', {})
+                task = ProcessTask(
+                    name=name,
+                    queue=flow_entry.get('queue') or parent.queue,
+                    reference=flow_entry.get('reference', None),
+                    label=flow_entry.get('label'),
+                    args=args,
+                    params=params,
+                    result_params=result_params,
+                    eager=parent.eager,
+                    allow_failure=flow_entry.get('allow_failure', False),
+                    information_package=self.ip,
+                    responsible=self.responsible,
+                    processstep=parent,
+                    processstep_pos=e_idx,
+                    hidden=flow_entry.get('hidden', False),
+                    run_if=flow_entry.get('run_if', ''),
+                    log=flow_entry.get('log'),
+                )
+                self.tasks[parent].append(task)
+
+                self.add_on_error_tasks(parent, flow_entry.get('on_error', []), owner=task)
+
+    def prune(self, step=None):
+        """
+        Removes steps without any tasks in any of their descendants, returns
+        False if the step itself is empty
+        """
+
+        if step is None:
+            step = self.root
+
+        self.child_steps[step] = [child for child in self.child_steps[step] if self.prune(child)]
+        return bool(self.tasks[step] or self.child_steps[step])
+
+    def set_tree_fields(self, step, tree_id, left, level):
+        """
+        Sets the MPTT fields of the step and its descendants, returns the
+        right value of the step
+        """
+
+        step.tree_id = tree_id
+        step.lft = left
+        step.level = level
+
+        right = left + 1
+        for child in self.child_steps[step]:
+            right = self.set_tree_fields(child, tree_id, right, level + 1) + 1
+
+        step.rght = right
+        return right
+
+    def set_states(self, step=None):
+        """
+        Sets the status and progress of the step and its descendants
+        """
+
+        if step is None:
+            step = self.root
+
+        task_states = {}
+        for task in self.tasks[step]:
+            count, progress = task_states.get(task.status, (0, 0))
+            task_states[task.status] = (count + 1, progress + task.progress)
+
+        child_states = []
+        for child in self.child_steps[step]:
+            self.set_states(child)
+            child_states.append((child.status, child.progress))
+
+        step.status, step.progress = calculate_step_state(task_states, child_states)
+
+    def get_steps(self, step=None):
+        if step is None:
+            step = self.root
+
+        yield step
+        for child in self.child_steps[step]:
+            yield from self.get_steps(child)
+
+    def save(self):
+        self.set_states()
+        steps = list(self.get_steps())
+        tasks = [task for step in steps for task in self.tasks[step]]
+        for task in tasks:
+            if not task.label:
+                task.label = task.name
+
+        ProcessStep.objects.bulk_create(steps)
+        ProcessTask.objects.bulk_create(tasks)
+        ProcessStep.on_error.through.objects.bulk_create([
+            ProcessStep.on_error.through(processstep=step, processtask=task)
+            for step, task in self.step_on_error
+        ])
+        ProcessTask.on_error.through.objects.bulk_create([
+            ProcessTask.on_error.through(from_processtask=owner, to_processtask=task)
+            for owner, task in self.task_on_error
+        ])
 
 
 def _add_steps(parent, steps):
@@ -167,74 +290,78 @@ def create_workflow(workflow_spec=None, ip=None, workflow_steps=None, name='', l
     if queue is None:
         queue = context.get('WORKFLOW_QUEUE', 'celery')
 
-    with cache.lock('create_workflow_lock', timeout=300):
-        try:
-            for attempt in Retrying(stop=stop_after_delay(30),
-                                    wait=wait_random_exponential(multiplier=1, max=60),
-                                    before_sleep=before_sleep_log(logging.getLogger('essarch'), logging.WARNING),
-                                    retry_error_callback=lambda retry_state: logger.error(
-                                        f"Failed to create workflow for IP {ip} "
-                                        f"after retries: {retry_state.outcome.exception()}"), reraise=True):
-                with attempt:
-                    try:
-                        with transaction.atomic():
-                            # with ProcessStep.objects.delay_mptt_updates():
-                            # Create root step
-                            if top_root_step:
-                                root_step = ProcessStep(
-                                    name=name, eager=eager, information_package=ip, context=context,
-                                    responsible=responsible, label=label, part_root=part_root,
-                                    run_state=run_state, queue=queue)
-                                root_step.parent = top_root_step
-                                root_step.parent_pos = top_root_step.child_steps.count() + 1
-                                root_step.save()
-                            else:
-                                root_step = ProcessStep.objects.create(
-                                    name=name, eager=eager, information_package=ip, context=context,
-                                    responsible=responsible, label=label, part_root=part_root,
-                                    run_state=run_state, queue=queue)
-
-                            # Create on_error tasks
-                            on_error_tasks = list(_create_on_error_tasks(
-                                root_step, on_error, ip=ip, responsible=responsible, status=celery_states.SUCCESS))
-                            ProcessTask.objects.bulk_create(on_error_tasks)
-                            root_step.on_error.add(*on_error_tasks)
-
-                            # Add workflow_spec steps
-                            if workflow_spec:
-                                _create_step(root_step, workflow_spec, ip, responsible)
-
-                            # Add workflow_steps
-                            if workflow_steps:
-                                _add_steps(root_step, workflow_steps)
-
-                            # root_step.refresh_from_db()
-                            # with ProcessStep.objects.delay_mptt_updates():
-
-                            # Clean up empty steps (no tasks & no children)
-                            # remove steps without any tasks in any of its descendants
-                            empty_steps = root_step.get_descendants(include_self=True).filter(tasks=None).exists()
-                            while empty_steps:
-                                root_step.get_descendants(include_self=True).filter(
-                                    child_steps__isnull=True,
-                                    tasks=None,
-                                ).delete()
-                                empty_steps = root_step.get_descendants(
-                                    include_self=True
-                                ).filter(tasks=None, child_steps__isnull=True).exists()
-                    # except RuntimeError as e:
-                    #    logger.warning('Exception in create_workflow for ip: {}, error: {} - retry'.format(ip, e))
-                    #    raise
-                    except OperationalError as e:
-                        # This is a transient DB error; trigger retry
-                        logger.warning(f"OperationalError creating workflow for IP {ip}: {e} - retrying")
-                        raise
-        # except RetryError:
-        #     logger.warning('RetryError in create_workflow for ip: {}'.format(ip))
-        #     raise
-        except RetryError as e:
-            # Log and re-raise a simple exception that Celery can serialize
-            logger.error(f"RetryError in create_workflow for IP {ip}: {e}")
-            raise RuntimeError(f"Failed to create workflow for IP {ip} after retries") from None
+    root_step = ProcessStep(
+        name=name, eager=eager, information_package=ip, context=context,
+        responsible=responsible, label=label, part_root=part_root,
+        run_state=run_state, queue=queue, parent=top_root_step,
+    )
+
+    # Build the whole workflow before taking any locks
+    tree = _WorkflowTree(root_step, ip, responsible)
+    tree.add_on_error_tasks(root_step, on_error, status=celery_states.SUCCESS)
+    if workflow_spec:
+        tree.add_flow(root_step, workflow_spec)
+
+    # Remove steps without any tasks in any of their descendants
+    if not tree.prune() and not workflow_steps:
+        return root_step
+
+    # New trees are given the next free tree id and subtrees shift the nodes
+    # to the right of them, only writers of the same tree have to wait
+    if top_root_step is None:
+        lock_key = 'create_workflow_lock'
+    else:
+        lock_key = 'create_workflow_lock_{}'.format(top_root_step.tree_id)
+
+    try:
+        for attempt in Retrying(stop=stop_after_delay(30),
+                                wait=wait_random_exponential(multiplier=1, max=60),
+                                before_sleep=before_sleep_log(logging.getLogger('essarch'), logging.WARNING),
+                                retry_error_callback=lambda retry_state: logger.error(
+                                    f"Failed to create workflow for IP {ip} "
+                                    f"after retries: {retry_state.outcome.exception()}"), reraise=True):
+            with attempt:
+                try:
+                    with cache.lock(lock_key, timeout=300), transaction.atomic():
+                        if top_root_step is None:
+                            tree_id = (ProcessStep.objects.aggregate(Max('tree_id'))['tree_id__max'] or 0) + 1
+                            tree.set_tree_fields(root_step, tree_id, 1, 0)
+                        else:
+                            top_root_step.refresh_from_db(fields=['tree_id', 'lft', 'rght', 'level'])
+                            target = top_root_step.rght
+                            size = tree.set_tree_fields(
+                                root_step, top_root_step.tree_id, target, top_root_step.level + 1,
+                            ) - target + 1
+
+                            ProcessStep.objects.filter(
+                                tree_id=top_root_step.tree_id, lft__gt=target,
+                            ).update(lft=F('lft') + size)
+                            ProcessStep.objects.filter(
+                                tree_id=top_root_step.tree_id, rght__gte=target,
+                            ).update(rght=F('rght') + size)
+                            top_root_step.rght += size
+
+                            root_step.parent_pos = top_root_step.child_steps.count() + 1
+
+                        tree.save()
+
+                        # Add workflow_steps
+                        if workflow_steps:
+                            _add_steps(root_step, workflow_steps)
+
+                        # recalculate from the saved tasks, e.g. on_error
+                        # tasks created as successful, as when tasks change
+                        root_step.update_status()
+
+                        if top_root_step is not None:
+                            top_root_step.update_status()
+                except OperationalError as e:
+                    # This is a transient DB error; trigger retry
+                    logger.warning(f"OperationalError creating workflow for IP {ip}: {e} - retrying")
+                    raise
+    except RetryError as e:
+        # Log and re-raise a simple exception that Celery can serialize
+        logger.error(f"RetryError in create_workflow for IP {ip}: {e}")
+        raise RuntimeError(f"Failed to create workflow for IP {ip} after retries") from None
 
     return root_step
@@ -35,6 +35,10 @@ class AgentDocument(DocumentBase):
     def get_model(cls):
         return Agent
 
+    @classmethod
+    def prepare_index_queryset(cls, queryset):
+        return queryset.select_related('task').prefetch_related('names')
+
     @classmethod
     def from_obj(cls, obj):
         if obj.task is None:
@@ -47,7 +51,7 @@ class AgentDocument(DocumentBase):
             id=str(obj.pk),
             task_id=task_id,
             names=[
-                AgentNameDocument.from_obj(name) for name in obj.names.iterator(chunk_size=1000)
+                AgentNameDocument.from_obj(name) for name in obj.names.all()
             ],
             start_date=obj.start_date,
             end_date=obj.end_date,
@@ -324,6 +324,52 @@ class Group(GroupMixin):
             kwargs['content_object'] = obj
         return group_objs_model.objects.get_or_create(**kwargs)
 
+    def add_objects(self, objs):
+        """
+        Adds all objs, which must be of the same model, to the group using
+        a single query for finding the objects already in the group and a
+        single query for adding the others.
+        """
+
+        if self.group_type is None or self.group_type.codename != 'organization':
+            raise ValueError('objects cannot be added to non-organization groups')
+
+        objs = list(objs)
+        if not objs:
+            return []
+
+        from ESSArch_Core.auth.util import (
+            get_group_objs_model,
+            invalidate_object_visibility,
+        )
+        group_objs_model = get_group_objs_model(objs[0])
+        kwargs = {'group': self}
+        if group_objs_model.objects.is_generic():
+            kwargs['content_type'] = ContentType.objects.get_for_model(objs[0])
+            existing = set(group_objs_model.objects.filter(
+                object_id__in=[str(obj.pk) for obj in objs], **kwargs,
+            ).values_list('object_id', flat=True))
+        else:
+            existing = {str(pk) for pk in group_objs_model.objects.filter(
+                content_object__in=objs, **kwargs,
+            ).values_list('content_object', flat=True)}
+
+        new_objs = {}
+        for obj in objs:
+            object_id = str(obj.pk)
+            if object_id in existing or object_id in new_objs:
+                continue
+
+            if group_objs_model.objects.is_generic():
+                new_objs[object_id] = group_objs_model(object_id=object_id, **kwargs)
+            else:
+                new_objs[object_id] = group_objs_model(content_object=obj, **kwargs)
+
+        created = group_objs_model.objects.bulk_create(new_objs.values())
+        if created:
+            invalidate_object_visibility()
+        return created
+
     def remove_object(self, obj):
         if self.group_type is None or self.group_type.codename != 'organization':
             raise ValueError('objects cannot be added to non-organization groups')
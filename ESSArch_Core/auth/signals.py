@@ -2,6 +2,7 @@ import logging
 
 import channels.layers
 from asgiref.sync import async_to_sync
+from django.apps import apps
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group as DjangoGroup
@@ -35,6 +36,9 @@ from tenacity import (
 from ESSArch_Core.auth.models import (
     Group,
     GroupMember,
+    GroupMemberRole,
+    GroupMemberRoleAssignment,
+    GroupObjectsBase,
     Member,
     Notification,
     ProxyUser,
@@ -43,7 +47,10 @@ from ESSArch_Core.auth.models import (
 from ESSArch_Core.auth.saml.mapping import (
     get_backend as get_saml_mapping_backend,
 )
-from ESSArch_Core.auth.util import get_organization_groups
+from ESSArch_Core.auth.util import (
+    get_organization_groups,
+    invalidate_object_visibility,
+)
 
 User = get_user_model()
 
@@ -186,6 +193,23 @@ def group_member_delete(sender, instance, *args, **kwargs):
     groups_manager_group_member_delete(sender, instance, *args, **kwargs)
 
 
+def object_visibility_change(sender, *args, **kwargs):
+    invalidate_object_visibility()
+
+
+for model in apps.get_models():
+    if issubclass(model, (GroupObjectsBase, Group, GroupMember, GroupMemberRoleAssignment)):
+        post_save.connect(object_visibility_change, sender=model)
+        post_delete.connect(object_visibility_change, sender=model)
+
+
+@receiver(m2m_changed, sender=GroupMember.roles.through)
+@receiver(m2m_changed, sender=GroupMemberRole.permissions.through)
+def object_visibility_roles_change(sender, action, *args, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_object_visibility()
+
+
 @receiver(post_save, sender=Notification)
 def notification_post_save(sender, instance, created, **kwargs):
     if not created:
@@ -1,3 +1,4 @@
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Permission
@@ -11,9 +12,11 @@ from guardian.shortcuts import _handle_pk_field
 from guardian.utils import get_group_obj_perms_model, get_user_obj_perms_model
 
 from ESSArch_Core.auth.models import Group, GroupMember, GroupMemberRole
+from ESSArch_Core.util import get_cache_version, invalidate_cache_version
 
 User = get_user_model()
 ORGANIZATION_TYPE = 'organization'
+OBJECT_VISIBILITY_VERSION_KEY = 'object_visibility_version'
 
 
 def get_organization_groups(user):
@@ -118,6 +121,20 @@ def get_group_objs_model(obj=None):
     return get_grp_objs_model(obj, GroupObjectsBase, GroupGenericObjects)
 
 
+def get_object_visibility_version():
+    """
+    Returns the current version of the objects visible to users. Values
+    derived from get_objects_for_user can be cached using this version
+    until invalidate_object_visibility is called.
+    """
+
+    return get_cache_version(OBJECT_VISIBILITY_VERSION_KEY)
+
+
+def invalidate_object_visibility():
+    invalidate_cache_version(OBJECT_VISIBILITY_VERSION_KEY)
+
+
 def get_objects_for_user(user, klass, perms=None, include_no_auth_objs=True, current_organization=True):
     queryset = _get_queryset(klass)
 
@@ -1,5 +1,7 @@
 import logging
 import sys
+import threading
+import time
 
 import celery.exceptions
 from celery.backends.base import BaseDictBackend
@@ -11,19 +13,62 @@ from celery.states import (
     SUCCESS,
 )
 from celery.utils.serialization import create_exception_cls
-from django.db.models import F
+from django.conf import settings
+from django.db.models import Case, F, Q, Value, When
 from django.utils import timezone
 from django.utils.translation import gettext as _
 from kombu.utils.encoding import from_utf8
 
 from ESSArch_Core.auth.models import Notification
 from ESSArch_Core.db.utils import check_db_connection
-from ESSArch_Core.WorkflowEngine.models import ProcessTask
+from ESSArch_Core.WorkflowEngine.models import ProcessTask, update_step_status
 
 
 class DatabaseBackend(BaseDictBackend):
     subpolling_interval = 0.5
 
+    # progress updates of a task are written at most once every this many
+    # seconds, None uses the TASK_PROGRESS_UPDATE_INTERVAL setting
+    progress_update_interval = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._progress_lock = threading.Lock()
+        self._progress_written = {}
+        self._pending_progress = {}
+
+    def get_progress_update_interval(self):
+        if self.progress_update_interval is not None:
+            return self.progress_update_interval
+        return getattr(settings, 'TASK_PROGRESS_UPDATE_INTERVAL', 0)
+
+    def _defer_progress(self, task_id, meta, progress):
+        """
+        Returns True if the progress update should be kept in memory instead
+        of being written, i.e. if the progress of the task was written less
+        than progress_update_interval seconds ago
+        """
+
+        interval = self.get_progress_update_interval()
+        if not interval or interval <= 0:
+            return False
+
+        now = time.monotonic()
+        with self._progress_lock:
+            written = self._progress_written.get(task_id)
+            if written is not None and now - written < interval:
+                self._pending_progress[task_id] = (meta, progress)
+                return True
+
+            self._progress_written[task_id] = now
+            self._pending_progress.pop(task_id, None)
+            return False
+
+    def _pop_pending_progress(self, task_id):
+        with self._progress_lock:
+            self._progress_written.pop(task_id, None)
+            return self._pending_progress.pop(task_id, None)
+
     def _store_result(self, task_id, result, status,
                       traceback=None, request=None, using=None):
         """Store return value and status of an executed task."""
@@ -32,9 +77,17 @@ class DatabaseBackend(BaseDictBackend):
         if traceback is None:
             traceback = ''
 
+        # the status, traceback and result of tasks that have failed but are
+        # allowed to fail are kept as they are
+        def unless_allowed_failure(field, value):
+            return Case(
+                When(Q(status=FAILURE, allow_failure=True), then=F(field)),
+                default=Value(value, output_field=ProcessTask._meta.get_field(field)),
+            )
+
         updated = {
-            'status': status,
-            'traceback': traceback,
+            'status': unless_allowed_failure('status', status),
+            'traceback': unless_allowed_failure('traceback', traceback),
         }
 
         if status == STARTED:
@@ -43,18 +96,20 @@ class DatabaseBackend(BaseDictBackend):
         if status in READY_STATES:
             updated['time_done'] = timezone.now()
 
-        if not ProcessTask.objects.filter(celery_id=task_id, status=FAILURE, allow_failure=True).exists():
-            if status == SUCCESS:
-                updated['result'] = result
-                updated['progress'] = 100
+            pending = self._pop_pending_progress(task_id)
+            if pending is not None:
+                updated['meta'] = pending[0]
+                updated['progress'] = unless_allowed_failure('progress', pending[1])
 
-            if status in EXCEPTION_STATES:
-                updated['exception'] = result
-        else:
-            updated.pop('traceback')
-            updated.pop('status')
+        if status == SUCCESS:
+            updated['result'] = unless_allowed_failure('result', result)
+            updated['progress'] = unless_allowed_failure('progress', 100)
+
+        if status in EXCEPTION_STATES:
+            updated['exception'] = unless_allowed_failure('exception', result)
 
         ProcessTask.objects.filter(celery_id=task_id).update(**updated)
+        self._update_step_status(task_id, request)
 
         if status in EXCEPTION_STATES:
             try:
@@ -72,19 +127,43 @@ class DatabaseBackend(BaseDictBackend):
         return result
 
     def update_state(self, task_id, meta, status, request=None):
-        check_db_connection()
         if meta is not None:
             progress = (meta['current'] / meta['total']) * 100
         else:
             progress = None
 
+        if status is None and progress is not None and self._defer_progress(task_id, meta, progress):
+            return status
+
+        check_db_connection()
+
+        if status in READY_STATES:
+            pending = self._pop_pending_progress(task_id)
+            if pending is not None and meta is None:
+                meta, progress = pending
+
         ProcessTask.objects.filter(celery_id=task_id).update(
             status=status if status is not None else F('status'),
             meta=meta if meta is not None else F('meta'),
             progress=progress if progress is not None else F('progress'),
         )
+        if status is not None or progress is not None:
+            self._update_step_status(task_id, request)
         return status
 
+    def _get_step_id(self, task_id, request=None):
+        headers = getattr(request, 'headers', None) or {}
+        headers = headers.get('headers', headers)
+        if 'step' in headers:
+            return headers['step']
+
+        return ProcessTask.objects.filter(celery_id=task_id).values_list('processstep_id', flat=True).first()
+
+    def _update_step_status(self, task_id, request=None):
+        step_id = self._get_step_id(task_id, request)
+        if step_id is not None:
+            update_step_status(step_id)
+
     def _get_task_meta_for(self, task_id):
         check_db_connection()
         try:
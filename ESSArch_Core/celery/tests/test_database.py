@@ -0,0 +1,127 @@
+from unittest import mock
+
+from celery import states as celery_states
+from celery.app.task import Context
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from ESSArch_Core.celery.backends.database import DatabaseBackend
+from ESSArch_Core.config.celery import app
+from ESSArch_Core.WorkflowEngine.models import ProcessStep, ProcessTask
+
+
+class DatabaseBackendTests(TestCase):
+    def setUp(self):
+        self.backend = DatabaseBackend(app=app)
+        self.step = ProcessStep.objects.create()
+        self.task = ProcessTask.objects.create(processstep=self.step)
+        self.task_id = str(self.task.celery_id)
+        self.request = Context(headers={'step': self.step.pk})
+
+    def get_task_queries(self, queries):
+        return [q['sql'] for q in queries if '"celery_id"' in q['sql']]
+
+    def test_store_result_with_single_update(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.backend.store_result(self.task_id, 'foo', celery_states.SUCCESS, request=self.request)
+
+        queries = self.get_task_queries(ctx.captured_queries)
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(queries[0].startswith('UPDATE'))
+
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, celery_states.SUCCESS)
+        self.assertEqual(self.task.result, 'foo')
+        self.assertEqual(self.task.progress, 100)
+        self.assertIsNotNone(self.task.time_done)
+
+        self.step.refresh_from_db()
+        self.assertEqual(self.step.status, celery_states.SUCCESS)
+
+    def test_store_result_without_step_header(self):
+        self.backend.store_result(self.task_id, None, celery_states.STARTED)
+
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, celery_states.STARTED)
+        self.assertIsNotNone(self.task.time_started)
+
+        self.step.refresh_from_db()
+        self.assertEqual(self.step.status, celery_states.STARTED)
+
+    def test_store_failure(self):
+        exc = self.backend.prepare_exception(ValueError('foo'))
+        self.backend.store_result(self.task_id, exc, celery_states.FAILURE, traceback='tb', request=self.request)
+
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, celery_states.FAILURE)
+        self.assertEqual(self.task.traceback, 'tb')
+        self.assertEqual(self.task.exception, exc)
+
+    def test_allowed_failure_is_kept(self):
+        ProcessTask.objects.filter(pk=self.task.pk).update(
+            status=celery_states.FAILURE, allow_failure=True, traceback='tb',
+        )
+        self.backend.store_result(self.task_id, 'foo', celery_states.SUCCESS, request=self.request)
+
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, celery_states.FAILURE)
+        self.assertEqual(self.task.traceback, 'tb')
+        self.assertIsNone(self.task.result)
+        self.assertEqual(self.task.progress, 0)
+        self.assertIsNotNone(self.task.time_done)
+
+    @override_settings(TASK_PROGRESS_UPDATE_INTERVAL=0)
+    def test_progress_updates_are_written(self):
+        for i in range(1, 4):
+            self.backend.update_state(self.task_id, {'current': i, 'total': 4}, None, request=self.request)
+            self.task.refresh_from_db()
+            self.assertEqual(self.task.progress, i * 25)
+
+    @override_settings(TASK_PROGRESS_UPDATE_INTERVAL=60)
+    @mock.patch('ESSArch_Core.celery.backends.database.time.monotonic', return_value=0)
+    def test_progress_updates_are_rate_limited(self, mock_monotonic):
+        self.backend.update_state(self.task_id, {'current': 1, 'total': 4}, None, request=self.request)
+
+        with self.assertNumQueries(0):
+            self.backend.update_state(self.task_id, {'current': 2, 'total': 4}, None, request=self.request)
+
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.progress, 25)
+
+        mock_monotonic.return_value = 60
+        self.backend.update_state(self.task_id, {'current': 3, 'total': 4}, None, request=self.request)
+
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.progress, 75)
+        self.assertEqual(self.task.meta, {'current': 3, 'total': 4})
+
+    @mock.patch('ESSArch_Core.celery.backends.database.time.monotonic', return_value=0)
+    def test_progress_updates_are_rate_limited_by_default(self, mock_monotonic):
+        self.backend.update_state(self.task_id, {'current': 1, 'total': 4}, None, request=self.request)
+
+        with self.assertNumQueries(0):
+            self.backend.update_state(self.task_id, {'current': 2, 'total': 4}, None, request=self.request)
+
+        mock_monotonic.return_value = settings.TASK_PROGRESS_UPDATE_INTERVAL
+        self.backend.update_state(self.task_id, {'current': 3, 'total': 4}, None, request=self.request)
+
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.progress, 75)
+
+    @override_settings(TASK_PROGRESS_UPDATE_INTERVAL=60)
+    def test_pending_progress_is_written_with_final_state(self):
+        self.backend.update_state(self.task_id, {'current': 1, 'total': 4}, None, request=self.request)
+        self.backend.update_state(self.task_id, {'current': 2, 'total': 4, 'foo': 'bar'}, None, request=self.request)
+
+        exc = self.backend.prepare_exception(ValueError('foo'))
+        self.backend.store_result(self.task_id, exc, celery_states.FAILURE, request=self.request)
+
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, celery_states.FAILURE)
+        self.assertEqual(self.task.progress, 50)
+        self.assertEqual(self.task.meta, {'current': 2, 'total': 4, 'foo': 'bar'})
+
+        self.assertEqual(self.backend._progress_written, {})
+        self.assertEqual(self.backend._pending_progress, {})
@@ -43,6 +43,7 @@ def clear(indexes):
 @click.option('-i', '--index', 'indexes', type=str, multiple=True, help='Specify which index to update. \
 (agent, archive, component, directory, document, information_package, structure_unit)')
 @click.option('-b', '--batch-size', 'batch_size', type=int, help='Number of items to index at once.')
+@click.option('-t', '--threads', 'thread_count', type=int, help='Number of batches to index concurrently.')
 @click.option('-r', '--remove-stale', 'remove_stale', is_flag=True, default=False, help='Remove objects from the \
 index that are no longer in the database.')
 @click.option('--do-not-delete-old-index', 'do_not_delete_old', is_flag=True, default=False, help='Skip to clear old \
@@ -50,7 +51,7 @@ index. Importent for document index (File) if you do not want to rebuild index f
 @click.option('--index-file-content', 'index_file_content', is_flag=True, default=False, help='Rebuild index from \
 files for document index (File) "field - attachment".')
 @initialize
-def rebuild(indexes, batch_size, remove_stale, do_not_delete_old, index_file_content):
+def rebuild(indexes, batch_size, thread_count, remove_stale, do_not_delete_old, index_file_content):
     """Rebuild indices
     """
 
@@ -62,7 +63,7 @@ def rebuild(indexes, batch_size, remove_stale, do_not_delete_old, index_file_con
             clear_index(index)
             click.secho('done', fg='green')
         click.secho('Rebuilding {}... '.format(index._index._name), nl=False)
-        index_documents(index, batch_size, remove_stale, index_file_content)
+        index_documents(index, batch_size, remove_stale, index_file_content, thread_count)
         click.secho('done', fg='green')
 
 
@@ -89,8 +90,8 @@ def clear_index(index):
     index.clear_index()
 
 
-def index_documents(index, batch_size, remove_stale, index_file_content=False):
-    index.index_documents(batch_size, remove_stale, index_file_content)
+def index_documents(index, batch_size, remove_stale, index_file_content=False, thread_count=None):
+    index.index_documents(batch_size, remove_stale, index_file_content, thread_count=thread_count)
 
 
 @click.command()
@@ -295,6 +295,52 @@ CACHES = {
     }
 }
 
+# Checksums of unchanged files are cached for this many seconds, 0 disables the cache
+CHECKSUM_CACHE_TIMEOUT = env.int('ESSARCH_CHECKSUM_CACHE_TIMEOUT', 60 * 60 * 24 * 7)
+
+# Snapshots of the files described in generated XML files, used by quick redundancy checks,
+# are cached for this many seconds. 0 disables the cache and with it quick redundancy checks,
+# only enable it when they are used since each snapshot holds an entry for every file
+FILE_MANIFEST_CACHE_TIMEOUT = env.int('ESSARCH_FILE_MANIFEST_CACHE_TIMEOUT', 0)
+
+# Identified file formats are cached by file content for this many seconds, 0 disables the cache
+FORMAT_IDENTIFICATION_CACHE_TIMEOUT = env.int('ESSARCH_FORMAT_IDENTIFICATION_CACHE_TIMEOUT', 60 * 60 * 24 * 30)
+
+# Number of threads used to hash and identify the formats of files identified in batches
+FORMAT_IDENTIFICATION_WORKERS = env.int('ESSARCH_FORMAT_IDENTIFICATION_WORKERS', 4)
+
+# Number of threads used to copy small files when copying directories locally
+STORAGE_COPY_WORKERS = env.int('ESSARCH_STORAGE_COPY_WORKERS', 4)
+
+# Number of chunks sent concurrently when copying files to remote hosts, only increase this when
+# every remote host writes chunks at their offsets, older versions append them in arrival order
+STORAGE_REMOTE_COPY_WORKERS = env.int('ESSARCH_STORAGE_REMOTE_COPY_WORKERS', 1)
+
+# Number of processes used to parse files when generating XML, 1 parses them in the current process
+XML_GENERATOR_WORKERS = env.int('ESSARCH_XML_GENERATOR_WORKERS', 1)
+
+# Write the elements of each file when generating XML one at a time instead of keeping all of them in memory
+XML_GENERATOR_STREAMING = env.bool('ESSARCH_XML_GENERATOR_STREAMING', default=False)
+
+# Number of threads validating files when validating directories, 1 validates them in the current thread
+VALIDATION_WORKERS = env.int('ESSARCH_VALIDATION_WORKERS', 1)
+
+# The archives and information packages visible to each user in search are cached for at most
+# this many seconds, 0 disables the cache
+SEARCH_VISIBILITY_CACHE_TIMEOUT = env.int('ESSARCH_SEARCH_VISIBILITY_CACHE_TIMEOUT', 60 * 5)
+
+# The specification data, user and step contexts shared by the tasks of a workflow are cached for at
+# most this many seconds, 0 disables the cache
+WORKFLOW_CONTEXT_CACHE_TIMEOUT = env.int('ESSARCH_WORKFLOW_CONTEXT_CACHE_TIMEOUT', 60 * 60)
+
+# The progress of a running task is written to the database at most once every this many seconds,
+# the latest progress is written together with the final state of the task, 0 writes every update.
+# Each written update also recalculates the status and progress of the step of the task and its ancestors
+TASK_PROGRESS_UPDATE_INTERVAL = env.float('ESSARCH_TASK_PROGRESS_UPDATE_INTERVAL', 1)
+
+# Number of compiled XML schemas kept in memory by each process, 0 disables the cache
+XML_SCHEMA_CACHE_SIZE = env.int('ESSARCH_XML_SCHEMA_CACHE_SIZE', 32)
+
 try:
     from local_essarch_settings import UNOSERVER_URL
 except ImportError:
@@ -305,6 +351,15 @@ try:
 except ImportError:
     TIKA_URL = env.str('ESSARCH_TIKA_URL', env.str('TIKA_URL', 'http://localhost:9998'))
 
+# Maximum number of concurrent requests to Tika from each process
+TIKA_MAX_CONNECTIONS = env.int('ESSARCH_TIKA_MAX_CONNECTIONS', 4)
+
+# Text extracted by Tika is cached by file content for this many seconds, 0 disables the cache
+TIKA_CONTENT_CACHE_TIMEOUT = env.int('ESSARCH_TIKA_CONTENT_CACHE_TIMEOUT', 60 * 60 * 24 * 30)
+
+# Extracted texts longer than this many characters are not cached
+TIKA_CONTENT_CACHE_MAX_SIZE = env.int('ESSARCH_TIKA_CONTENT_CACHE_MAX_SIZE', 1024 * 1024)
+
 try:
     from local_essarch_settings import ELASTICSEARCH_URL
 except ImportError:
@@ -363,12 +418,25 @@ ELASTICSEARCH_BATCH_SIZE = 1000
 ELASTICSEARCH_MAX_INDEX_SIZE = None     # Example 100 * 1024 * 1024  # 100MB
 ELASTICSEARCH_RETRY_WITHOUT_CONTENT_IF_TOO_LARGE = False
 
+# Number of batches created and sent concurrently when indexing, 1 indexes them in the current thread
+ELASTICSEARCH_INDEX_THREADS = env.int('ESSARCH_ELASTICSEARCH_INDEX_THREADS', 1)
+
+# Maximum size in bytes of a single bulk request
+ELASTICSEARCH_MAX_CHUNK_BYTES = env.int('ESSARCH_ELASTICSEARCH_MAX_CHUNK_BYTES', 100 * 1024 * 1024)
+
+# Number of times documents rejected with 429 Too Many Requests are retried
+ELASTICSEARCH_BULK_MAX_RETRIES = env.int('ESSARCH_ELASTICSEARCH_BULK_MAX_RETRIES', 10)
+
 # Storage
 
 ESSARCH_TAPE_IDENTIFICATION_BACKEND = 'base'
 TARFILE_FORMAT = tarfile.GNU_FORMAT
 
 # Logging
+
+# Write events in batches from a background thread instead of in the logging call
+LOG_EVENTS_BUFFERED = env.bool('ESSARCH_LOG_EVENTS_BUFFERED', default=False)
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -397,7 +465,9 @@ LOGGING = {
         },
         'core': {
             'level': 'DEBUG',
-            'class': 'ESSArch_Core.log.dbhandler.DBHandler',
+            'class': 'ESSArch_Core.log.dbhandler.{}'.format(
+                'BufferedDBHandler' if LOG_EVENTS_BUFFERED else 'DBHandler'
+            ),
             'application': 'ESSArch',
             'agent_role': 'Producer',
         },
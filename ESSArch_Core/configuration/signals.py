@@ -1,8 +1,8 @@
 from django.core.cache import cache
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from ESSArch_Core.configuration.models import EventType, Parameter
+from ESSArch_Core.configuration.models import EventType, Parameter, Path
 
 
 @receiver(post_save, sender=EventType)
@@ -15,3 +15,11 @@ def event_type_post_save(sender, instance, created, **kwargs):
 def parameter_post_save(sender, instance, created, **kwargs):
     cache_name = 'parameter_%s' % instance.entity
     cache.set(cache_name, instance.value, 3600)
+
+
+@receiver(post_save, sender=Path)
+@receiver(post_delete, sender=Path)
+def path_changed(sender, instance, **kwargs):
+    if instance.entity == 'mimetypes_definitionfile':
+        from ESSArch_Core.fixity.format import clear_mimetypes_cache
+        clear_mimetypes_cache()
@@ -0,0 +1,82 @@
+import time
+import uuid
+
+from celery import states as celery_states
+from celery.app.task import Context
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ESSArch_Core.celery.backends.database import DatabaseBackend
+from ESSArch_Core.config.celery import app
+from ESSArch_Core.WorkflowEngine.models import ProcessStep, ProcessTask
+
+
+class Command(BaseCommand):
+    help = (
+        'Replays a synthetic workflow against the result backend using the configured database, '
+        'once writing every progress update and once with rate limited progress updates'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=100, help='Number of tasks in the workflow')
+        parser.add_argument('--progress-updates', type=int, default=50, help='Progress updates per task')
+        parser.add_argument('--progress-delay', type=float, default=0.001,
+                            help='Seconds between the progress updates of a task')
+        parser.add_argument('--interval', type=float, default=0.01,
+                            help='Progress update interval of the rate limited run')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Database: %s' % connection.vendor)
+
+        for interval in (0, options['interval']):
+            queries, duration = self.replay(
+                options['tasks'], options['progress_updates'], options['progress_delay'], interval,
+            )
+            self.stdout.write('interval=%ss: %d queries in %.3fs (%.2f ms per task)' % (
+                interval, queries, duration, duration * 1000 / max(options['tasks'], 1),
+            ))
+
+    def replay(self, tasks, progress_updates, progress_delay, interval):
+        backend = DatabaseBackend(app=app)
+        backend.progress_update_interval = interval
+
+        step = ProcessStep.objects.create(name='benchmark_result_backend')
+        task_ids = [str(uuid.uuid4()) for _ in range(tasks)]
+        ProcessTask.objects.bulk_create([
+            ProcessTask(name='benchmark_result_backend', celery_id=task_id, processstep=step, processstep_pos=pos)
+            for pos, task_id in enumerate(task_ids)
+        ])
+        request = Context(headers={'step': step.pk})
+
+        queries = 0
+        duration = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        try:
+            with connection.execute_wrapper(count_queries):
+                for task_id in task_ids:
+                    start = time.monotonic()
+                    backend.store_result(task_id, None, celery_states.STARTED, request=request)
+                    duration += time.monotonic() - start
+
+                    for current in range(1, progress_updates + 1):
+                        if progress_delay:
+                            time.sleep(progress_delay)
+
+                        start = time.monotonic()
+                        backend.update_state(task_id, {'current': current, 'total': progress_updates}, None,
+                                             request=request)
+                        duration += time.monotonic() - start
+
+                    start = time.monotonic()
+                    backend.store_result(task_id, None, celery_states.SUCCESS, request=request)
+                    duration += time.monotonic() - start
+        finally:
+            ProcessTask.objects.filter(processstep=step).delete()
+            step.delete()
+
+        return queries, duration
@@ -30,17 +30,22 @@ import shutil
 import tempfile
 import unittest
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from os import walk
 from unittest import mock
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from django.utils import dateparse, timezone
 from lxml import etree
 
 from ESSArch_Core.essxml.Generator.xmlGenerator import (
     XMLGenerator,
+    _init_worker,
     parseContent,
 )
+from ESSArch_Core.essxml.util import get_file_manifest
+from ESSArch_Core.fixity import checksum
 from ESSArch_Core.util import make_unicode, normalize_path
 
 
@@ -1259,6 +1264,84 @@ class GenerateXMLTestCase(TestCase):
         file_elements = tree.findall('.//bar')
         self.assertEqual(len(file_elements), num_of_files)
 
+    @mock.patch.object(XMLGenerator, '_create_executor', side_effect=lambda workers: ThreadPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(True, False),
+    ))
+    def test_element_with_files_using_workers(self, mock_create_executor):
+        for i in range(20):
+            with open(os.path.join(self.datadir, "record1/extra%s.txt" % i), 'w') as f:
+                f.write('foo%s' % i)
+
+        specification = {
+            '-name': 'foo',
+            '-children': [
+                {
+                    '-name': 'bar',
+                    '-containsFiles': True,
+                    '-attr': [
+                        {'-name': 'href', '#content': [{'var': 'href'}]},
+                        {'-name': 'checksum', '#content': [{'var': 'FChecksum'}]},
+                        {'-name': 'format', '#content': [{'var': 'FFormatName'}]},
+                    ],
+                }
+            ],
+        }
+
+        generator = XMLGenerator(allow_unknown_file_types=True)
+        progress = []
+        generator.generate(
+            {self.fname: {'spec': specification}}, folderToParse=self.datadir, workers=1,
+            progress_callback=lambda current, total: progress.append((current, total)),
+        )
+        mock_create_executor.assert_not_called()
+        self.assertEqual(progress[-1], (22, 22))
+        expected = [el.attrib for el in etree.parse(self.fname).findall('.//bar')]
+
+        progress = []
+        generator.generate(
+            {self.fname: {'spec': specification}}, folderToParse=self.datadir, workers=2,
+            progress_callback=lambda current, total: progress.append((current, total)),
+        )
+        mock_create_executor.assert_called_once_with(2)
+        self.assertEqual(progress[-1], (22, 22))
+        actual = [el.attrib for el in etree.parse(self.fname).findall('.//bar')]
+
+        self.assertEqual(len(actual), 22)
+        self.assertEqual([dict(a) for a in actual], [dict(e) for e in expected])
+
+    def test_element_with_files_using_process_pool(self):
+        for i in range(20):
+            with open(os.path.join(self.datadir, "record1/extra%s.txt" % i), 'w') as f:
+                f.write('foo%s' % i)
+
+        specification = {
+            '-name': 'foo',
+            '-children': [
+                {
+                    '-name': 'bar',
+                    '-containsFiles': True,
+                    '-attr': [
+                        {'-name': 'href', '#content': [{'var': 'href'}]},
+                        {'-name': 'checksum', '#content': [{'var': 'FChecksum'}]},
+                        {'-name': 'format', '#content': [{'var': 'FFormatName'}]},
+                        {'-name': 'size', '#content': [{'var': 'FSize'}]},
+                    ],
+                }
+            ],
+        }
+
+        generator = XMLGenerator(allow_unknown_file_types=True)
+        generator.generate({self.fname: {'spec': specification}}, folderToParse=self.datadir, workers=1)
+        expected = [dict(el.attrib) for el in etree.parse(self.fname).findall('.//bar')]
+
+        with mock.patch.object(XMLGenerator, '_create_executor', wraps=generator._create_executor) as mock_executor:
+            generator.generate({self.fname: {'spec': specification}}, folderToParse=self.datadir, workers=2)
+        mock_executor.assert_called_once_with(2)
+        actual = [dict(el.attrib) for el in etree.parse(self.fname).findall('.//bar')]
+
+        self.assertEqual(len(actual), 22)
+        self.assertEqual(actual, expected)
+
     def test_multiple_to_create_with_reference_from_second_to_first(self):
         specification = {
             '-name': 'foo',
@@ -1319,6 +1402,57 @@ class GenerateXMLTestCase(TestCase):
 
         self.assertEqual(bars2[0].text, 'nested/first.xml')
 
+    @override_settings(FILE_MANIFEST_CACHE_TIMEOUT=60)
+    def test_multiple_to_create_reads_each_xml_once(self):
+        self.addCleanup(cache.clear)
+        specification = {
+            '-name': 'foo',
+            '-allowEmpty': True,
+            '-children': [
+                {
+                    '-name': 'bar',
+                    '-containsFiles': True,
+                    '-attr': [
+                        {'-name': 'name', '#content': [{'var': 'FName'}]},
+                        {'-name': 'checksum', '#content': [{'var': 'FChecksum'}]},
+                    ],
+                }
+            ],
+        }
+
+        first_fname = os.path.join(self.xmldir, "first.xml")
+        second_fname = os.path.join(self.xmldir, "second.xml")
+
+        with mock.patch('ESSArch_Core.fixity.checksum._calculate_checksums',
+                        wraps=checksum._calculate_checksums) as mock_calculate:
+            self.generator.generate(
+                OrderedDict([
+                    (first_fname, {'spec': specification}),
+                    (second_fname, {'spec': specification})
+                ]), folderToParse=self.datadir, algorithm='MD5',
+            )
+
+        first_calls = [c for c in mock_calculate.call_args_list if c[0][0] == first_fname]
+        self.assertEqual(len(first_calls), 1)
+        self.assertCountEqual(first_calls[0][0][1], ['MD5', 'SHA-256'])
+
+        bar = etree.parse(second_fname).find(".//bar[@name='first.xml']")
+        self.assertEqual(bar.get('checksum'), checksum.calculate_checksum(first_fname, 'MD5', use_cache=False))
+        self.assertIsNotNone(get_file_manifest(first_fname))
+
+    @mock.patch('ESSArch_Core.essxml.Generator.xmlGenerator.cache_file_manifest')
+    def test_manifest_not_cached_by_default(self, mock_cache_manifest):
+        specification = {
+            '-name': 'foo',
+            '-allowEmpty': True,
+            '-children': [{'-name': 'bar', '-containsFiles': True}],
+        }
+        fname = os.path.join(self.xmldir, "first.xml")
+
+        self.generator.generate({fname: {'spec': specification}}, folderToParse=self.datadir)
+
+        mock_cache_manifest.assert_not_called()
+
     def test_multiple_to_create_with_files(self):
         specification = {
             '-name': 'foo',
@@ -1463,6 +1597,86 @@ class GenerateXMLTestCase(TestCase):
         file_elements = tree.findall('.//{%s}bar' % nsmap['premis'])
         self.assertEqual(len(file_elements), num_of_files)
 
+    def test_element_with_files_streaming(self):
+        nsmap = {
+            'premis': 'http://www.loc.gov/premis/v3',
+        }
+
+        specification = {
+            '-name': 'foo',
+            '-nsmap': nsmap,
+            '-children': [
+                {
+                    '-name': 'section',
+                    '-children': [
+                        {
+                            '-name': 'bar',
+                            '-namespace': 'premis',
+                            '-containsFiles': True,
+                            '-filters': {'href': 'record1/*'},
+                            '-attr': [{'-name': 'name', '#content': [{'var': 'FName'}]}],
+                            '-children': [
+                                {
+                                    '-name': 'baz',
+                                    '-nsmap': {'xlink': 'http://www.w3.org/1999/xlink'},
+                                    '-attr': [
+                                        {'-name': 'href', '-namespace': 'xlink', '#content': [{'var': 'href'}]},
+                                    ],
+                                },
+                            ],
+                        },
+                        {
+                            '-name': 'other',
+                            '#content': [{'text': 'after files'}],
+                        },
+                    ],
+                },
+                {
+                    '-name': 'empty',
+                    '-skipIfNoChildren': True,
+                    '-children': [
+                        {
+                            '-name': 'bar',
+                            '-containsFiles': True,
+                            '-filters': {'href': 'nonexistent/*'},
+                            '-attr': [{'-name': 'name', '#content': [{'var': 'FName'}]}],
+                        },
+                    ],
+                },
+                {
+                    '-name': 'mixed',
+                    '#content': [{'text': 'text'}],
+                    '-children': [
+                        {
+                            '-name': 'bar',
+                            '-containsFiles': True,
+                            '-attr': [{'-name': 'name', '#content': [{'var': 'FName'}]}],
+                        },
+                    ],
+                },
+            ],
+        }
+
+        self.generator.generate(
+            {self.fname: {'spec': specification}}, folderToParse=self.datadir, streaming=False,
+        )
+        with open(self.fname, 'rb') as f:
+            expected = f.read()
+
+        self.generator.generate(
+            {self.fname: {'spec': specification}}, folderToParse=self.datadir, streaming=True,
+        )
+        with open(self.fname, 'rb') as f:
+            actual = f.read()
+
+        self.assertEqual(actual, expected)
+        self.assertNotIn(b'essarch-deferred-elements', actual)
+
+        tree = etree.parse(self.fname)
+        self.assertEqual(len(tree.findall('.//section/{%s}bar' % nsmap['premis'])), 1)
+        self.assertEqual(len(tree.findall('.//mixed/bar')), 2)
+        self.assertIsNone(tree.find('.//empty'))
+
     def test_element_with_filtered_files(self):
         specification = {
             '-name': 'foo',
@@ -24,19 +24,29 @@
 
 import copy
 import datetime
+import itertools
 import logging
 import os
 import re
 import time
 import uuid
+from concurrent.futures import ProcessPoolExecutor
 from os import walk
 
+import django
+from django.apps import apps
+from django.conf import settings
 from django.template import Context, Template, TemplateSyntaxError
 from django.utils import timezone
 from lxml import etree
 from natsort import natsorted
 
-from ESSArch_Core.essxml.util import parse_file
+from ESSArch_Core.essxml.util import (
+    analyse_file,
+    cache_file_manifest,
+    parse_file,
+)
+from ESSArch_Core.fixity.checksum import calculate_checksums
 from ESSArch_Core.fixity.format import FormatIdentifier
 from ESSArch_Core.profiles.utils import fill_specification_data
 from ESSArch_Core.util import (
@@ -47,6 +57,10 @@ from ESSArch_Core.util import (
     normalize_path,
 )
 
+DEFERRED_ELEMENTS_PI = 'essarch-deferred-elements'
+deferred_elements_re = re.compile(
+    r'^ *<\?{} (\d+)\?>\n'.format(re.escape(DEFERRED_ELEMENTS_PI)).encode(), re.MULTILINE,
+)
 leading_underscore_tag_re = re.compile(r'%s *_(.*?(?=\}))%s' % (re.escape('{{'), re.escape('}}')))
 
 
@@ -404,7 +418,63 @@ class XMLElement:
 
         self.el.append(new.el)
 
-    def createLXMLElement(self, info, nsmap=None, files=None, folderToParse='', parent=None, algorithm=None):
+    def can_defer_file_elements(self):
+        return self.replace_existing is None and not self.ignore_existing
+
+    def iter_file_elements(self, child, info, nsmap, files, folderToParse, algorithm):
+        """
+        Creates an element from child for each file in files that passes the
+        filters of child and yields it before creating the next one
+        """
+
+        for fileinfo in files:
+            include = True
+
+            for key, file_filter_raw in child.fileFilters.items():
+                file_filter = parseContent(file_filter_raw, info)
+                if not re.search(file_filter, fileinfo.get(key, '')):
+                    include = False
+
+            if include:
+                full_info = info.copy()
+                full_info.update(fileinfo)
+                child_el = child.createLXMLElement(
+                    full_info,
+                    nsmap,
+                    files=files,
+                    folderToParse=folderToParse,
+                    parent=self,
+                    algorithm=algorithm,
+                )
+                if child_el is not None:
+                    yield child_el
+
+    def defer_file_elements(self, child, info, nsmap, files, folderToParse, algorithm, deferred):
+        """
+        Adds a placeholder for the file elements of child instead of creating
+        them, the elements are instead created one at a time when the tree is
+        written by XMLGenerator.
+        """
+
+        elements = self.iter_file_elements(child, info, nsmap, files, folderToParse, algorithm)
+        first = next(elements, None)
+        if first is None:
+            return
+
+        placeholder = etree.PI(DEFERRED_ELEMENTS_PI, str(len(deferred)))
+        self.el.append(placeholder)
+        deferred.append((placeholder, itertools.chain([first], elements)))
+
+    def createLXMLElement(self, info, nsmap=None, files=None, folderToParse='', parent=None, algorithm=None,
+                          deferred=None):
+        """
+        Args:
+            deferred: If a list is given, the elements of children containing
+                files are not created. Instead a placeholder is added to the
+                tree and a (placeholder, elements) tuple, where elements is an
+                iterator creating the elements, is appended to the list.
+        """
+
         logger = logging.getLogger('essarch.essxml.generator')
         if nsmap is None:
             nsmap = {}
@@ -454,27 +524,12 @@ class XMLElement:
             child.parent = self
             child.parent_pos = child_idx
             if child.containsFiles:
-                for fileinfo in files:
-                    include = True
-
-                    for key, file_filter_raw in child.fileFilters.items():
-                        file_filter = parseContent(file_filter_raw, info)
-                        if not re.search(file_filter, fileinfo.get(key, '')):
-                            include = False
+                if deferred is not None and child.can_defer_file_elements():
+                    self.defer_file_elements(child, info, full_nsmap, files, folderToParse, algorithm, deferred)
+                    continue
 
-                    if include:
-                        full_info = info.copy()
-                        full_info.update(fileinfo)
-                        child_el = child.createLXMLElement(
-                            full_info,
-                            full_nsmap,
-                            files=files,
-                            folderToParse=folderToParse,
-                            parent=self,
-                            algorithm=algorithm,
-                        )
-                        if child_el is not None:
-                            self.add_element(child)
+                for _child_el in self.iter_file_elements(child, info, full_nsmap, files, folderToParse, algorithm):
+                    self.add_element(child)
 
             elif child.foreach is not None:
                 try:
@@ -503,6 +558,7 @@ class XMLElement:
                         folderToParse=folderToParse,
                         parent=self,
                         algorithm=algorithm,
+                        deferred=deferred,
                     )
                     if child_el is not None:
                         self.add_element(child)
@@ -527,6 +583,7 @@ class XMLElement:
                             folderToParse=folderToParse,
                             parent=self,
                             algorithm=algorithm,
+                            deferred=deferred,
                         )
                         if child_el is not None:
                             self.add_element(child)
@@ -551,6 +608,7 @@ class XMLElement:
                     folderToParse=folderToParse,
                     parent=self,
                     algorithm=algorithm,
+                    deferred=deferred,
                 )
                 if child_el is not None:
                     self.add_element(child)
@@ -651,8 +709,65 @@ class XMLAttribute:
         return name, content, self.required
 
 
-def find_files_in_path_not_in_external_dirs(fid, path, external, algorithm, rootdir=""):
+PARSE_FILES_CHUNK_SIZE = 10
+
+_worker_fid = None
+
+
+def _init_worker(allow_unknown_file_types, allow_encrypted_files):
+    global _worker_fid
+
+    if not apps.ready:
+        django.setup()
+
+    _worker_fid = FormatIdentifier(
+        allow_unknown_file_types=allow_unknown_file_types,
+        allow_encrypted_files=allow_encrypted_files,
+    )
+
+
+def _analyse_file_in_worker(filepath, algorithm):
+    return analyse_file(filepath, _worker_fid, algorithm=algorithm)
+
+
+def parse_file_list(fid, file_list, algorithm, rootdir="", executor=None, progress_callback=None):
+    """
+    Parses each (filepath, relpath) pair in file_list and returns the results
+    in the same order.
+
+    If an executor is given, the heavy computations are distributed over its
+    workers while mimetypes, which may require database access, are always
+    resolved in the current process using a single lookup.
+    """
+
+    total = len(file_list)
+    filepaths = [filepath for filepath, _ in file_list]
+    mimetypes = fid.get_mimetypes(filepaths)
+
+    if executor is not None:
+        analysed = executor.map(
+            _analyse_file_in_worker, filepaths, itertools.repeat(algorithm), chunksize=PARSE_FILES_CHUNK_SIZE,
+        )
+    else:
+        analysed = itertools.repeat({}, total)
+
     files = []
+    for idx, ((filepath, relpath), mimetype, provided_data) in enumerate(zip(file_list, mimetypes, analysed), 1):
+        provided_data = dict(provided_data, FMimetype=mimetype)
+        fileinfo = parse_file(
+            filepath, fid, relpath, algorithm=algorithm, rootdir=rootdir, provided_data=provided_data,
+        )
+        files.append(fileinfo)
+
+        if progress_callback is not None and (idx % 100 == 0 or idx == total):
+            progress_callback(idx, total)
+
+    return files
+
+
+def find_files_in_path_not_in_external_dirs(fid, path, external, algorithm, rootdir="", executor=None,
+                                            progress_callback=None):
+    file_list = []
     external = [e[0] for e in external]
     for root, _dirnames, filenames in walk(path):
         for fname in filenames:
@@ -666,12 +781,14 @@ def find_files_in_path_not_in_external_dirs(fid, path, external, algorithm, root
             if in_external:
                 continue
 
-            fileinfo = parse_file(filepath, fid, relpath, algorithm=algorithm, rootdir=rootdir)
-            files.append(fileinfo)
-    return files
+            file_list.append((filepath, relpath))
 
+    return parse_file_list(
+        fid, file_list, algorithm, rootdir=rootdir, executor=executor, progress_callback=progress_callback,
+    )
 
-def parse_files(fid, path, external, algorithm, rootdir):
+
+def parse_files(fid, path, external, algorithm, rootdir, executor=None, progress_callback=None):
     files = []
     if os.path.isfile(path):
         relpath = os.path.basename(path)
@@ -680,7 +797,9 @@ def parse_files(fid, path, external, algorithm, rootdir):
         files.append(file_info)
 
     elif os.path.isdir(path):
-        found_files = find_files_in_path_not_in_external_dirs(fid, path, external, algorithm, rootdir)
+        found_files = find_files_in_path_not_in_external_dirs(
+            fid, path, external, algorithm, rootdir, executor=executor, progress_callback=progress_callback,
+        )
         files.extend(found_files)
     return files
 
@@ -734,10 +853,33 @@ class XMLGenerator:
 
         return dirs
 
+    def _create_executor(self, workers):
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(self.fid.allow_unknown_file_types, self.fid.allow_encrypted_files),
+        )
+
     def generate(self, filesToCreate, folderToParse=None, extra_paths_to_parse=None,
-                 parsed_files=None, relpath=None, algorithm='SHA-256'):
+                 parsed_files=None, relpath=None, algorithm='SHA-256', workers=None,
+                 progress_callback=None, streaming=None):
+        """
+        Args:
+            workers: Number of processes used to parse the files in
+                folderToParse and extra_paths_to_parse, defaults to
+                settings.XML_GENERATOR_WORKERS
+            progress_callback: Called with the number of parsed files and
+                the total number of files to parse, e.g. DBTask.set_progress
+            streaming: Create and write the elements of each file one at a
+                time instead of keeping all of them in memory, defaults to
+                settings.XML_GENERATOR_STREAMING
+        """
 
         logger = logging.getLogger('essarch.essxml.generator')
+        if workers is None:
+            workers = getattr(settings, 'XML_GENERATOR_WORKERS', 1)
+        if streaming is None:
+            streaming = getattr(settings, 'XML_GENERATOR_STREAMING', False)
         self.toCreate = []
         for fname, content in filesToCreate.items():
             if os.path.isfile(fname):
@@ -767,77 +909,88 @@ class XMLGenerator:
 
         self.fid.allow_unknown_file_types = allow_unknown_file_types
 
-        if folderToParse:
-            folderToParse = str(folderToParse).rstrip('/')
-
-            external_dirs_files_to_create = {}
-            external = self.find_external_dirs()
-            if external:
-                external_gen = XMLGenerator()
-
-            for ext_dir, ext_file, ext_spec, ext_pointer, ext_data, ext_filters in external:
-                if ext_file:
-                    ext_root = os.path.join(folderToParse, ext_dir)
-                    try:
-                        ext_sub_dirs = next(walk(ext_root))[1]
-                    except StopIteration:
-                        logger.info('No directories found in {}'.format(ext_root))
-                    else:
-                        for sub_dir in ext_sub_dirs:
-                            generate_content_metadata_flag = True
-
-                            for key, file_filter in ext_filters.items():
-                                if key == 'GenerateContentMetadata' and not re.search(file_filter, sub_dir):
-                                    generate_content_metadata_flag = False
-
-                            ptr_file_path = os.path.join(ext_dir, sub_dir, ext_file)
-                            ptr_file_path = normalize_path(ptr_file_path)
-
-                            ext_info = copy.deepcopy(ext_data)
-                            ext_info['_EXT'] = sub_dir
-                            ext_info['_EXT_HREF'] = ptr_file_path
-
-                            full_xml_path = os.path.join(folderToParse, ptr_file_path)
-                            try:
-                                external_dirs_files_to_create[sub_dir][0][full_xml_path] = {
-                                    'spec': ext_spec, 'data': ext_info, 'ext_pointer': ext_pointer}
-                            except KeyError:
-                                external_dirs_files_to_create[sub_dir] = [{
-                                    full_xml_path: {
-                                        'spec': ext_spec, 'data': ext_info, 'ext_pointer': ext_pointer
-                                    }
-                                }, folderToParse, ext_dir, generate_content_metadata_flag]
-                            if generate_content_metadata_flag:
-                                try:
-                                    os.remove(full_xml_path)
-                                except FileNotFoundError:
-                                    pass
-
-            for sub_dir in sorted(external_dirs_files_to_create.keys()):
-                (external_files_to_create, folderToParse, ext_dir, generate_content_metadata_flag
-                 ) = external_dirs_files_to_create[sub_dir]
-                if generate_content_metadata_flag:
-                    external_gen.generate(external_files_to_create,
-                                          folderToParse=os.path.join(folderToParse, ext_dir, sub_dir))
-
-                for external_file_to_create in external_files_to_create.keys():
-                    if external_files_to_create[external_file_to_create]['ext_pointer'] is not None:
-                        ptr_file_path = os.path.relpath(external_file_to_create, folderToParse)
-                        fileinfo = parse_file(
-                            external_file_to_create, self.fid, ptr_file_path, algorithm=algorithm, rootdir=sub_dir,
-                        )
-                        files.append(fileinfo)
-
-            for file_to_append in parse_files(self.fid, folderToParse, external, algorithm, rootdir=""):
-                file_alreay_exists = False
-                for file_in_list in files:
-                    if file_in_list['href'] == file_to_append['href']:
-                        file_alreay_exists = True
-                if not file_alreay_exists:
-                    files.append(file_to_append)
+        started = time.time_ns()
+        executor = None
+        if workers > 1 and (folderToParse or extra_paths_to_parse):
+            executor = self._create_executor(workers)
 
-        for path in extra_paths_to_parse:
-            files.extend(parse_files(self.fid, path, external, algorithm, rootdir=path))
+        try:
+            if folderToParse:
+                folderToParse = str(folderToParse).rstrip('/')
+
+                external_dirs_files_to_create = {}
+                external = self.find_external_dirs()
+                if external:
+                    external_gen = XMLGenerator()
+
+                for ext_dir, ext_file, ext_spec, ext_pointer, ext_data, ext_filters in external:
+                    if ext_file:
+                        ext_root = os.path.join(folderToParse, ext_dir)
+                        try:
+                            ext_sub_dirs = next(walk(ext_root))[1]
+                        except StopIteration:
+                            logger.info('No directories found in {}'.format(ext_root))
+                        else:
+                            for sub_dir in ext_sub_dirs:
+                                generate_content_metadata_flag = True
+
+                                for key, file_filter in ext_filters.items():
+                                    if key == 'GenerateContentMetadata' and not re.search(file_filter, sub_dir):
+                                        generate_content_metadata_flag = False
+
+                                ptr_file_path = os.path.join(ext_dir, sub_dir, ext_file)
+                                ptr_file_path = normalize_path(ptr_file_path)
+
+                                ext_info = copy.deepcopy(ext_data)
+                                ext_info['_EXT'] = sub_dir
+                                ext_info['_EXT_HREF'] = ptr_file_path
+
+                                full_xml_path = os.path.join(folderToParse, ptr_file_path)
+                                try:
+                                    external_dirs_files_to_create[sub_dir][0][full_xml_path] = {
+                                        'spec': ext_spec, 'data': ext_info, 'ext_pointer': ext_pointer}
+                                except KeyError:
+                                    external_dirs_files_to_create[sub_dir] = [{
+                                        full_xml_path: {
+                                            'spec': ext_spec, 'data': ext_info, 'ext_pointer': ext_pointer
+                                        }
+                                    }, folderToParse, ext_dir, generate_content_metadata_flag]
+                                if generate_content_metadata_flag:
+                                    try:
+                                        os.remove(full_xml_path)
+                                    except FileNotFoundError:
+                                        pass
+
+                for sub_dir in sorted(external_dirs_files_to_create.keys()):
+                    (external_files_to_create, folderToParse, ext_dir, generate_content_metadata_flag
+                     ) = external_dirs_files_to_create[sub_dir]
+                    if generate_content_metadata_flag:
+                        external_gen.generate(external_files_to_create,
+                                              folderToParse=os.path.join(folderToParse, ext_dir, sub_dir),
+                                              workers=workers, streaming=streaming)
+
+                    for external_file_to_create in external_files_to_create.keys():
+                        if external_files_to_create[external_file_to_create]['ext_pointer'] is not None:
+                            ptr_file_path = os.path.relpath(external_file_to_create, folderToParse)
+                            fileinfo = parse_file(
+                                external_file_to_create, self.fid, ptr_file_path,
+                                algorithm=algorithm, rootdir=sub_dir,
+                            )
+                            files.append(fileinfo)
+
+                existing_hrefs = {f['href'] for f in files}
+                for file_to_append in parse_files(self.fid, folderToParse, external, algorithm, rootdir="",
+                                                  executor=executor, progress_callback=progress_callback):
+                    if file_to_append['href'] not in existing_hrefs:
+                        existing_hrefs.add(file_to_append['href'])
+                        files.append(file_to_append)
+
+            for path in extra_paths_to_parse:
+                files.extend(parse_files(self.fid, path, external, algorithm, rootdir=path,
+                                         executor=executor, progress_callback=progress_callback))
+        finally:
+            if executor is not None:
+                executor.shutdown()
 
         for idx, f in enumerate(self.toCreate):
             fname = f['file']
@@ -846,10 +999,24 @@ class XMLGenerator:
 
             data['_XML_FILENAME'] = os.path.basename(fname)
 
+            deferred = [] if streaming else None
             self.tree = etree.ElementTree(
-                rootEl.createLXMLElement(data, files=files, folderToParse=folderToParse, algorithm=algorithm)
+                rootEl.createLXMLElement(data, files=files, folderToParse=folderToParse, algorithm=algorithm,
+                                         deferred=deferred)
             )
-            self.write(fname)
+            self.write(fname, deferred=deferred)
+
+            # every file but the last is described in the following files and
+            # the manifest is keyed by the SHA-256 of the file, both checksums
+            # are calculated while reading the file once
+            parse_xml = idx < len(self.toCreate) - 1
+            cache_manifest = folderToParse and getattr(settings, 'FILE_MANIFEST_CACHE_TIMEOUT', 0)
+            algorithms = ([algorithm] if parse_xml else []) + (['SHA-256'] if cache_manifest else [])
+            digests = calculate_checksums(fname, algorithms) if algorithms else {}
+
+            if cache_manifest:
+                cache_file_manifest(fname, files, folderToParse, not_modified_since=started,
+                                    xml_checksum=digests['SHA-256'])
 
             if relpath:
                 relfilepath = os.path.relpath(fname, relpath)
@@ -858,13 +1025,60 @@ class XMLGenerator:
             else:
                 relfilepath = fname
 
-            if idx < len(self.toCreate) - 1:
-                fileinfo = parse_file(fname, self.fid, relfilepath, algorithm=algorithm)
+            if parse_xml:
+                fileinfo = parse_file(fname, self.fid, relfilepath, algorithm=algorithm,
+                                      provided_data={'FChecksum': digests[algorithm]})
                 files.append(fileinfo)
 
-    def write(self, filepath):
+    @staticmethod
+    def _write_deferred_elements(f, placeholder, elements):
+        # Each element is serialized inside empty copies of the ancestors of
+        # the placeholder to get the same indentation and namespace
+        # declarations as if it had been a part of the tree
+
+        ancestors = list(placeholder.iterancestors())[::-1]
+        depth = len(ancestors)
+        wrapper = innermost = None
+        for ancestor in ancestors:
+            el = etree.Element(ancestor.tag, nsmap=ancestor.nsmap)
+            if wrapper is None:
+                wrapper = el
+            else:
+                innermost.append(el)
+            innermost = el
+
+        for el in elements:
+            innermost.append(el)
+            lines = etree.tostring(wrapper, pretty_print=True, encoding='UTF-8', xml_declaration=False).split(b'\n')
+            f.write(b'\n'.join(lines[depth:-depth - 1]) + b'\n')
+            innermost.remove(el)
+
+    def _write_with_deferred_elements(self, f, deferred):
+        for placeholder, elements in deferred:
+            parent = placeholder.getparent()
+            if parent.text or any(child.tail for child in parent):
+                # Mixed content is not pretty printed, create the elements
+                # in the tree instead
+                idx = parent.index(placeholder)
+                parent.remove(placeholder)
+                for offset, el in enumerate(elements):
+                    parent.insert(idx + offset, el)
+
+        skeleton = etree.tostring(self.tree, pretty_print=True, xml_declaration=True, encoding='UTF-8')
+        pos = 0
+        for match in deferred_elements_re.finditer(skeleton):
+            f.write(skeleton[pos:match.start()])
+            placeholder, elements = deferred[int(match.group(1))]
+            self._write_deferred_elements(f, placeholder, elements)
+            pos = match.end()
+        f.write(skeleton[pos:])
+
+    def write(self, filepath, deferred=None):
         with open(filepath, 'wb') as f:
-            self.tree.write(f, pretty_print=True, xml_declaration=True, encoding='UTF-8')
+            if deferred:
+                self._write_with_deferred_elements(f, deferred)
+            else:
+                self.tree.write(f, pretty_print=True, xml_declaration=True, encoding='UTF-8')
             f.flush()              # Flush Python buffer
             os.fsync(f.fileno())   # Flush OS buffer to disk
         timeout = 30  # seconds
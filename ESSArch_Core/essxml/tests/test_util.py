@@ -27,10 +27,13 @@ import shutil
 import tempfile
 from unittest import mock
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from lxml import etree
 
 from ESSArch_Core.essxml.util import (
+    XMLFileIndex,
+    _compile_xmlschema,
+    clear_xmlschema_cache,
     find_file,
     find_files,
     get_agent,
@@ -39,6 +42,7 @@ from ESSArch_Core.essxml.util import (
     get_objectpath,
     parse_reference_code,
     parse_submit_description,
+    validate_against_schema,
 )
 
 
@@ -259,6 +263,76 @@ class FindFileTestCase(TestCase):
         found = find_file('3.txt', xmlfile=xmlfile, rootdir=self.datadir)
         self.assertIsNone(found)
 
+    def write_xml(self, xmlfile, files, pointers=()):
+        with open(xmlfile, 'w') as xml:
+            xml.write('<root xmlns:xlink="http://www.w3.org/1999/xlink">')
+            for name, checksum, size in files:
+                xml.write(
+                    '<file CHECKSUM="{checksum}" CHECKSUMTYPE="MD5" SIZE="{size}">'
+                    '<FLocat xlink:href="file:///{name}"/></file>'.format(name=name, checksum=checksum, size=size)
+                )
+            for pointer in pointers:
+                xml.write('<mptr xlink:href="file:///{}"/>'.format(pointer))
+            xml.write('</root>')
+
+    @mock.patch('ESSArch_Core.essxml.util.XMLFileIndex', side_effect=XMLFileIndex)
+    def test_xml_file_indexed_once(self, mock_index):
+        xmlfile = os.path.join(self.datadir, "test.xml")
+        self.write_xml(xmlfile, [('%s.txt' % i, 'ABC%s' % i, i) for i in range(10)])
+
+        indexes = {}
+        for i in range(10):
+            xml_el, el = find_file('%s.txt' % i, xmlfile=xmlfile, indexes=indexes)
+            self.assertEqual(xml_el.path, '%s.txt' % i)
+            self.assertEqual(xml_el.checksum, 'abc%s' % i)
+            self.assertEqual(xml_el.checksum_type, 'md5')
+            self.assertEqual(xml_el.size, i)
+            self.assertEqual(el.xpath('local-name()'), 'file')
+
+        mock_index.assert_called_once()
+
+    @mock.patch('ESSArch_Core.essxml.util.XMLFileIndex', side_effect=XMLFileIndex)
+    def test_xml_file_not_kept_without_indexes(self, mock_index):
+        xmlfile = os.path.join(self.datadir, "test.xml")
+        self.write_xml(xmlfile, [('1.txt', 'abc', 1)])
+
+        find_file('1.txt', xmlfile=xmlfile)
+        find_file('1.txt', xmlfile=xmlfile)
+        self.assertEqual(mock_index.call_count, 2)
+
+    @mock.patch('ESSArch_Core.essxml.util.XMLFileIndex', side_effect=XMLFileIndex)
+    def test_tree_indexed_once(self, mock_index):
+        xmlfile = os.path.join(self.datadir, "test.xml")
+        self.write_xml(xmlfile, [('%s.txt' % i, 'ABC%s' % i, i) for i in range(3)])
+        tree = etree.parse(xmlfile)
+
+        indexes = {}
+        for i in range(3):
+            xml_el, _ = find_file('%s.txt' % i, tree=tree, indexes=indexes)
+            self.assertEqual(xml_el.checksum, 'abc%s' % i)
+
+        mock_index.assert_called_once()
+
+    def test_modified_xml_file_is_reindexed(self):
+        xmlfile = os.path.join(self.datadir, "test.xml")
+        self.write_xml(xmlfile, [('1.txt', 'abc', 1)])
+        indexes = {}
+        self.assertEqual(find_file('1.txt', xmlfile=xmlfile, indexes=indexes)[0].checksum, 'abc')
+
+        st = os.stat(xmlfile)
+        self.write_xml(xmlfile, [('1.txt', 'def', 1)])
+        os.utime(xmlfile, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+        self.assertEqual(find_file('1.txt', xmlfile=xmlfile, indexes=indexes)[0].checksum, 'def')
+
+    def test_file_in_pointed_xml(self):
+        xmlfile = os.path.join(self.datadir, "test.xml")
+        self.write_xml(xmlfile, [('1.txt', 'abc', 1)], pointers=['sub.xml'])
+        self.write_xml(os.path.join(self.datadir, "sub.xml"), [('2.txt', 'def', 2)])
+
+        xml_el, _ = find_file('2.txt', xmlfile=xmlfile, rootdir=self.datadir)
+        self.assertEqual(xml_el.checksum, 'def')
+        self.assertIsNone(find_file('3.txt', xmlfile=xmlfile, rootdir=self.datadir))
+
 
 class GetAltrecordidTestCase(TestCase):
     def test_existing(self):
@@ -561,3 +635,79 @@ class ParseSubmitDescriptionTestCase(TestCase):
         self.xmlfile.close()
         ip = parse_submit_description(self.xmlfile.name)
         self.assertEqual(ip['information_class'], 123)
+
+
+class ValidateAgainstSchemaTestCase(TestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+        self.addCleanup(clear_xmlschema_cache)
+
+        self.schema = os.path.join(self.datadir, 'item.xsd')
+        self.create_schema(self.schema, 'xs:decimal')
+
+    def create_schema(self, path, price_type):
+        with open(path, 'w') as f:
+            f.write("""<?xml version="1.0" encoding="UTF-8"?>
+            <xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema"
+                       xmlns:tns="test/namespace" targetNamespace="test/namespace">
+                <xs:element name="item">
+                  <xs:complexType>
+                    <xs:sequence>
+                      <xs:element name="price" type="%s"/>
+                    </xs:sequence>
+                  </xs:complexType>
+                </xs:element>
+            </xs:schema>
+            """ % price_type)
+
+    def create_xml(self, path, price):
+        with open(path, 'w') as f:
+            f.write("""<?xml version="1.0" encoding="UTF-8"?>
+            <tns:item xmlns:tns="test/namespace"
+                      xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+                      xsi:schemaLocation="test/namespace item.xsd">
+                <price>%s</price>
+            </tns:item>
+            """ % price)
+
+        return path
+
+    @mock.patch('ESSArch_Core.essxml.util._compile_xmlschema', side_effect=_compile_xmlschema)
+    def test_schema_compiled_once(self, mock_compile):
+        for i in range(3):
+            xmlfile = self.create_xml(os.path.join(self.datadir, '%s.xml' % i), i)
+            validate_against_schema(xmlfile, rootdir=self.datadir)
+
+        mock_compile.assert_called_once()
+
+        bad = self.create_xml(os.path.join(self.datadir, 'bad.xml'), 'foo')
+        with self.assertRaises(etree.DocumentInvalid):
+            validate_against_schema(bad, rootdir=self.datadir)
+
+        mock_compile.assert_called_once()
+
+    @mock.patch('ESSArch_Core.essxml.util._compile_xmlschema', side_effect=_compile_xmlschema)
+    def test_explicit_schema_compiled_once(self, mock_compile):
+        xmlfile = self.create_xml(os.path.join(self.datadir, 'foo.xml'), 1)
+        validate_against_schema(xmlfile, self.schema, rootdir=self.datadir)
+        validate_against_schema(xmlfile, self.schema, rootdir=self.datadir)
+
+        mock_compile.assert_called_once()
+
+    def test_modified_schema_is_recompiled(self):
+        xmlfile = self.create_xml(os.path.join(self.datadir, 'foo.xml'), 'foo')
+        with self.assertRaises(etree.DocumentInvalid):
+            validate_against_schema(xmlfile, rootdir=self.datadir)
+
+        self.create_schema(self.schema, 'xs:string')
+        validate_against_schema(xmlfile, rootdir=self.datadir)
+
+    @override_settings(XML_SCHEMA_CACHE_SIZE=0)
+    @mock.patch('ESSArch_Core.essxml.util._compile_xmlschema', side_effect=_compile_xmlschema)
+    def test_cache_disabled(self, mock_compile):
+        xmlfile = self.create_xml(os.path.join(self.datadir, 'foo.xml'), 1)
+        validate_against_schema(xmlfile, rootdir=self.datadir)
+        validate_against_schema(xmlfile, rootdir=self.datadir)
+
+        self.assertEqual(mock_compile.call_count, 2)
@@ -22,14 +22,20 @@
     Email - essarch@essolutions.se
 """
 
+import hashlib
 import logging
 import os
 import re
 import tempfile
+import threading
 import uuid
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
 from urllib.parse import unquote, urlparse
 
+from django.conf import settings
+from django.core.cache import cache
 from lxml import etree
 
 from ESSArch_Core.fixity import checksum
@@ -47,6 +53,10 @@ from ESSArch_Core.util import (
 XSD_NAMESPACE = "http://www.w3.org/2001/XMLSchema"
 XSI_NAMESPACE = "http://www.w3.org/2001/XMLSchema-instance"
 
+# Compiled schemas, keyed by the locations and content of the schemas they were compiled from
+_xmlschema_cache = OrderedDict()
+_xmlschema_cache_lock = threading.Lock()
+
 # File elements in different metadata standards
 FILE_ELEMENTS = {
     "file": {
@@ -364,42 +374,110 @@ def find_pointers(xmlfile=None, tree=None):
         yield from find_pointer(tree, elname, props)
 
 
-def find_file(filepath, xmlfile=None, tree=None, rootdir='', prefix=''):
-    if xmlfile is None and tree is None:
-        raise ValueError("Need xmlfile or tree, both can't be None")
-
-    if xmlfile is not None:
-        tree = etree.ElementTree(file=xmlfile)
-
-    root = tree.getroot()
+class XMLFileIndex:
+    """
+    A parsed XML file with its file elements indexed by their paths, allowing
+    files to be looked up without searching the whole document
+    """
 
-    for elname, props in FILE_ELEMENTS.items():
-        for prefix in props.get('pathprefix', []) + ['']:
-            fullpath = prefix + filepath
+    def __init__(self, tree):
+        self.tree = tree
+        self.files = {}  # Map path -> (element, props)
 
+        root = tree.getroot()
+        for elname, props in FILE_ELEMENTS.items():
             props_paths = props.get('path')
             if isinstance(props_paths, str):
                 props_paths = [props_paths]
 
-            for props_path in props_paths:
-                el = get_elements_without_namespace(root, '%s/%s' % (elname, props_path), fullpath)
-                if len(el) > 0:
-                    el = el[0]
-                    while el.xpath('local-name()') != elname:
-                        el = el.getparent()
-                    xml_el = XMLFileElement(el, props, path=filepath)
-                    return xml_el, el
-
-    for pointer in find_pointers(tree=tree):
-        pointer_prefix = os.path.split(pointer.path)[0]
-        xml_el, el = find_file(
+            for prefix in props.get('pathprefix', []) + ['']:
+                for props_path in props_paths:
+                    path = '%s/%s' % (elname, props_path)
+                    for el in get_elements_without_namespace(root, path):
+                        for value in self._get_path_values(el, path):
+                            if not value.startswith(prefix):
+                                continue
+
+                            # the first matching element takes precedence, as when searching the document
+                            key = value[len(prefix):]
+                            if key not in self.files:
+                                file_el = el
+                                while file_el.xpath('local-name()') != elname:
+                                    file_el = file_el.getparent()
+                                self.files[key] = (file_el, props)
+
+        self.pointers = [pointer.path for pointer in find_pointers(tree=tree)]
+
+    @staticmethod
+    def _get_path_values(el, path):
+        last = path.split('/')[-1]
+        if '@' in last:
+            _, attr = last.split('@')
+            return el.xpath('@*[local-name()="{attr}"]'.format(attr=attr))
+
+        return el.xpath('text()')
+
+    def find(self, filepath):
+        try:
+            el, props = self.files[filepath]
+        except KeyError:
+            return None, None
+
+        return XMLFileElement(el, props, path=filepath), el
+
+
+def get_xml_file_index(xmlfile=None, tree=None, indexes=None):
+    """
+    Gets the index of the XML file or tree.
+
+    Args:
+        indexes: A dict in which the indexes are kept between calls, e.g. for
+            the lifetime of a validator. Indexes of files are rebuilt when
+            the files are changed
+    """
+
+    if tree is not None:
+        key, stamp = tree, None
+    else:
+        st = os.stat(xmlfile)
+        key, stamp = os.path.abspath(xmlfile), (st.st_mtime_ns, st.st_size)
+
+    if indexes is not None:
+        cached = indexes.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+    index = XMLFileIndex(tree if tree is not None else etree.ElementTree(file=xmlfile))
+    if indexes is not None:
+        indexes[key] = (stamp, index)
+
+    return index
+
+
+def find_file(filepath, xmlfile=None, tree=None, rootdir='', prefix='', indexes=None):
+    if xmlfile is None and tree is None:
+        raise ValueError("Need xmlfile or tree, both can't be None")
+
+    if xmlfile is not None:
+        index = get_xml_file_index(xmlfile, indexes=indexes)
+    else:
+        index = get_xml_file_index(tree=tree, indexes=indexes)
+
+    xml_el, el = index.find(filepath)
+    if xml_el is not None:
+        return xml_el, el
+
+    for pointer_path in index.pointers:
+        pointer_prefix = os.path.split(pointer_path)[0]
+        found = find_file(
             filepath,
-            xmlfile=os.path.join(rootdir, pointer.path),
+            xmlfile=os.path.join(rootdir, pointer_path),
             rootdir=rootdir,
-            prefix=pointer_prefix
+            prefix=pointer_prefix,
+            indexes=indexes,
         )
-        if xml_el is not None:
-            return xml_el, el
+        if found is not None and found[0] is not None:
+            return found
 
 
 def find_files(xmlfile, rootdir='', prefix='', skip_files=None, recursive=True, current_dir=None):
@@ -438,7 +516,7 @@ def find_files(xmlfile, rootdir='', prefix='', skip_files=None, recursive=True,
             file_num += 1
 
     if recursive:
-        for pointer in find_pointers(xmlfile=xmlfile):
+        for pointer in find_pointers(tree=doc):
             current_pointer_dir = os.path.join(current_dir, os.path.dirname(pointer.path))
             pointer_path = os.path.join(current_pointer_dir, os.path.basename(pointer.path))
 
@@ -465,6 +543,46 @@ def find_files(xmlfile, rootdir='', prefix='', skip_files=None, recursive=True,
     return files
 
 
+def analyse_file(filepath, fid, algorithm='SHA-256', provided_data=None):
+    """
+    Does the heavy computations needed to describe the given file, i.e.
+    creation date, checksum, encryption and format identification. Values
+    already included in provided_data are skipped.
+
+    This does not touch the database which makes it safe to run in worker
+    processes.
+    """
+
+    if provided_data is None:
+        provided_data = {}
+
+    fileinfo = {}
+
+    if 'FCreated' not in provided_data:
+        timestamp = creation_date(filepath)
+        createdate = timestamp_to_datetime(timestamp)
+        fileinfo['FCreated'] = createdate.isoformat()
+
+    if 'FChecksum' not in provided_data:
+        fileinfo['FChecksum'] = checksum.calculate_checksum(filepath, algorithm)
+
+    if 'FEncrypted' not in provided_data:
+        fileinfo['FEncrypted'] = fid.identify_file_encryption(filepath)
+
+    if any(x not in provided_data for x in ['FFormatName', 'FFormatVersion', 'FFormatRegistryKey']):
+        (format_name, format_version, format_registry_key) = fid.identify_file_format(
+            filepath,
+            checksum=provided_data.get('FChecksum', fileinfo.get('FChecksum')),
+            algorithm=provided_data.get('FChecksumType', algorithm),
+        )
+
+        fileinfo['FFormatName'] = format_name
+        fileinfo['FFormatVersion'] = format_version
+        fileinfo['FFormatRegistryKey'] = format_registry_key
+
+    return fileinfo
+
+
 def parse_file(filepath, fid, relpath=None, algorithm='SHA-256', rootdir='', provided_data=None):
     if not relpath:
         relpath = filepath
@@ -482,7 +600,6 @@ def parse_file(filepath, fid, relpath=None, algorithm='SHA-256', rootdir='', pro
         'FID': str(uuid.uuid4()),
         'daotype': "borndigital",
         'href': relpath,
-        'FMimetype': fid.get_mimetype(filepath),
         'FSize': str(os.path.getsize(filepath)),
         'FUse': 'Datafile',
         'FChecksumType': algorithm,
@@ -492,31 +609,87 @@ def parse_file(filepath, fid, relpath=None, algorithm='SHA-256', rootdir='', pro
         'FIDType': 'UUID',
     }
 
+    if 'FMimetype' not in provided_data:
+        fileinfo['FMimetype'] = fid.get_mimetype(filepath)
+
     # We only do heavy computations if their values aren't included in
     # provided_data
+    fileinfo.update(analyse_file(filepath, fid, algorithm=algorithm, provided_data=provided_data))
 
-    if 'FCreated' not in provided_data:
-        timestamp = creation_date(filepath)
-        createdate = timestamp_to_datetime(timestamp)
-        fileinfo['FCreated'] = createdate.isoformat()
+    for key, value in provided_data.items():
+        fileinfo[key] = value
 
-    if 'FChecksum' not in provided_data:
-        fileinfo['FChecksum'] = checksum.calculate_checksum(filepath, algorithm)
+    return fileinfo
 
-    if 'FEncrypted' not in provided_data:
-        fileinfo['FEncrypted'] = fid.identify_file_encryption(filepath)
 
-    if any(x not in provided_data for x in ['FFormatName', 'FFormatVersion', 'FFormatRegistryKey']):
-        (format_name, format_version, format_registry_key) = fid.identify_file_format(filepath)
+def _get_file_manifest_cache_key(xml_checksum):
+    return 'file_manifest_{}'.format(xml_checksum)
 
-        fileinfo['FFormatName'] = format_name
-        fileinfo['FFormatVersion'] = format_version
-        fileinfo['FFormatRegistryKey'] = format_registry_key
 
-    for key, value in provided_data.items():
-        fileinfo[key] = value
+def cache_file_manifest(xmlfile, files, rootdir, not_modified_since=None, xml_checksum=None):
+    """
+    Caches a snapshot of the size and modification time of each file
+    described in the XML file together with its checksum. This allows the
+    files to later be compared to the XML without reading unchanged files.
+
+    The snapshot is keyed by the checksum of the XML file and is therefore
+    only used as long as the XML file is unchanged.
+
+    Args:
+        xmlfile: The generated XML file
+        files: The parsed files described in the XML file
+        rootdir: The directory the paths of the files are relative to
+        not_modified_since: Files modified at or after this time, in
+            nanoseconds since the epoch, are left out of the snapshot since
+            they might have changed after their checksum was calculated
+        xml_checksum: The SHA-256 checksum of the XML file, if already known
+    """
+
+    timeout = getattr(settings, 'FILE_MANIFEST_CACHE_TIMEOUT', 0)
+    if not timeout:
+        return
+
+    manifest = {}
+    for fileinfo in files:
+        href = fileinfo.get('href')
+        if not href or 'FChecksum' not in fileinfo:
+            continue
+
+        try:
+            st = os.stat(os.path.join(fileinfo.get('FDir') or rootdir, href))
+        except OSError:
+            continue
+
+        if str(st.st_size) != str(fileinfo.get('FSize')):
+            continue
+
+        if not_modified_since is not None and st.st_mtime_ns >= not_modified_since:
+            continue
+
+        manifest[normalize_path(href)] = [
+            st.st_size, st.st_mtime_ns, fileinfo['FChecksum'].lower(), fileinfo.get('FChecksumType'),
+        ]
+
+    if xml_checksum is None:
+        xml_checksum = checksum.calculate_checksum(xmlfile, 'SHA-256')
+    cache.set(_get_file_manifest_cache_key(xml_checksum), manifest, timeout)
 
-    return fileinfo
+
+def get_file_manifest(xmlfile):
+    """
+    Gets the cached snapshot of the files described in the XML file
+
+    Returns:
+        A dict mapping the path of each file to a list of its size,
+        modification time (ns), checksum and checksum algorithm when the XML
+        was generated, or None if there is no snapshot
+    """
+
+    if not getattr(settings, 'FILE_MANIFEST_CACHE_TIMEOUT', 0):
+        return None
+
+    xml_checksum = checksum.calculate_checksum(xmlfile, 'SHA-256')
+    return cache.get(_get_file_manifest_cache_key(xml_checksum))
 
 
 def download_imported_schemas(schema_tree, dst, rootdir=None):
@@ -557,20 +730,131 @@ def download_imported_schemas(schema_tree, dst, rootdir=None):
     return schema_tree
 
 
-def validate_against_schema(xmlfile, schema=None, rootdir=None):
-    """
-    Validate an XML file against a schema. Downloads remote schemas if needed.
-    """
-    doc = etree.parse(xmlfile)
+def clear_xmlschema_cache():
+    with _xmlschema_cache_lock:
+        _xmlschema_cache.clear()
+
+
+def _is_remote_schema(location):
+    return location.startswith('http://') or location.startswith('https://')
+
+
+def _resolve_schema_location(location, rootdir=None):
+    if rootdir and not _is_remote_schema(location) and not os.path.isabs(location):
+        return os.path.abspath(os.path.join(rootdir, location))
+    return location
+
+
+@lru_cache(maxsize=256)
+def _hash_schema_file(path, mtime_ns, size):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _get_schema_digest(location):
+    if _is_remote_schema(location):
+        return None
+
+    try:
+        st = os.stat(location)
+    except OSError:
+        return None
+
+    return _hash_schema_file(os.path.abspath(location), st.st_mtime_ns, st.st_size)
+
+
+def _get_schema_locations(doc, rootdir=None):
+    xsi_ns = doc.getroot().nsmap.get('xsi')
+    if xsi_ns is None:
+        raise ValueError("No xsi namespace found in document")
+
+    locations = set()
+    for schema_location in doc.xpath("//*/@xsi:schemaLocation", namespaces={'xsi': xsi_ns}):
+        ns_locs = schema_location.split()
+        for ns, loc in zip(ns_locs[::2], ns_locs[1::2]):
+            locations.add((ns, _resolve_schema_location(loc, rootdir)))
+
+    return sorted(locations)
+
+
+def _compile_xmlschema(doc, schema=None, rootdir=None):
+    visited = set()
 
     if schema:
         xmlschema_tree = etree.parse(schema)
+        visited.add(os.path.abspath(schema))
     else:
-        xmlschema_tree = getSchemas(doc=doc, rootdir=rootdir)
+        xmlschema_tree = getSchemas(doc=doc, rootdir=rootdir, visited=visited)
 
     with tempfile.TemporaryDirectory() as tempdir:
         xmlschema_tree = download_imported_schemas(xmlschema_tree, tempdir, rootdir=rootdir)
         xmlschema = etree.XMLSchema(xmlschema_tree)
+
+    dependencies = {}
+    for location in visited:
+        location = _resolve_schema_location(location, rootdir)
+        dependencies[location] = _get_schema_digest(location)
+
+    return xmlschema, dependencies
+
+
+def _get_xmlschema(doc, schema=None, rootdir=None):
+    """
+    Gets the compiled schema for the document, either from the cache or by
+    compiling it.
+
+    The cache is keyed by the schema locations used by the document and the
+    content of the local schemas among them. A cached schema is recompiled if
+    any local schema it was compiled from, including imported and included
+    ones, has changed since.
+
+    Returns:
+        A tuple of the compiled schema and a lock that must be held when using
+        it, since a compiled schema can't be used by multiple threads at once
+    """
+
+    cache_size = getattr(settings, 'XML_SCHEMA_CACHE_SIZE', 32)
+    if cache_size <= 0:
+        xmlschema, _dependencies = _compile_xmlschema(doc, schema, rootdir)
+        return xmlschema, threading.Lock()
+
+    if schema:
+        locations = [(None, os.path.abspath(schema))]
+    else:
+        locations = _get_schema_locations(doc, rootdir)
+
+    key = (rootdir, tuple((ns, loc, _get_schema_digest(loc)) for ns, loc in locations))
+
+    with _xmlschema_cache_lock:
+        entry = _xmlschema_cache.get(key)
+        if entry is not None:
+            _xmlschema_cache.move_to_end(key)
+
+    if entry is not None:
+        xmlschema, dependencies, lock = entry
+        if all(_get_schema_digest(loc) == digest for loc, digest in dependencies.items()):
+            return xmlschema, lock
+
+    xmlschema, dependencies = _compile_xmlschema(doc, schema, rootdir)
+    lock = threading.Lock()
+
+    with _xmlschema_cache_lock:
+        _xmlschema_cache[key] = (xmlschema, dependencies, lock)
+        _xmlschema_cache.move_to_end(key)
+        while len(_xmlschema_cache) > cache_size:
+            _xmlschema_cache.popitem(last=False)
+
+    return xmlschema, lock
+
+
+def validate_against_schema(xmlfile, schema=None, rootdir=None):
+    """
+    Validate an XML file against a schema. Downloads remote schemas if needed.
+    """
+    doc = etree.parse(xmlfile)
+
+    xmlschema, lock = _get_xmlschema(doc, schema, rootdir)
+    with lock:
         xmlschema.assertValid(doc)
 
     if rootdir is None:
@@ -1,11 +1,20 @@
 import hashlib
 import logging
 import os
+import platform
 import time
 
+from django.conf import settings
+from django.core.cache import cache
+
 from ESSArch_Core.util import pretty_mb_per_sec, pretty_time_to_sec
 
 MB = 1024 * 1024
+DEFAULT_BLOCK_SIZE = 1 * MB
+
+# Files modified this recently are never cached since a write within the
+# same mtime tick would not be visible in the stat result
+CHECKSUM_CACHE_MIN_AGE = 2
 
 
 def alg_from_str(algname):
@@ -24,36 +33,27 @@ def alg_from_str(algname):
         raise KeyError("Algorithm %s does not exist" % algname)
 
 
-def calculate_checksum(filename, algorithm='SHA-256', block_size=65536):
-    """
-    Calculates the checksum for the given file, one chunk at a time
-
-    Args:
-        filename: The filename to calculate checksum for
-        block_size: The size of the chunk to calculate
-        algorithm: The algorithm to use
-
-    Returns:
-        The hexadecimal digest of the checksum
-    """
-
+def _calculate_checksums(filename, algorithms, block_size):
     logger = logging.getLogger('essarch.fixity.checksum')
-    hash_val = alg_from_str(algorithm)()
+    hash_vals = [alg_from_str(algorithm)() for algorithm in algorithms]
 
     if os.name == 'nt':
         start_time = time.perf_counter()
     else:
         start_time = time.time()
 
-    logger.debug("Calculaing checksum for %s with %s ..." % (filename, algorithm))
+    logger.debug("Calculating checksums for %s with %s ..." % (filename, ', '.join(algorithms)))
 
-    with open(filename, 'rb') as f:
+    buf = bytearray(block_size)
+    view = memoryview(buf)
+    with open(filename, 'rb', buffering=0) as f:
         while True:
-            data = f.read(block_size)
-            if data:
-                hash_val.update(data)
-            else:
+            read = f.readinto(buf)
+            if not read:
                 break
+            data = view[:read]
+            for hash_val in hash_vals:
+                hash_val.update(data)
 
     if os.name == 'nt':
         end_time = time.perf_counter()
@@ -68,11 +68,93 @@ def calculate_checksum(filename, algorithm='SHA-256', block_size=65536):
     except ZeroDivisionError:
         mb_per_sec = size_mb
 
-    digest = hash_val.hexdigest()
+    digests = {algorithm: hash_val.hexdigest() for algorithm, hash_val in zip(algorithms, hash_vals)}
     logger.info(
-        "Calculated checksum for %s with %s at %s MB/Sec (%s sec): %s" % (
-            filename, algorithm, pretty_mb_per_sec(mb_per_sec), pretty_time_to_sec(time_elapsed), digest
+        "Calculated checksums for %s with %s at %s MB/Sec (%s sec): %s" % (
+            filename, ', '.join(algorithms), pretty_mb_per_sec(mb_per_sec), pretty_time_to_sec(time_elapsed),
+            ', '.join(digests.values()),
         )
     )
 
-    return digest
+    return digests
+
+
+def _get_file_identity(st):
+    # the mtime can be set to any value, e.g. when extracting archives, but the
+    # ctime is always updated when the file or its mtime changes
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+
+
+def _get_checksum_cache_key(st, algorithm):
+    return 'checksum_{}_{}_{}_{}_{}_{}_{}'.format(platform.node(), *_get_file_identity(st), algorithm.upper())
+
+
+def _is_cacheable(st):
+    return time.time_ns() - max(st.st_mtime_ns, st.st_ctime_ns) > CHECKSUM_CACHE_MIN_AGE * 1e9
+
+
+def calculate_checksums(filename, algorithms=('SHA-256',), block_size=DEFAULT_BLOCK_SIZE, use_cache=True):
+    """
+    Calculates the checksums for the given file with every given algorithm
+    while only reading the file once.
+
+    Checksums are cached using the device, inode, size, modification time and
+    status change time of the file as key. Any change to these invalidates
+    the cached value.
+
+    Args:
+        filename: The filename to calculate checksums for
+        algorithms: The algorithms to use
+        block_size: The size of the chunks read from the file
+        use_cache: Whether to read and write checksums from and to the cache
+
+    Returns:
+        A dict mapping each algorithm to the hexadecimal digest of the checksum
+    """
+
+    algorithms = list(dict.fromkeys(algorithms))
+    timeout = getattr(settings, 'CHECKSUM_CACHE_TIMEOUT', None)
+
+    if not use_cache or not timeout:
+        return _calculate_checksums(filename, algorithms, block_size)
+
+    st = os.stat(filename)
+    cache_keys = {algorithm: _get_checksum_cache_key(st, algorithm) for algorithm in algorithms}
+    cached = cache.get_many(cache_keys.values())
+    digests = {
+        algorithm: cached[cache_key]
+        for algorithm, cache_key in cache_keys.items() if cache_key in cached
+    }
+
+    missing = [algorithm for algorithm in algorithms if algorithm not in digests]
+    if not missing:
+        logging.getLogger('essarch.fixity.checksum').debug(
+            "Using cached checksums for %s with %s" % (filename, ', '.join(algorithms))
+        )
+        return digests
+
+    digests.update(_calculate_checksums(filename, missing, block_size))
+
+    # only cache the result if the file was left untouched while we read it
+    if _get_file_identity(os.stat(filename)) == _get_file_identity(st) and _is_cacheable(st):
+        cache.set_many({cache_keys[algorithm]: digests[algorithm] for algorithm in missing}, timeout)
+
+    return {algorithm: digests[algorithm] for algorithm in algorithms}
+
+
+def calculate_checksum(filename, algorithm='SHA-256', block_size=DEFAULT_BLOCK_SIZE, use_cache=True):
+    """
+    Calculates the checksum for the given file, one chunk at a time
+
+    Args:
+        filename: The filename to calculate checksum for
+        block_size: The size of the chunk to calculate
+        algorithm: The algorithm to use
+        use_cache: Whether to read and write the checksum from and to the cache
+
+    Returns:
+        The hexadecimal digest of the checksum
+    """
+
+    checksums = calculate_checksums(filename, algorithms=[algorithm], block_size=block_size, use_cache=use_cache)
+    return checksums[algorithm]
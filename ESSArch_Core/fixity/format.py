@@ -1,9 +1,14 @@
+import hashlib
 import logging
 import mimetypes
 import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from django.conf import settings
+from django.core.cache import cache
+from fido import __version__ as fido_version
 from fido.fido import Fido
 from fido.versions import get_local_versions
 
@@ -19,9 +24,75 @@ from ESSArch_Core.fixity.validation.backends.encryption import (
 MB = 1024 * 1024
 DEFAULT_MIMETYPE = 'application/octet-stream'
 
+# The mimetypes_definitionfile path is looked up again at most this often (in
+# seconds) by each process, changes to the file itself are detected directly
+MIMETYPES_PATH_CACHE_TIMEOUT = 30
+
+# Files larger than this are only looked up in the format cache when their
+# checksum is already known, hashing them would be slower than running fido
+FORMAT_CACHE_MAX_HASH_SIZE = 16 * MB
+
+_mimetypes_cache = {}
+_mimetypes_lock = threading.Lock()
+
+_signatures_cache = {}
+_signatures_lock = threading.Lock()
+
+
+def clear_mimetypes_cache():
+    with _mimetypes_lock:
+        _mimetypes_cache.clear()
+
+
+def _get_mtime(path):
+    if path is None:
+        return None
+
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _get_size(path):
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return None
+
+
+def _get_signature_version(signature_files):
+    """
+    Returns a digest of the fido version and the content of the given
+    signature files. It is recalculated when the size or modification time of
+    any of the files changes.
+    """
+
+    identity = tuple((path, _get_mtime(path), _get_size(path)) for path in signature_files)
+    version = _signatures_cache.get(identity)
+    if version is not None:
+        return version
+
+    with _signatures_lock:
+        h = hashlib.sha256(fido_version.encode())
+        for path in signature_files:
+            h.update(path.encode())
+            try:
+                with open(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(MB), b''):
+                        h.update(chunk)
+            except OSError:
+                pass
+
+        version = h.hexdigest()[:16]
+        _signatures_cache[identity] = version
+
+    return version
+
 
 class FormatIdentifier:
     _fido = None
+    _signature_files = None
 
     def __init__(self, allow_unknown_file_types=False, allow_encrypted_files=False,
                  use_fido_pronom_formats=True, use_fido_extension_formats=True,
@@ -31,6 +102,21 @@ class FormatIdentifier:
         self.use_fido_pronom_formats = use_fido_pronom_formats
         self.use_fido_extension_formats = use_fido_extension_formats
         self.use_ess_formats = use_ess_formats
+        self._fido_lock = threading.Lock()
+
+    def _get_signature_files(self):
+        signature_files = []
+        if self.use_fido_pronom_formats or self.use_fido_extension_formats:
+            versions = get_local_versions()
+            if self.use_fido_pronom_formats:
+                signature_files.append(os.path.join(versions.conf_dir, versions.pronom_signature))
+            if self.use_fido_extension_formats:
+                signature_files.append(os.path.join(versions.conf_dir, versions.fido_extension_signature))
+
+        if self.use_ess_formats:
+            signature_files.append(os.path.join(settings.CONFIG_DIR, 'file_formats.xml'))
+
+        return signature_files
 
     @property
     def fido(self):
@@ -58,37 +144,71 @@ class FormatIdentifier:
             logger.info('Initiated fido')
         return self._fido
 
-    def _init_mimetypes(self):
+    def _get_mimetypes_file(self):
         logger = logging.getLogger('essarch.fixity.format')
         try:
             mimetypes_file = Path.objects.get(
                 entity="mimetypes_definitionfile"
             ).value
             if os.path.isfile(mimetypes_file):
-                logger.debug('Initiating mimetypes from %s' % mimetypes_file)
-                mime = mimetypes.MimeTypes()
-                mime.suffix_map = {}
-                mime.encodings_map = {}
-                mime.types_map = ({}, {})
-                mime.types_map_inv = ({}, {})
-                mime.read(mimetypes_file)
-                logger.info('Initiated mimetypes from %s' % mimetypes_file)
-                return mime
-            else:
-                logger.debug('Custom mimetypes file %s does not exist' % mimetypes_file)
+                return mimetypes_file
+
+            logger.debug('Custom mimetypes file %s does not exist' % mimetypes_file)
         except Path.DoesNotExist:
             logger.debug('No custom mimetypes file specified')
 
+        return None
+
+    def _build_mimetypes(self, mimetypes_file):
+        logger = logging.getLogger('essarch.fixity.format')
+        if mimetypes_file is not None:
+            logger.debug('Initiating mimetypes from %s' % mimetypes_file)
+            mime = mimetypes.MimeTypes()
+            mime.suffix_map = {}
+            mime.encodings_map = {}
+            mime.types_map = ({}, {})
+            mime.types_map_inv = ({}, {})
+            mime.read(mimetypes_file)
+            logger.info('Initiated mimetypes from %s' % mimetypes_file)
+            return mime
+
         logger.debug('Initiating default mimetypes')
         mime = mimetypes.MimeTypes()
         logger.info('Initiated default mimetypes')
         return mime
 
-    def get_mimetype(self, fname):
-        logger = logging.getLogger('essarch.fixity.format')
-        logger.debug('Getting mimetype for %s' % fname)
-        mime = self._init_mimetypes()
+    def _init_mimetypes(self):
+        return self._build_mimetypes(self._get_mimetypes_file())
+
+    def _get_cached_mimetypes(self):
+        """
+        Returns the mimetypes database shared by all identifiers in this
+        process. It is rebuilt when the mimetypes_definitionfile path or the
+        modification time of the file it points to changes.
+        """
 
+        entry = _mimetypes_cache.get('mimetypes')
+        if entry is not None:
+            mimetypes_file, mtime, mime, checked = entry
+            if time.monotonic() - checked < MIMETYPES_PATH_CACHE_TIMEOUT and _get_mtime(mimetypes_file) == mtime:
+                return mime
+
+        with _mimetypes_lock:
+            mimetypes_file = self._get_mimetypes_file()
+            mtime = _get_mtime(mimetypes_file)
+
+            entry = _mimetypes_cache.get('mimetypes')
+            if entry is not None and entry[:2] == (mimetypes_file, mtime):
+                mime = entry[2]
+            else:
+                mime = self._build_mimetypes(mimetypes_file)
+
+            _mimetypes_cache['mimetypes'] = (mimetypes_file, mtime, mime, time.monotonic())
+
+        return mime
+
+    def _guess_mimetype(self, mime, fname):
+        logger = logging.getLogger('essarch.fixity.format')
         content_type, encoding = mime.guess_type(fname)
         logger.info('Guessed mimetype for %s: type: %s, encoding: %s' % (fname, content_type, encoding))
 
@@ -112,9 +232,30 @@ class FormatIdentifier:
         logger.info('Got mimetype %s for %s' % (mtype, fname))
         return mtype
 
+    def get_mimetype(self, fname):
+        logger = logging.getLogger('essarch.fixity.format')
+        logger.debug('Getting mimetype for %s' % fname)
+        return self._guess_mimetype(self._get_cached_mimetypes(), fname)
+
+    def get_mimetypes(self, fnames):
+        """
+        Gets the mimetype of each of the given files using a single lookup of
+        the mimetypes database
+
+        Args:
+            fnames: The filenames to get the mimetypes of
+
+        Returns:
+            A list with the mimetype of each file, in the same order as fnames
+        """
+
+        mime = self._get_cached_mimetypes()
+        return [self._guess_mimetype(mime, fname) for fname in fnames]
+
     def handle_matches(self, fullname, matches, delta_t, matchtype=''):
         if len(matches) == 0:
             if self.allow_unknown_file_types:
+                self._matches_handled = True
                 self.format_name = 'Unknown File Format'
                 self.format_version = None
                 self.format_registry_key = None
@@ -122,6 +263,7 @@ class FormatIdentifier:
 
             raise ValueError("No matches for %s" % fullname)
 
+        self._matches_handled = True
         f, _ = matches[-1]
 
         try:
@@ -151,17 +293,35 @@ class FormatIdentifier:
             )
         return encrypted
 
-    def identify_file_format(self, filename):
-        """
-        Identifies the format of the file using the fido library
-
-        Args:
-            filename: The filename to identify
-
-        Returns:
-            A tuple with the format name, version and registry key
-        """
-
+    def _get_format_cache_key(self, filename, checksum=None, algorithm='SHA-256'):
+        if not getattr(settings, 'FORMAT_IDENTIFICATION_CACHE_TIMEOUT', 0):
+            return None
+
+        if checksum is None:
+            try:
+                if os.path.getsize(filename) > FORMAT_CACHE_MAX_HASH_SIZE:
+                    return None
+            except OSError:
+                return None
+
+            from ESSArch_Core.fixity.checksum import calculate_checksum
+            checksum = calculate_checksum(filename, algorithm)
+
+        # fido falls back to matching on the extension, it is therefore part
+        # of the key together with the options and signatures that affect the
+        # result
+        options = ''.join(str(int(bool(option))) for option in (
+            self.allow_unknown_file_types, self.use_fido_pronom_formats,
+            self.use_fido_extension_formats, self.use_ess_formats,
+        ))
+        if self._signature_files is None:
+            self._signature_files = self._get_signature_files()
+        signatures = _get_signature_version(self._signature_files)
+
+        extension = os.path.splitext(filename)[1].lower()
+        return 'file_format_{}_{}_{}_{}_{}'.format(options, signatures, algorithm.upper(), checksum, extension)
+
+    def _identify_file_format(self, filename):
         logger = logging.getLogger('essarch.fixity.format')
         if os.name == 'nt':
             start_time = time.perf_counter()
@@ -170,7 +330,14 @@ class FormatIdentifier:
 
         logger.debug("Identifying file format of %s ..." % (filename,))
 
-        self.fido.identify_file(filename)
+        # fido reports its matches through handle_matches which stores them
+        # on the identifier, only one file can therefore be identified at a
+        # time by each identifier
+        with self._fido_lock:
+            self._matches_handled = False
+            self.fido.identify_file(filename)
+            file_format = (self.format_name, self.format_version, self.format_registry_key)
+            matches_handled = self._matches_handled
 
         if os.name == 'nt':
             end_time = time.perf_counter()
@@ -185,7 +352,6 @@ class FormatIdentifier:
         except ZeroDivisionError:
             mb_per_sec = size_mb
 
-        file_format = (self.format_name, self.format_version, self.format_registry_key)
         from ESSArch_Core.util import pretty_mb_per_sec, pretty_time_to_sec
         logger.info(
             "Identified the format of %s at %s MB/Sec (%s sec): %s" % (
@@ -193,4 +359,93 @@ class FormatIdentifier:
             )
         )
 
+        return file_format, matches_handled
+
+    def identify_file_format(self, filename, checksum=None, algorithm='SHA-256'):
+        """
+        Identifies the format of the file using the fido library
+
+        The result is cached using the content of the file as key which
+        means that files with identical content are only identified once.
+
+        Args:
+            filename: The filename to identify
+            checksum: The checksum of the file, if already known
+            algorithm: The algorithm used to calculate checksum
+
+        Returns:
+            A tuple with the format name, version and registry key
+        """
+
+        logger = logging.getLogger('essarch.fixity.format')
+
+        cache_key = self._get_format_cache_key(filename, checksum, algorithm)
+        if cache_key is not None:
+            file_format = cache.get(cache_key)
+            if file_format is not None:
+                logger.debug("Using cached file format of %s: %s" % (filename, file_format))
+                return tuple(file_format)
+
+        file_format, matches_handled = self._identify_file_format(filename)
+
+        if cache_key is not None and matches_handled:
+            cache.set(cache_key, file_format, settings.FORMAT_IDENTIFICATION_CACHE_TIMEOUT)
+
         return file_format
+
+    def identify_file_formats(self, filenames, checksums=None, algorithm='SHA-256', workers=None):
+        """
+        Identifies the format of each of the given files using the fido
+        library
+
+        The cached formats of all files are fetched at once and the rest are
+        identified once per unique content. The files are hashed and
+        identified by a pool of threads.
+
+        Args:
+            filenames: The filenames to identify
+            checksums: The checksums of the files, if already known
+            algorithm: The algorithm used to calculate checksums
+            workers: The number of threads to use, defaults to
+                settings.FORMAT_IDENTIFICATION_WORKERS
+
+        Returns:
+            A list with a tuple with the format name, version and registry
+            key of each file, in the same order as filenames
+        """
+
+        filenames = list(filenames)
+        if checksums is None:
+            checksums = [None] * len(filenames)
+        if workers is None:
+            workers = getattr(settings, 'FORMAT_IDENTIFICATION_WORKERS', 1)
+        workers = max(1, min(workers, len(filenames)))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            cache_keys = list(executor.map(
+                lambda filename, checksum: self._get_format_cache_key(filename, checksum, algorithm),
+                filenames, checksums,
+            ))
+            cached = cache.get_many([cache_key for cache_key in cache_keys if cache_key is not None])
+
+            file_formats = [None] * len(filenames)
+            pending = {}
+            for idx, cache_key in enumerate(cache_keys):
+                if cache_key in cached:
+                    file_formats[idx] = tuple(cached[cache_key])
+                else:
+                    pending.setdefault(cache_key if cache_key is not None else idx, []).append(idx)
+
+            results = executor.map(self._identify_file_format, [filenames[idx[0]] for idx in pending.values()])
+
+            to_cache = {}
+            for (cache_key, indices), (file_format, matches_handled) in zip(pending.items(), results):
+                for idx in indices:
+                    file_formats[idx] = file_format
+                if cache_keys[indices[0]] is not None and matches_handled:
+                    to_cache[cache_key] = file_format
+
+        if to_cache:
+            cache.set_many(to_cache, settings.FORMAT_IDENTIFICATION_CACHE_TIMEOUT)
+
+        return file_formats
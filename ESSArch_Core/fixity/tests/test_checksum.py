@@ -0,0 +1,132 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from ESSArch_Core.fixity.checksum import (
+    _calculate_checksums,
+    calculate_checksum,
+    calculate_checksums,
+)
+
+
+@override_settings(CHECKSUM_CACHE_TIMEOUT=0)
+class CalculateChecksumsTests(SimpleTestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+
+        self.content = b'foo' * 100000
+        with tempfile.NamedTemporaryFile(dir=self.datadir, delete=False) as f:
+            f.write(self.content)
+            self.filepath = f.name
+
+    def test_multiple_algorithms(self):
+        checksums = calculate_checksums(self.filepath, algorithms=['MD5', 'SHA-1', 'SHA-256'], block_size=1000)
+
+        self.assertEqual(checksums, {
+            'MD5': hashlib.md5(self.content).hexdigest(),
+            'SHA-1': hashlib.sha1(self.content).hexdigest(),
+            'SHA-256': hashlib.sha256(self.content).hexdigest(),
+        })
+
+    def test_duplicate_algorithms(self):
+        checksums = calculate_checksums(self.filepath, algorithms=['MD5', 'MD5'])
+        self.assertEqual(checksums, {'MD5': hashlib.md5(self.content).hexdigest()})
+
+    def test_empty_file(self):
+        with tempfile.NamedTemporaryFile(dir=self.datadir, delete=False) as f:
+            pass
+
+        checksums = calculate_checksums(f.name, algorithms=['MD5', 'SHA-256'])
+        self.assertEqual(checksums, {
+            'MD5': hashlib.md5(b'').hexdigest(),
+            'SHA-256': hashlib.sha256(b'').hexdigest(),
+        })
+
+    def test_invalid_algorithm(self):
+        with self.assertRaises(KeyError):
+            calculate_checksums(self.filepath, algorithms=['MD5', 'foo'])
+
+    @mock.patch('ESSArch_Core.fixity.checksum.open', side_effect=open, create=True)
+    def test_file_only_read_once(self, mock_open):
+        calculate_checksums(self.filepath, algorithms=['MD5', 'SHA-1', 'SHA-512'])
+        mock_open.assert_called_once()
+
+    def test_calculate_checksum(self):
+        self.assertEqual(calculate_checksum(self.filepath), hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(calculate_checksum(self.filepath, 'md5'), hashlib.md5(self.content).hexdigest())
+
+
+@override_settings(CHECKSUM_CACHE_TIMEOUT=60)
+@mock.patch('ESSArch_Core.fixity.checksum.CHECKSUM_CACHE_MIN_AGE', -1)
+class ChecksumCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+        self.addCleanup(cache.clear)
+
+        self.filepath = os.path.join(self.datadir, 'foo.txt')
+        with open(self.filepath, 'wb') as f:
+            f.write(b'foo')
+
+    @mock.patch('ESSArch_Core.fixity.checksum._calculate_checksums', wraps=_calculate_checksums)
+    def test_cached_checksum_is_reused(self, mock_calculate):
+        self.assertEqual(calculate_checksum(self.filepath), hashlib.sha256(b'foo').hexdigest())
+        self.assertEqual(calculate_checksum(self.filepath), hashlib.sha256(b'foo').hexdigest())
+        mock_calculate.assert_called_once()
+
+    @mock.patch('ESSArch_Core.fixity.checksum._calculate_checksums', wraps=_calculate_checksums)
+    def test_only_missing_algorithms_are_calculated(self, mock_calculate):
+        calculate_checksum(self.filepath, 'MD5')
+        checksums = calculate_checksums(self.filepath, algorithms=['MD5', 'SHA-1'])
+
+        self.assertEqual(checksums, {
+            'MD5': hashlib.md5(b'foo').hexdigest(),
+            'SHA-1': hashlib.sha1(b'foo').hexdigest(),
+        })
+        mock_calculate.assert_called_with(self.filepath, ['SHA-1'], mock.ANY)
+
+    def test_modified_file_is_recalculated(self):
+        calculate_checksum(self.filepath)
+
+        st = os.stat(self.filepath)
+        with open(self.filepath, 'wb') as f:
+            f.write(b'bar')
+        os.utime(self.filepath, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+
+        self.assertEqual(calculate_checksum(self.filepath), hashlib.sha256(b'bar').hexdigest())
+
+    def test_modified_file_with_restored_mtime_is_recalculated(self):
+        calculate_checksum(self.filepath)
+
+        # e.g. a file extracted again from an archive
+        st = os.stat(self.filepath)
+        with open(self.filepath, 'wb') as f:
+            f.write(b'bar')
+        os.utime(self.filepath, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+        self.assertEqual(calculate_checksum(self.filepath), hashlib.sha256(b'bar').hexdigest())
+
+    @mock.patch('ESSArch_Core.fixity.checksum._calculate_checksums', wraps=_calculate_checksums)
+    def test_cache_disabled(self, mock_calculate):
+        calculate_checksum(self.filepath, use_cache=False)
+        calculate_checksum(self.filepath, use_cache=False)
+        self.assertEqual(mock_calculate.call_count, 2)
+
+        with self.settings(CHECKSUM_CACHE_TIMEOUT=0):
+            calculate_checksum(self.filepath)
+            calculate_checksum(self.filepath)
+        self.assertEqual(mock_calculate.call_count, 4)
+
+    @mock.patch('ESSArch_Core.fixity.checksum._calculate_checksums', wraps=_calculate_checksums)
+    def test_recently_modified_file_is_not_cached(self, mock_calculate):
+        with mock.patch('ESSArch_Core.fixity.checksum.CHECKSUM_CACHE_MIN_AGE', 60):
+            calculate_checksum(self.filepath)
+            calculate_checksum(self.filepath)
+
+        self.assertEqual(mock_calculate.call_count, 2)
@@ -1,13 +1,25 @@
+import os
+import shutil
+import tempfile
 from unittest import mock
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
 
 from ESSArch_Core.configuration.models import Path
 from ESSArch_Core.exceptions import FileFormatNotAllowed
-from ESSArch_Core.fixity.format import DEFAULT_MIMETYPE, FormatIdentifier
+from ESSArch_Core.fixity.format import (
+    DEFAULT_MIMETYPE,
+    FormatIdentifier,
+    clear_mimetypes_cache,
+)
 
 
 class FormatIdentifierMimeTypeTests(TestCase):
+    def setUp(self):
+        clear_mimetypes_cache()
+        self.addCleanup(clear_mimetypes_cache)
+
     @mock.patch("ESSArch_Core.fixity.format.mimetypes.MimeTypes")
     def test_default_list(self, mock_mimetypes_init):
         fid = FormatIdentifier(allow_unknown_file_types=True)
@@ -78,3 +90,172 @@ class FormatIdentifierMimeTypeTests(TestCase):
         self.assertIsNone(fid.format_name)
         self.assertIsNone(fid.format_version)
         self.assertIsNone(fid.format_registry_key)
+
+
+class FormatIdentifierMimeTypeCacheTests(TestCase):
+    def setUp(self):
+        clear_mimetypes_cache()
+        self.addCleanup(clear_mimetypes_cache)
+
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+
+        self.mimetypes_file = os.path.join(self.datadir, 'mime.types')
+        with open(self.mimetypes_file, 'w') as f:
+            f.write('text/plain txt\n')
+
+        self.path = Path.objects.create(entity="mimetypes_definitionfile", value=self.mimetypes_file)
+
+    def test_mimetypes_only_initiated_once(self):
+        fid = FormatIdentifier()
+        with mock.patch.object(FormatIdentifier, '_build_mimetypes', wraps=fid._build_mimetypes) as mock_build:
+            with self.assertNumQueries(1):
+                self.assertEqual(fid.get_mimetype('foo.txt'), 'text/plain')
+                self.assertEqual(FormatIdentifier().get_mimetype('bar.txt'), 'text/plain')
+
+        mock_build.assert_called_once_with(self.mimetypes_file)
+
+    def test_get_mimetypes(self):
+        fid = FormatIdentifier(allow_unknown_file_types=True)
+        with self.assertNumQueries(1):
+            mimetypes = fid.get_mimetypes(['foo.txt', 'bar.pdf', 'baz.txt'])
+
+        self.assertEqual(mimetypes, ['text/plain', DEFAULT_MIMETYPE, 'text/plain'])
+
+    def test_get_mimetypes_unknown_not_allowed(self):
+        fid = FormatIdentifier(allow_unknown_file_types=False)
+        with self.assertRaises(FileFormatNotAllowed):
+            fid.get_mimetypes(['foo.txt', 'bar.pdf'])
+
+    def test_modified_file(self):
+        fid = FormatIdentifier()
+        self.assertEqual(fid.get_mimetype('foo.txt'), 'text/plain')
+
+        st = os.stat(self.mimetypes_file)
+        with open(self.mimetypes_file, 'w') as f:
+            f.write('text/x-custom txt\n')
+        os.utime(self.mimetypes_file, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+
+        self.assertEqual(fid.get_mimetype('foo.txt'), 'text/x-custom')
+
+    def test_modified_path(self):
+        fid = FormatIdentifier()
+        self.assertEqual(fid.get_mimetype('foo.txt'), 'text/plain')
+
+        other_file = os.path.join(self.datadir, 'other.types')
+        with open(other_file, 'w') as f:
+            f.write('text/x-custom txt\n')
+
+        self.path.value = other_file
+        self.path.save()
+
+        self.assertEqual(fid.get_mimetype('foo.txt'), 'text/x-custom')
+
+    def test_deleted_path(self):
+        fid = FormatIdentifier()
+        self.assertEqual(fid.get_mimetype('foo.txt'), 'text/plain')
+        with self.assertRaises(FileFormatNotAllowed):
+            fid.get_mimetype('foo.pdf')
+
+        self.path.delete()
+
+        self.assertEqual(fid.get_mimetype('foo.pdf'), 'application/pdf')
+
+
+@override_settings(FORMAT_IDENTIFICATION_CACHE_TIMEOUT=60, CHECKSUM_CACHE_TIMEOUT=0)
+class FormatIdentifierFormatCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+        self.addCleanup(cache.clear)
+
+        self.content = b'<?xml version="1.0" encoding="UTF-8"?>\n<root/>\n'
+        self.files = []
+        for name in ('a.xml', 'b.xml', 'c.txt'):
+            filepath = os.path.join(self.datadir, name)
+            with open(filepath, 'wb') as f:
+                f.write(self.content)
+            self.files.append(filepath)
+
+    def test_identical_content_identified_once(self):
+        identify = FormatIdentifier._identify_file_format
+        with mock.patch.object(FormatIdentifier, '_identify_file_format', autospec=True,
+                               side_effect=identify) as mock_identify:
+            first = FormatIdentifier().identify_file_format(self.files[0])
+            second = FormatIdentifier().identify_file_format(self.files[1])
+
+        self.assertEqual(first, second)
+        mock_identify.assert_called_once_with(mock.ANY, self.files[0])
+
+    def test_extension_is_part_of_key(self):
+        fid = FormatIdentifier()
+        with mock.patch.object(fid, '_identify_file_format', wraps=fid._identify_file_format) as mock_identify:
+            fid.identify_file_format(self.files[0])
+            fid.identify_file_format(self.files[2])
+
+        self.assertEqual(mock_identify.call_count, 2)
+
+    @mock.patch('ESSArch_Core.fixity.checksum.calculate_checksum')
+    def test_provided_checksum(self, mock_checksum):
+        fid = FormatIdentifier()
+        with mock.patch.object(fid, '_identify_file_format', wraps=fid._identify_file_format) as mock_identify:
+            fid.identify_file_format(self.files[0], checksum='foo', algorithm='MD5')
+            fid.identify_file_format(self.files[1], checksum='foo', algorithm='MD5')
+
+        mock_identify.assert_called_once_with(self.files[0])
+        mock_checksum.assert_not_called()
+
+    def test_cache_disabled(self):
+        fid = FormatIdentifier()
+        with self.settings(FORMAT_IDENTIFICATION_CACHE_TIMEOUT=0):
+            with mock.patch.object(fid, '_identify_file_format', wraps=fid._identify_file_format) as mock_identify:
+                fid.identify_file_format(self.files[0])
+                fid.identify_file_format(self.files[0])
+
+        self.assertEqual(mock_identify.call_count, 2)
+
+    def test_signatures_are_part_of_key(self):
+        signature_file = os.path.join(self.datadir, 'signatures.xml')
+        with open(signature_file, 'w') as f:
+            f.write('foo')
+
+        fid = FormatIdentifier()
+        fid._signature_files = [signature_file]
+        with mock.patch.object(fid, '_identify_file_format', wraps=fid._identify_file_format) as mock_identify:
+            fid.identify_file_format(self.files[0])
+            fid.identify_file_format(self.files[0])
+            self.assertEqual(mock_identify.call_count, 1)
+
+            with open(signature_file, 'w') as f:
+                f.write('foobar')
+
+            fid.identify_file_format(self.files[0])
+            self.assertEqual(mock_identify.call_count, 2)
+
+    def test_identify_file_formats(self):
+        fid = FormatIdentifier()
+        expected = [fid.identify_file_format(filepath) for filepath in self.files]
+        cache.clear()
+
+        with mock.patch.object(fid, '_identify_file_format', wraps=fid._identify_file_format) as mock_identify:
+            self.assertEqual(fid.identify_file_formats(self.files, workers=2), expected)
+
+        # a.xml and b.xml have identical content
+        self.assertCountEqual(
+            [call[0][0] for call in mock_identify.call_args_list], [self.files[0], self.files[2]],
+        )
+
+        with mock.patch.object(fid, '_identify_file_format', wraps=fid._identify_file_format) as mock_identify:
+            self.assertEqual(fid.identify_file_formats(self.files, workers=2), expected)
+
+        mock_identify.assert_not_called()
+
+    def test_identify_file_formats_without_cache(self):
+        fid = FormatIdentifier()
+        with self.settings(FORMAT_IDENTIFICATION_CACHE_TIMEOUT=0):
+            with mock.patch.object(fid, '_identify_file_format', wraps=fid._identify_file_format) as mock_identify:
+                file_formats = fid.identify_file_formats(self.files + [self.files[0]])
+
+        self.assertEqual(mock_identify.call_count, 4)
+        self.assertEqual(file_formats[0], file_formats[3])
+        self.assertEqual(fid.identify_file_formats([]), [])
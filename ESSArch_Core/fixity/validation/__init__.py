@@ -1,11 +1,19 @@
+import copy
 import errno
+import fnmatch
 import importlib
 import logging
 import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import lru_cache
 from os import walk
 
 from django.conf import settings
-from glob2 import glob
+from django.db import connections
 
 logger = logging.getLogger('essarch.fixity.validation')
 
@@ -30,63 +38,315 @@ AVAILABLE_VALIDATORS.update(extra_validators)
 
 PATH_VARIABLE = "_PATH"
 
+VALIDATION_CHUNK_SIZE = 100  # number of files validated by each job when validating a directory
+VALIDATION_BATCH_SIZE = 500  # number of buffered validation results saved in each bulk insert
+PROGRESS_INTERVAL = 1  # minimum number of seconds between progress updates
 
-def _validate_file(path, validators, task=None, ip=None, stop_at_failure=True, responsible=None):
+GLOBSTAR = '**'
+_magic_check = re.compile('[*?[]')
+
+
+def _split_path(path):
+    if os.altsep:
+        path = path.replace(os.altsep, os.sep)
+    return path.split(os.sep)
+
+
+@lru_cache(maxsize=1024)
+def _compile_path_pattern(pattern):
+    """
+    Compiles a glob pattern into a sequence of per-component matchers that
+    can be evaluated against a path without accessing the filesystem
+    """
+
+    segments = []
+    for segment in _split_path(pattern):
+        if segment == GLOBSTAR:
+            segments.append(GLOBSTAR)
+        elif _magic_check.search(segment):
+            segments.append((re.compile(fnmatch.translate(segment)).match, segment.startswith('.')))
+        else:
+            segments.append(segment)
+
+    return tuple(segments)
+
+
+def _match_path_parts(parts, segments):
+    if not segments:
+        return not parts
+
+    segment, rest = segments[0], segments[1:]
+
+    if segment == GLOBSTAR:
+        # "**" matches zero or more directories, or one or more components if
+        # it ends the pattern, but never starting with a hidden one
+        for i in range(0 if rest else 1, len(parts) + 1):
+            if i > 0 and parts[0].startswith('.'):
+                break
+            if _match_path_parts(parts[i:], rest):
+                return True
+        return False
+
+    if not parts:
+        return False
+
+    part = parts[0]
+    if isinstance(segment, str):
+        matched = part == segment
+    else:
+        match, include_hidden = segment
+        matched = match(part) is not None and (include_hidden or not part.startswith('.'))
+
+    return matched and _match_path_parts(parts[1:], rest)
+
+
+def _compile_path_patterns(patterns, data):
+    """
+    Formats the patterns with data and compiles them to be matched using
+    _path_matches
+    """
+
+    return [_compile_path_pattern(pattern.format(**data)) for pattern in patterns]
+
+
+def _compile_validator_patterns(validators):
+    """
+    Compiles the include and exclude patterns of each validator, returned
+    in the same order as the validators
+    """
+
+    return [
+        (
+            _compile_path_patterns(validator.include, validator.data),
+            _compile_path_patterns(validator.exclude, validator.data),
+        )
+        for validator in validators
+    ]
+
+
+def _path_matches(path, patterns):
+    """
+    Checks if the existing path would be found by globbing any of the
+    compiled patterns
+    """
+
+    parts = _split_path(path)
+    return any(_match_path_parts(parts, segments) for segments in patterns)
+
+
+class ValidationBuffer:
+    """
+    Collects the results of validators, possibly running in multiple
+    threads, to be saved in bulk by the thread running the validation
+    """
+
+    def __init__(self, batch_size=VALIDATION_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._validations = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._validations)
+
+    def add(self, validations):
+        with self._lock:
+            self._validations.extend(validations)
+
+    def flush(self):
+        from ESSArch_Core.fixity.models import Validation
+
+        with self._lock:
+            validations, self._validations = self._validations, []
+
+        if validations:
+            Validation.objects.bulk_create(validations, batch_size=self.batch_size)
+
+
+@contextmanager
+def _buffered_validations(validators):
+    buffer = ValidationBuffer()
     for validator in validators:
-        included = False
-
-        if len(validator.include):
-            for included_path in validator.include:
-                included_path = included_path.format(**validator.data)
-                if path in glob(included_path):
-                    included = True
-                    break
+        validator.validation_buffer = buffer
+
+    try:
+        yield buffer
+    finally:
+        for validator in validators:
+            validator.validation_buffer = None
+        buffer.flush()
+
+
+class _ValidatorThroughput:
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def add(self, validator, seconds):
+        name = validator.__class__.__name__
+        with self._lock:
+            files, total = self._stats.get(name, (0, 0))
+            self._stats[name] = (files + 1, total + seconds)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                name: {
+                    'files': files,
+                    'files_per_second': round(files / seconds, 2) if seconds else None,
+                }
+                for name, (files, seconds) in self._stats.items()
+            }
+
+
+def _validate_file(path, validators, task=None, ip=None, stop_at_failure=True, responsible=None, throughput=None,
+                   patterns=None):
+    if patterns is None:
+        patterns = _compile_validator_patterns(validators)
+
+    for validator, (include, exclude) in zip(validators, patterns):
+        if len(include):
+            included = _path_matches(path, include)
         else:
             included = True
 
-        if len(validator.exclude):
-            for excluded_path in validator.exclude:
-                excluded_path = excluded_path.format(**validator.data)
-                if path in glob(excluded_path):
-                    included = False
-                    break
+        if included and len(exclude):
+            included = not _path_matches(path, exclude)
 
         if not included:
             continue
 
+        started = time.monotonic()
         try:
             validator.data[PATH_VARIABLE] = path
             validator.validate(path)
         except Exception:
             if stop_at_failure:
                 raise
+        finally:
+            if throughput is not None:
+                throughput.add(validator, time.monotonic() - started)
 
 
-def _validate_directory(path, validators, task=None, ip=None, stop_at_failure=True, responsible=None):
-    file_validators = [v for v in validators if v.file_validator]
-    dir_validators = [v for v in validators if not v.file_validator]
+def _validate_files(paths, validators, stop, stop_at_failure=True, throughput=None, concurrent=False, patterns=None):
+    if patterns is None:
+        patterns = _compile_validator_patterns(validators)
 
-    for validator in dir_validators:
-        try:
-            validator.data[PATH_VARIABLE] = path
-            validator.validate(path)
-        except Exception:
-            if stop_at_failure:
-                raise
+    if concurrent:
+        # each job gets its own copies of the validators since the data of
+        # the validators is updated with the path of each validated file
+        validators = [copy.copy(validator) for validator in validators]
+        for validator in validators:
+            validator.data = dict(validator.data)
+
+    try:
+        for path in paths:
+            if stop.is_set():
+                break
 
-    for root, _dirs, files in walk(path):
-        for f in files:
             _validate_file(
-                os.path.join(root, f),
-                file_validators,
-                task=task,
-                ip=ip,
-                stop_at_failure=stop_at_failure,
-                responsible=responsible
+                path, validators, stop_at_failure=stop_at_failure, throughput=throughput, patterns=patterns,
             )
+    except Exception:
+        stop.set()
+        raise
+    finally:
+        if concurrent:
+            connections.close_all()
+
+
+def _validate_directory(path, validators, task=None, ip=None, stop_at_failure=True, responsible=None,
+                        workers=None, progress_callback=None, patterns=None):
+    """
+    Validates a directory using the directory validators and all files in
+    it using the file validators.
+
+    Files are validated in chunks, in parallel if more than one worker is
+    used, and the validation results are saved in bulk.
+
+    Args:
+        workers: The number of threads validating files, defaults to
+            settings.VALIDATION_WORKERS
+        progress_callback: Called with the number of validated files, the
+            total number of files and the throughput of each validator, e.g.
+            DBTask.set_progress
+        patterns: The compiled include and exclude patterns of each
+            validator, see _compile_validator_patterns
+    """
+
+    if workers is None:
+        workers = getattr(settings, 'VALIDATION_WORKERS', 1)
+
+    if patterns is None:
+        patterns = _compile_validator_patterns(validators)
+
+    file_validators = [v for v in validators if v.file_validator]
+    file_patterns = [p for v, p in zip(validators, patterns) if v.file_validator]
+    dir_validators = [v for v in validators if not v.file_validator]
+
+    with _buffered_validations(validators) as buffer:
+        for validator in dir_validators:
+            try:
+                validator.data[PATH_VARIABLE] = path
+                validator.validate(path)
+            except Exception:
+                if stop_at_failure:
+                    raise
+
+        paths = [os.path.join(root, f) for root, _dirs, files in walk(path) for f in files]
+        chunks = [paths[i:i + VALIDATION_CHUNK_SIZE] for i in range(0, len(paths), VALIDATION_CHUNK_SIZE)]
+        total = len(paths)
+        throughput = _ValidatorThroughput()
+        stop = threading.Event()
+        validated = 0
+        last_progress = time.monotonic()
 
+        def chunk_done(num):
+            nonlocal validated, last_progress
 
-def validate_path(path, validators, profile, data=None, task=None, ip=None, stop_at_failure=True, responsible=None):
+            validated += num
+            if len(buffer) >= buffer.batch_size:
+                buffer.flush()
+
+            now = time.monotonic()
+            if progress_callback is not None and (validated == total or now - last_progress >= PROGRESS_INTERVAL):
+                progress_callback(validated, total, validators=throughput.as_dict())
+                last_progress = now
+
+        if workers > 1 and len(chunks) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(
+                        _validate_files, chunk, file_validators, stop,
+                        stop_at_failure=stop_at_failure, throughput=throughput, concurrent=True,
+                        patterns=file_patterns,
+                    ): len(chunk)
+                    for chunk in chunks
+                }
+                try:
+                    for future in as_completed(futures):
+                        future.result()
+                        chunk_done(futures[future])
+                except BaseException:
+                    stop.set()
+                    for future in futures:
+                        future.cancel()
+                    raise
+        else:
+            for chunk in chunks:
+                _validate_files(
+                    chunk, file_validators, stop,
+                    stop_at_failure=stop_at_failure, throughput=throughput, patterns=file_patterns,
+                )
+                chunk_done(len(chunk))
+
+        logger.info(
+            'Validated {num} files in {path}'.format(num=total, path=path),
+            extra={'path': path, 'files': total, 'validators': throughput.as_dict()},
+        )
+
+
+def validate_path(path, validators, profile, data=None, task=None, ip=None, stop_at_failure=True, responsible=None,
+                  workers=None, progress_callback=None):
     data = data or {}
     validator_instances = []
 
@@ -118,6 +378,8 @@ def validate_path(path, validators, profile, data=None, task=None, ip=None, stop
             )
             validator_instances.append(validator_instance)
 
+    patterns = _compile_validator_patterns(validator_instances)
+
     if os.path.isdir(path):
         _validate_directory(
             path,
@@ -125,18 +387,23 @@ def validate_path(path, validators, profile, data=None, task=None, ip=None, stop
             task=task,
             ip=ip,
             stop_at_failure=stop_at_failure,
-            responsible=responsible
+            responsible=responsible,
+            workers=workers,
+            progress_callback=progress_callback,
+            patterns=patterns,
         )
 
     elif os.path.isfile(path):
-        _validate_file(
-            path,
-            validator_instances,
-            task=task,
-            ip=ip,
-            stop_at_failure=stop_at_failure,
-            responsible=responsible
-        )
+        with _buffered_validations(validator_instances):
+            _validate_file(
+                path,
+                validator_instances,
+                task=task,
+                ip=ip,
+                stop_at_failure=stop_at_failure,
+                responsible=responsible,
+                patterns=patterns,
+            )
 
     else:
         raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), path)
@@ -1,8 +1,11 @@
 import click
 
+from ESSArch_Core.fixity.models import Validation
+
 
 class BaseValidator:
     file_validator = True  # Does the validator operate on single files or entire directories?
+    validation_buffer = None  # Buffer of the validation run the validator is part of, if any
 
     def __init__(self, context=None, include=None, exclude=None, options=None,
                  data=None, required=True, task=None, ip=None, responsible=None,
@@ -21,6 +24,17 @@ class BaseValidator:
         self.responsible = responsible
         self.stylesheet = stylesheet
 
+    def save_validations(self, *validations):
+        """
+        Saves the validation results, or adds them to the buffer of the
+        validation run to be saved in bulk
+        """
+
+        if self.validation_buffer is not None:
+            self.validation_buffer.add(validations)
+        else:
+            Validation.objects.bulk_create(validations, batch_size=100)
+
     def validate(self, filepath, expected=None):
         raise NotImplementedError('subclasses of BaseValidator must provide a validate() method')
 
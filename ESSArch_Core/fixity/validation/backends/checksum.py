@@ -5,7 +5,7 @@ from django.utils import timezone
 
 from ESSArch_Core.essxml.util import find_file
 from ESSArch_Core.exceptions import ValidationError
-from ESSArch_Core.fixity.checksum import calculate_checksum
+from ESSArch_Core.fixity.checksum import DEFAULT_BLOCK_SIZE, calculate_checksum
 from ESSArch_Core.fixity.models import Validation
 from ESSArch_Core.fixity.validation.backends.base import BaseValidator
 
@@ -20,7 +20,9 @@ class ChecksumValidator(BaseValidator):
 
        * ``algorithm`` must be one of ``md5``, ``sha-1``, ``sha-224``,
          ``sha-256``, ``sha-384`` and ``sha-512``. Defaults to ``md5``
-       * ``block_size``: Defaults to 65536
+       * ``block_size``: Defaults to 1 MiB
+       * ``use_cache``: Whether to use cached checksums of files that are
+         unchanged since they were last read. Defaults to ``False``
     """
 
     def __init__(self, *args, **kwargs):
@@ -30,12 +32,14 @@ class ChecksumValidator(BaseValidator):
             raise ValueError('Need something to compare to')
 
         self.algorithm = self.options.get('algorithm', 'md5')
-        self.block_size = self.options.get('block_size', 65536)
+        self.block_size = self.options.get('block_size', DEFAULT_BLOCK_SIZE)
+        self.use_cache = self.options.get('use_cache', False)
+        self.xml_file_indexes = {}  # indexes of the xml files looked up by this validator
 
     def validate(self, filepath, expected=None):
         logger = logging.getLogger('essarch.fixity.validation.checksum')
         logger.debug('Validating checksum of %s' % filepath)
-        val_obj = Validation.objects.create(
+        val_obj = Validation(
             filename=filepath,
             time_started=timezone.now(),
             validator=self.__class__.__name__,
@@ -49,20 +53,22 @@ class ChecksumValidator(BaseValidator):
             }
         )
 
-        expected = self.options['expected'].format(**self.data)
-
-        if self.context == 'checksum_str':
-            checksum = expected.lower()
-        elif self.context == 'checksum_file':
-            with open(expected, 'r') as checksum_file:
-                checksum = checksum_file.read().strip()
-        elif self.context == 'xml_file':
-            xml_el, _ = find_file(filepath, xmlfile=expected)
-            checksum = xml_el.checksum
-
         passed = False
         try:
-            actual_checksum = calculate_checksum(filepath, algorithm=self.algorithm, block_size=self.block_size)
+            expected = self.options['expected'].format(**self.data)
+
+            if self.context == 'checksum_str':
+                checksum = expected.lower()
+            elif self.context == 'checksum_file':
+                with open(expected, 'r') as checksum_file:
+                    checksum = checksum_file.read().strip()
+            elif self.context == 'xml_file':
+                xml_el, _ = find_file(filepath, xmlfile=expected, indexes=self.xml_file_indexes)
+                checksum = xml_el.checksum
+
+            actual_checksum = calculate_checksum(
+                filepath, algorithm=self.algorithm, block_size=self.block_size, use_cache=self.use_cache,
+            )
             if actual_checksum != checksum:
                 raise ValidationError("checksum for %s is not valid (%s != %s)" % (
                     filepath, checksum, actual_checksum
@@ -78,4 +84,4 @@ class ChecksumValidator(BaseValidator):
         finally:
             val_obj.time_done = timezone.now()
             val_obj.passed = passed
-            val_obj.save(update_fields=['time_done', 'passed', 'message'])
+            self.save_validations(val_obj)
@@ -58,7 +58,7 @@ class FileEncryptionValidator(BaseValidator):
         logger.debug('Validating encryption of %s' % filepath)
         result = self.is_file_encrypted(filepath)
 
-        val_obj = Validation.objects.create(
+        val_obj = Validation(
             filename=filepath,
             time_started=timezone.now(),
             validator=self.__class__.__name__,
@@ -94,7 +94,7 @@ class FileEncryptionValidator(BaseValidator):
         finally:
             val_obj.time_done = timezone.now()
             val_obj.passed = passed
-            val_obj.save(update_fields=['time_done', 'passed', 'message'])
+            self.save_validations(val_obj)
 
     @staticmethod
     @click.command()
@@ -66,7 +66,7 @@ class FilenameValidator(BaseValidator):
         finally:
             val_obj.time_done = timezone.now()
             val_obj.passed = passed
-            val_obj.save()
+            self.save_validations(val_obj)
 
     @staticmethod
     @click.command()
@@ -34,7 +34,7 @@ class FormatValidator(BaseValidator):
         if not any(f is not None for f in (name, version, reg_key)):
             raise ValueError('At least one of name, version and registry key is required')
 
-        val_obj = Validation.objects.create(
+        val_obj = Validation(
             filename=filepath,
             time_started=timezone.now(),
             validator=self.__class__.__name__,
@@ -72,7 +72,7 @@ class FormatValidator(BaseValidator):
         finally:
             val_obj.time_done = timezone.now()
             val_obj.passed = passed
-            val_obj.save(update_fields=['time_done', 'passed', 'message'])
+            self.save_validations(val_obj)
 
     @staticmethod
     @click.command()
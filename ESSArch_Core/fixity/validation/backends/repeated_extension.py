@@ -58,7 +58,7 @@ class RepeatedExtensionValidator(BaseValidator):
         finally:
             val_obj.time_done = timezone.now()
             val_obj.passed = passed
-            val_obj.save()
+            self.save_validations(val_obj)
 
     @staticmethod
     @click.command()
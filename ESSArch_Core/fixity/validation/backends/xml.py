@@ -1,16 +1,18 @@
-import copy
 import logging
 import os
+import time
 from os import walk
 from pathlib import Path
 
 import click
+from django.core.cache import cache
 from django.utils import timezone
 from lxml import etree, isoschematron
 
 from ESSArch_Core.essxml.util import (
     find_files,
     find_pointers,
+    get_file_manifest,
     validate_against_schema,
 )
 from ESSArch_Core.exceptions import ValidationError
@@ -27,6 +29,17 @@ class DiffCheckValidator(BaseValidator):
 
     The post validation checks if there are files that has been deleted after
     the XML was generated.
+
+    * ``options``
+
+       * ``quick``: Only calculate the checksum of files whose size or
+         modification time differ from when the XML was generated. Requires
+         ``FILE_MANIFEST_CACHE_TIMEOUT`` to be enabled when the XML is
+         generated, otherwise every file is checked. Defaults to ``False``
+       * ``audit``: Calculate the checksum of every file without using any
+         cached checksums. Defaults to ``False``
+       * ``audit_interval``: In quick mode, do a full audit if there hasn't
+         been one of the XML for this many seconds
     """
 
     file_validator = False
@@ -41,6 +54,11 @@ class DiffCheckValidator(BaseValidator):
         self.rootdir = self.options.get('rootdir')
         self.recursive = self.options.get('recursive', True)
         self.default_algorithm = self.options.get('default_algorithm', 'SHA-256')
+        self.quick = self.options.get('quick', False)
+        self.audit = self.options.get('audit', False)
+        self.audit_interval = self.options.get('audit_interval')
+        self.auditing = self.audit
+        self.manifest = None
 
         self.initial_present = {}  # Map checksum -> fname
         self.initial_deleted = {}  # Map checksum -> fname
@@ -70,8 +88,27 @@ class DiffCheckValidator(BaseValidator):
                 self.sizes[logical_path] = logical.size
 
     def _reset_dicts(self):
-        self.present = copy.deepcopy(self.initial_present)
-        self.deleted = copy.deepcopy(self.initial_deleted)
+        self.present = {checksum: list(files) for checksum, files in self.initial_present.items()}
+        self.deleted = {checksum: list(files) for checksum, files in self.initial_deleted.items()}
+
+    def _get_audit_cache_key(self):
+        return 'diff_check_audit_{}'.format(calculate_checksum(self.context, 'SHA-256'))
+
+    def _setup_mode(self):
+        """
+        Decides if this validation is a full audit or a quick check and loads
+        the snapshot of the files used by the quick check
+        """
+
+        self.manifest = None
+        self.auditing = self.audit
+
+        if self.quick and not self.auditing and self.audit_interval is not None:
+            last_audit = cache.get(self._get_audit_cache_key())
+            self.auditing = last_audit is None or time.time() - last_audit >= self.audit_interval
+
+        if self.quick and not self.auditing:
+            self.manifest = get_file_manifest(self.context)
 
     def _reset_counters(self):
         self.confirmed = 0
@@ -113,7 +150,19 @@ class DiffCheckValidator(BaseValidator):
     def _get_checksum(self, input_file, relpath=None):
         path = relpath or input_file
         algorithm = self.checksum_algorithms.get(path) or self.default_algorithm
-        return calculate_checksum(input_file, algorithm=algorithm)
+
+        if self.manifest is not None:
+            try:
+                size, mtime_ns, checksum, manifest_algorithm = self.manifest[path]
+            except KeyError:
+                pass
+            else:
+                if manifest_algorithm and manifest_algorithm.upper() == algorithm.upper():
+                    st = os.stat(input_file)
+                    if st.st_size == size and st.st_mtime_ns == mtime_ns:
+                        return checksum
+
+        return calculate_checksum(input_file, algorithm=algorithm, use_cache=not self.auditing)
 
     def _get_size(self, input_file):
         return os.path.getsize(input_file)
@@ -216,6 +265,7 @@ class DiffCheckValidator(BaseValidator):
         objs = []
         self._reset_dicts()
         self._reset_counters()
+        self._setup_mode()
         logger.debug('Validating {path} against {xml}'.format(path=path, xml=xmlfile))
 
         if os.path.isdir(path):
@@ -234,6 +284,10 @@ class DiffCheckValidator(BaseValidator):
         objs = [o for o in objs if o is not None]
         Validation.objects.bulk_create(objs, batch_size=100)
 
+        # the time of the audit is only needed until the next one is due
+        if self.auditing and self.audit_interval is not None:
+            cache.set(self._get_audit_cache_key(), time.time(), self.audit_interval)
+
         if delete_count + self.added + self.changed + self.renamed > 0:
             msg = ('Redundancy check of {path} against {xml} failed: '
                    '{cfmd} confirmed, {a} added, {c} changed, {r} renamed, {d} deleted').format(
@@ -357,13 +411,13 @@ class XMLSchemaValidator(BaseValidator):
                     task=self.task,
                 ))
 
-            Validation.objects.bulk_create(validation_objs, 100)
+            self.save_validations(*validation_objs)
             raise ValidationError(msg, errors=[o.message for o in validation_objs])
         except Exception as e:
             msg = 'Unknown error during schema validation of {xml}'.format(xml=filepath)
             logger.exception(msg)
             done = timezone.now()
-            Validation.objects.create(
+            self.save_validations(Validation(
                 passed=False,
                 validator=self.__class__.__name__,
                 filename=relpath,
@@ -372,10 +426,10 @@ class XMLSchemaValidator(BaseValidator):
                 time_done=done,
                 information_package_id=self.ip,
                 task=self.task,
-            )
+            ))
             raise
 
-        Validation.objects.create(
+        self.save_validations(Validation(
             passed=True,
             validator=self.__class__.__name__,
             filename=relpath,
@@ -383,7 +437,7 @@ class XMLSchemaValidator(BaseValidator):
             time_done=timezone.now(),
             information_package_id=self.ip,
             task=self.task,
-        )
+        ))
         logger.info("Successful schema validation of {xml}".format(xml=filepath))
 
     @staticmethod
@@ -432,12 +486,12 @@ class XMLSyntaxValidator(BaseValidator):
                     task=self.task,
                 ))
 
-            Validation.objects.bulk_create(validation_objs, 100)
+            self.save_validations(*validation_objs)
             raise ValidationError(msg, errors=[o.message for o in validation_objs])
         except Exception as e:
             logger.exception('Unknown error during syntax validation of {xml}'.format(xml=filepath))
             done = timezone.now()
-            Validation.objects.create(
+            self.save_validations(Validation(
                 passed=False,
                 validator=self.__class__.__name__,
                 filename=filepath,
@@ -446,10 +500,10 @@ class XMLSyntaxValidator(BaseValidator):
                 time_done=done,
                 information_package_id=self.ip,
                 task=self.task,
-            )
+            ))
             raise
 
-        Validation.objects.create(
+        self.save_validations(Validation(
             passed=True,
             validator=self.__class__.__name__,
             filename=filepath,
@@ -457,7 +511,7 @@ class XMLSyntaxValidator(BaseValidator):
             time_done=timezone.now(),
             information_package_id=self.ip,
             task=self.task,
-        )
+        ))
         logger.info(
             "Successful syntax validation of {xml}".format(xml=filepath)
         )
@@ -508,7 +562,7 @@ class XMLSchematronValidator(BaseValidator):
                     task=self.task,
                 ))
 
-            Validation.objects.bulk_create(validation_objs, 100)
+            self.save_validations(*validation_objs)
             raise
         except Exception as e:
             logger.exception(
@@ -517,7 +571,7 @@ class XMLSchematronValidator(BaseValidator):
                 )
             )
             done = timezone.now()
-            Validation.objects.create(
+            self.save_validations(Validation(
                 passed=False,
                 validator=self.__class__.__name__,
                 filename=relpath,
@@ -526,10 +580,10 @@ class XMLSchematronValidator(BaseValidator):
                 time_done=done,
                 information_package_id=self.ip,
                 task=self.task,
-            )
+            ))
             raise
 
-        Validation.objects.create(
+        self.save_validations(Validation(
             passed=True,
             validator=self.__class__.__name__,
             filename=relpath,
@@ -537,7 +591,7 @@ class XMLSchematronValidator(BaseValidator):
             time_done=timezone.now(),
             information_package_id=self.ip,
             task=self.task,
-        )
+        ))
         logger.info(
             "Successful schematron validation of {xml} against {schema}".format(
                 xml=filepath, schema=self.context
@@ -582,7 +636,7 @@ class XMLISOSchematronValidator(BaseValidator):
                     task=self.task,
                 ))
 
-            Validation.objects.bulk_create(validation_objs, 100)
+            self.save_validations(*validation_objs)
             raise
         except Exception as e:
             logger.exception(
@@ -591,7 +645,7 @@ class XMLISOSchematronValidator(BaseValidator):
                 )
             )
             done = timezone.now()
-            Validation.objects.create(
+            self.save_validations(Validation(
                 passed=False,
                 validator=self.__class__.__name__,
                 filename=relpath,
@@ -600,10 +654,10 @@ class XMLISOSchematronValidator(BaseValidator):
                 time_done=done,
                 information_package_id=self.ip,
                 task=self.task,
-            )
+            ))
             raise
 
-        Validation.objects.create(
+        self.save_validations(Validation(
             passed=True,
             validator=self.__class__.__name__,
             filename=relpath,
@@ -611,7 +665,7 @@ class XMLISOSchematronValidator(BaseValidator):
             time_done=timezone.now(),
             information_package_id=self.ip,
             task=self.task,
-        )
+        ))
         logger.info(
             "Successful iso-schematron validation of {xml} against {schema}".format(
                 xml=filepath, schema=self.context
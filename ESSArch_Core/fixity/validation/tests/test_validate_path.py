@@ -0,0 +1,177 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from glob2 import glob
+
+from ESSArch_Core.exceptions import ValidationError
+from ESSArch_Core.fixity.models import Validation
+from ESSArch_Core.fixity.validation import (
+    AVAILABLE_VALIDATORS,
+    _compile_path_patterns,
+    _path_matches,
+    _validate_directory,
+    validate_path,
+)
+from ESSArch_Core.fixity.validation.backends.base import BaseValidator
+from ESSArch_Core.fixity.validation.backends.filename import FilenameValidator
+
+
+class RecordingValidator(BaseValidator):
+    validated = []
+
+    def validate(self, filepath, expected=None):
+        self.validated.append(filepath)
+
+
+class FailingValidator(BaseValidator):
+    def validate(self, filepath, expected=None):
+        if os.path.basename(filepath) == self.options['fail']:
+            raise ValidationError('{} is invalid'.format(filepath))
+
+
+class PathMatchesTests(SimpleTestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+
+        self.files = []
+        for relpath in [
+            'a.xml', 'b.txt', '.hidden.xml',
+            'content/c.xml', 'content/d.pdf', 'content/.e.xml',
+            'content/sub/f.xml', 'content/.hiddendir/g.xml',
+            'metadata/h.xml', 'metadata/sub/deep/i.xml',
+        ]:
+            path = os.path.join(self.datadir, relpath)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write('foo')
+            self.files.append(path)
+
+    def test_same_as_glob(self):
+        patterns = [
+            '*', '*.xml', '.*', '**', '**/*.xml', '**/.*',
+            'content/*', 'content/**', 'content/**/*.xml', 'content/?.xml', 'content/[cd].*',
+            'content/[!c].*', '*/sub/*.xml', '**/sub/**', 'metadata/**/i.xml', 'a.xml', 'missing.xml',
+        ]
+
+        for pattern in patterns:
+            with self.subTest(pattern=pattern):
+                pattern = os.path.join(self.datadir, pattern)
+                expected = {path for path in glob(pattern) if os.path.isfile(path)}
+                matched = {path for path in self.files if _path_matches(path, _compile_path_patterns([pattern], {}))}
+                self.assertEqual(matched, expected)
+
+    def test_formatted_pattern(self):
+        pattern = os.path.join(self.datadir, '{dir}', '*.xml')
+        path = os.path.join(self.datadir, 'content', 'c.xml')
+
+        self.assertTrue(_path_matches(path, _compile_path_patterns([pattern], {'dir': 'content'})))
+        self.assertFalse(_path_matches(path, _compile_path_patterns([pattern], {'dir': 'metadata'})))
+
+    @mock.patch('ESSArch_Core.fixity.validation.os.altsep', '/')
+    @mock.patch('ESSArch_Core.fixity.validation.os.sep', '\\')
+    def test_alternative_separator(self):
+        patterns = _compile_path_patterns(['C:\\data/content/*.xml'], {})
+
+        self.assertTrue(_path_matches('C:\\data\\content\\c.xml', patterns))
+        self.assertTrue(_path_matches('C:/data/content/c.xml', patterns))
+        self.assertFalse(_path_matches('C:\\data\\metadata\\h.xml', patterns))
+
+    @mock.patch.dict(AVAILABLE_VALIDATORS, {'recording': '{}.RecordingValidator'.format(__name__)})
+    @mock.patch('ESSArch_Core.fixity.validation.VALIDATION_CHUNK_SIZE', 2)
+    def test_patterns_compiled_once(self):
+        RecordingValidator.validated = []
+        profile = mock.Mock(specification={
+            'recording': [{'include': ['**/*.xml'], 'exclude': ['metadata/**']}],
+        })
+
+        with mock.patch(
+            'ESSArch_Core.fixity.validation._compile_path_patterns', wraps=_compile_path_patterns,
+        ) as compile_patterns:
+            validate_path(self.datadir, ['recording'], profile, workers=2)
+
+        self.assertEqual(compile_patterns.call_count, 2)
+        self.assertEqual(len(RecordingValidator.validated), 4)
+
+    @mock.patch.dict(AVAILABLE_VALIDATORS, {'recording': '{}.RecordingValidator'.format(__name__)})
+    def test_validate_path_with_include_and_exclude(self):
+        RecordingValidator.validated = []
+        profile = mock.Mock(specification={
+            'recording': [{'include': ['**/*.xml'], 'exclude': ['metadata/**']}],
+        })
+
+        validate_path(self.datadir, ['recording'], profile)
+
+        self.assertCountEqual(RecordingValidator.validated, [
+            os.path.join(self.datadir, 'a.xml'),
+            os.path.join(self.datadir, 'content', 'c.xml'),
+            os.path.join(self.datadir, 'content', 'sub', 'f.xml'),
+            os.path.join(self.datadir, 'content', '.hiddendir', 'g.xml'),
+        ])
+
+
+@mock.patch('ESSArch_Core.fixity.validation.VALIDATION_CHUNK_SIZE', 2)
+class ValidateDirectoryTests(TestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+        RecordingValidator.validated = []
+
+        self.files = []
+        for i in range(10):
+            path = os.path.join(self.datadir, 'sub%s' % (i % 3), '%s.txt' % i)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write('foo')
+            self.files.append(path)
+
+    def test_concurrent(self):
+        _validate_directory(self.datadir, [RecordingValidator(data={})], workers=4)
+        self.assertCountEqual(RecordingValidator.validated, self.files)
+
+    def test_path_variable_is_set_for_each_file(self):
+        class PathValidator(BaseValidator):
+            def validate(self, filepath, expected=None):
+                assert self.data['_PATH'] == filepath
+                RecordingValidator.validated.append(filepath)
+
+        _validate_directory(self.datadir, [PathValidator(data={})], workers=4)
+        self.assertCountEqual(RecordingValidator.validated, self.files)
+
+    def test_stop_at_failure(self):
+        for workers in (1, 4):
+            with self.subTest(workers=workers):
+                RecordingValidator.validated = []
+                validators = [FailingValidator(options={'fail': '0.txt'}), RecordingValidator()]
+
+                with self.assertRaises(ValidationError):
+                    _validate_directory(self.datadir, validators, workers=workers)
+                self.assertNotIn(self.files[0], RecordingValidator.validated)
+
+                RecordingValidator.validated = []
+                _validate_directory(self.datadir, validators, stop_at_failure=False, workers=workers)
+                self.assertCountEqual(RecordingValidator.validated, self.files)
+
+    def test_validations_saved_in_bulk(self):
+        with self.assertNumQueries(1):
+            _validate_directory(self.datadir, [FilenameValidator()], workers=1)
+
+        self.assertEqual(Validation.objects.filter(passed=True).count(), len(self.files))
+
+    def test_validations_saved_on_failure(self):
+        validators = [FailingValidator(options={'fail': '0.txt'}), FilenameValidator()]
+        with self.assertRaises(ValidationError):
+            _validate_directory(self.datadir, validators, workers=4)
+
+        self.assertGreater(Validation.objects.count(), 0)
+
+    def test_progress(self):
+        progress_callback = mock.Mock()
+        _validate_directory(self.datadir, [RecordingValidator()], workers=4, progress_callback=progress_callback)
+
+        progress_callback.assert_called_with(10, 10, validators={
+            'RecordingValidator': {'files': 10, 'files_per_second': mock.ANY},
+        })
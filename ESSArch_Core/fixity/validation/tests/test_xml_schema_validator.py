@@ -9,6 +9,7 @@ from django.test import TestCase
 from lxml import etree
 from lxml.etree import DocumentInvalid
 
+from ESSArch_Core.essxml.util import clear_xmlschema_cache
 from ESSArch_Core.exceptions import ValidationError
 from ESSArch_Core.fixity.models import Validation
 from ESSArch_Core.fixity.validation.backends.xml import (
@@ -32,6 +33,7 @@ class XMLSchemaValidatorTests(TestCase):
     def setUp(self):
         self.datadir = tempfile.mkdtemp()
         self.addCleanup(shutil.rmtree, self.datadir)
+        self.addCleanup(clear_xmlschema_cache)
 
     @staticmethod
     def create_schema():
@@ -158,7 +160,8 @@ class XMLSchemaValidatorTests(TestCase):
         with self.assertRaises(ValidationError):
             validator.validate(bad_xml_file_path)
 
-        mock_download.assert_called_once()
+        # the compiled schema is reused
+        mock_download.assert_not_called()
 
         expected_error_message = "Element 'price': 'foo' is not a valid value of the atomic type 'xs:decimal'"
         # self.assertTrue(Validation.objects.filter(message__icontains=expected_error_message).exists())
@@ -3,14 +3,18 @@ import os
 import shutil
 import tempfile
 from io import StringIO
+from unittest import mock
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from lxml import etree
 from pyfakefs import fake_filesystem_unittest
 
 from ESSArch_Core.configuration.models import Path
 from ESSArch_Core.essxml.Generator.xmlGenerator import XMLGenerator
+from ESSArch_Core.essxml.util import XMLFileIndex
 from ESSArch_Core.exceptions import ValidationError
+from ESSArch_Core.fixity.checksum import calculate_checksum
 from ESSArch_Core.fixity.format import FormatIdentifier
 from ESSArch_Core.fixity.models import Validation
 from ESSArch_Core.fixity.validation.backends.checksum import ChecksumValidator
@@ -60,6 +64,17 @@ class ChecksumValidatorTests(TestCase, fake_filesystem_unittest.TestCase):
         with self.assertRaises(ValidationError):
             self.validator.validate(self.test_file)
 
+    @mock.patch('ESSArch_Core.fixity.validation.backends.checksum.calculate_checksum')
+    def test_cache_is_opt_in(self, mock_checksum):
+        mock_checksum.return_value = self.checksum
+
+        ChecksumValidator(context='checksum_str', options={'expected': self.checksum}).validate(self.test_file)
+        mock_checksum.assert_called_once_with(self.test_file, algorithm='md5', block_size=mock.ANY, use_cache=False)
+
+        options = {'expected': self.checksum, 'use_cache': True}
+        ChecksumValidator(context='checksum_str', options=options).validate(self.test_file)
+        mock_checksum.assert_called_with(self.test_file, algorithm='md5', block_size=mock.ANY, use_cache=True)
+
 
 class ChecksumValidatorXMLTests(TestCase):
     """
@@ -140,6 +155,22 @@ class ChecksumValidatorXMLTests(TestCase):
         self.validator.validate(self.test_file.name)
         self.validator.validate(test_file2.name)
 
+    def test_xml_file_indexed_once_per_validator(self):
+        xml_str = '<root><file CHECKSUM="{hash}" CHECKSUMTYPE="{alg}"><FLocat href="{file}"/></file></root>'.format(
+            hash=self.checksum, alg='md5', file=self.test_file.name)
+        self.xml_file.write(xml_str.encode('utf-8'))
+        self.xml_file.close()
+
+        options = {'expected': self.xml_file.name, 'algorithm': 'md5'}
+        with mock.patch('ESSArch_Core.essxml.util.XMLFileIndex', side_effect=XMLFileIndex) as mock_index:
+            validator = ChecksumValidator(context='xml_file', options=options)
+            validator.validate(self.test_file.name)
+            validator.validate(self.test_file.name)
+            self.assertEqual(mock_index.call_count, 1)
+
+            ChecksumValidator(context='xml_file', options=options).validate(self.test_file.name)
+            self.assertEqual(mock_index.call_count, 2)
+
 
 class FormatValidatorTests(TestCase):
     def setUp(self):
@@ -819,6 +850,87 @@ class DiffCheckValidatorTests(TestCase):
         with self.assertRaisesRegex(ValidationError, msg):
             self.validator.validate(self.datadir)
 
+    def change_file_keeping_stat(self, path, content):
+        st = os.stat(path)
+        with open(path, 'w') as f:
+            f.write(content)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+    @override_settings(FILE_MANIFEST_CACHE_TIMEOUT=60)
+    @mock.patch('ESSArch_Core.fixity.validation.backends.xml.calculate_checksum', side_effect=calculate_checksum)
+    def test_quick_validation_skips_unchanged_files(self, mock_checksum):
+        self.addCleanup(cache.clear)
+        files = self.create_files()
+        self.generate_xml()
+
+        self.validator = DiffCheckValidator(context=self.fname, options=dict(self.options, quick=True))
+        self.validator.validate(self.datadir)
+        mock_checksum.assert_not_called()
+
+        # a change that keeps the size and modification time is only found by an audit
+        self.change_file_keeping_stat(files[0], 'x')
+        self.validator.validate(self.datadir)
+        mock_checksum.assert_not_called()
+
+        self.validator = DiffCheckValidator(context=self.fname, options=dict(self.options, quick=True, audit=True))
+        msg = '2 confirmed, 0 added, 1 changed, 0 renamed, 0 deleted$'
+        with self.assertRaisesRegex(ValidationError, msg):
+            self.validator.validate(self.datadir)
+        mock_checksum.assert_any_call(files[0], algorithm=mock.ANY, use_cache=False)
+
+    @override_settings(FILE_MANIFEST_CACHE_TIMEOUT=60)
+    def test_quick_validation_with_modified_file(self):
+        self.addCleanup(cache.clear)
+        files = self.create_files()
+        self.generate_xml()
+
+        with open(files[0], 'w') as f:
+            f.write('x')
+
+        self.validator = DiffCheckValidator(context=self.fname, options=dict(self.options, quick=True))
+        msg = '2 confirmed, 0 added, 1 changed, 0 renamed, 0 deleted$'
+        with self.assertRaisesRegex(ValidationError, msg):
+            self.validator.validate(self.datadir)
+
+    @override_settings(FILE_MANIFEST_CACHE_TIMEOUT=0)
+    @mock.patch('ESSArch_Core.fixity.validation.backends.xml.calculate_checksum', side_effect=calculate_checksum)
+    def test_quick_validation_without_manifest_checks_every_file(self, mock_checksum):
+        self.addCleanup(cache.clear)
+        files = self.create_files()
+        self.generate_xml()
+
+        self.validator = DiffCheckValidator(context=self.fname, options=dict(self.options, quick=True))
+        self.validator.validate(self.datadir)
+        self.assertEqual(mock_checksum.call_count, len(files))
+
+    @override_settings(FILE_MANIFEST_CACHE_TIMEOUT=60)
+    def test_quick_validation_with_audit_interval(self):
+        self.addCleanup(cache.clear)
+        files = self.create_files()
+        self.generate_xml()
+        self.change_file_keeping_stat(files[0], 'x')
+
+        options = dict(self.options, quick=True, audit_interval=60 * 60)
+        self.validator = DiffCheckValidator(context=self.fname, options=options)
+        with mock.patch.object(cache, 'set', wraps=cache.set) as mock_cache_set:
+            with self.assertRaises(ValidationError):
+                self.validator.validate(self.datadir)
+
+        mock_cache_set.assert_called_once_with(self.validator._get_audit_cache_key(), mock.ANY, 60 * 60)
+
+        # the audit was just done
+        self.validator.validate(self.datadir)
+
+    def test_audit_without_interval_is_not_cached(self):
+        self.addCleanup(cache.clear)
+        self.create_files()
+        self.generate_xml()
+
+        self.validator = DiffCheckValidator(context=self.fname, options=dict(self.options, audit=True))
+        self.validator.validate(self.datadir)
+
+        self.assertIsNone(cache.get(self.validator._get_audit_cache_key()))
+
 
 class DiffCheckValidatorRecursiveTests(TestCase):
     @classmethod
@@ -101,7 +101,7 @@ from ESSArch_Core.profiles.models import (
 )
 from ESSArch_Core.profiles.utils import fill_specification_data
 from ESSArch_Core.search.importers import get_backend as get_importer
-from ESSArch_Core.search.ingest import index_path
+from ESSArch_Core.search.ingest import index_paths
 from ESSArch_Core.storage.exceptions import (
     StorageMediumError,
     StorageMediumFull,
@@ -122,8 +122,10 @@ from ESSArch_Core.util import (
     find_destination,
     generate_file_response,
     get_files_and_dirs,
+    get_tar_index_path,
     get_tree_size_and_count,
     in_directory,
+    list_tar_files,
     normalize_path,
     open_file,
     timestamp_to_datetime,
@@ -1006,19 +1008,7 @@ class InformationPackage(models.Model):
         fullpath = os.path.join(self.object_path, path).rstrip('/')
         if os.path.basename(self.object_path) == path and os.path.isfile(self.object_path):
             if expand_container and tarfile.is_tarfile(self.object_path):
-                with tarfile.open(self.object_path) as tar:
-                    entries = []
-                    for member in tar.getmembers():
-                        if not member.isfile():
-                            continue
-
-                        entries.append({
-                            "name": member.name,
-                            "type": 'file',
-                            "size": member.size,
-                            "modified": timestamp_to_datetime(member.mtime),
-                        })
-                    return entries
+                return list_tar_files(self.object_path)
 
             elif expand_container and zipfile.is_zipfile(self.object_path) and \
                     os.path.splitext(self.object_path)[1] == '.zip':
@@ -1037,19 +1027,7 @@ class InformationPackage(models.Model):
                     return entries
 
         if expand_container and os.path.isfile(fullpath) and tarfile.is_tarfile(fullpath):
-            with tarfile.open(fullpath) as tar:
-                entries = []
-                for member in tar.getmembers():
-                    if not member.isfile():
-                        continue
-
-                    entries.append({
-                        "name": member.name,
-                        "type": 'file',
-                        "size": member.size,
-                        "modified": timestamp_to_datetime(member.mtime),
-                    })
-                return entries
+            return list_tar_files(fullpath)
 
         elif expand_container and os.path.isfile(fullpath) and zipfile.is_zipfile(fullpath) and \
                 os.path.splitext(fullpath)[1] == '.zip':
@@ -2827,19 +2805,20 @@ class InformationPackage(models.Model):
             if group is not None:
                 group = group.group
 
-            for root, dirs, files in walk(srcdir):
-                for d in dirs:
-                    src = os.path.join(root, d)
-                    index_path(self, src, group=group, index_file_content=index_files_content)
+            indexed_files = set(indexed_files)
 
-                for f in files:
-                    src = os.path.join(root, f)
-                    try:
-                        # check if file has already been indexed
-                        indexed_files.remove(src)
-                    except ValueError:
-                        # file has not been indexed, index it
-                        index_path(self, src, group=group, index_file_content=index_files_content)
+            def paths_to_index():
+                for root, dirs, files in walk(srcdir):
+                    for d in dirs:
+                        yield os.path.join(root, d)
+
+                    for f in files:
+                        src = os.path.join(root, f)
+                        # skip files that have already been indexed
+                        if src not in indexed_files:
+                            yield src
+
+            index_paths(self, paths_to_index(), group=group, index_file_content=index_files_content)
 
         InformationPackageDocument.from_obj(self).save()
 
@@ -3095,7 +3074,8 @@ class InformationPackage(models.Model):
             shutil.rmtree(path)
         else:
             no_ext = os.path.splitext(path)[0]
-            for fl in [no_ext + '.' + ext for ext in ['xml', 'tar', 'zip']]:
+            files = [no_ext + '.' + ext for ext in ['xml', 'tar', 'zip']]
+            for fl in files + [get_tar_index_path(no_ext + '.tar')]:
                 try:
                     os.remove(fl)
                 except OSError as e:
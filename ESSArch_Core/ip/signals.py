@@ -3,12 +3,19 @@ import logging
 import os
 import shutil
 
-from django.db.models.signals import post_delete, pre_delete
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 
+from ESSArch_Core.auth.util import invalidate_object_visibility
 from ESSArch_Core.ip.models import InformationPackage, Workarea
 
 
+@receiver(post_save, sender=InformationPackage)
+def ip_post_save(sender, instance, created, **kwargs):
+    if created:
+        invalidate_object_visibility()
+
+
 @receiver(pre_delete, sender=InformationPackage)
 def ip_pre_delete(sender, instance, using, **kwargs):
     logger = logging.getLogger('essarch.core')
@@ -20,6 +27,7 @@ def ip_post_delete(sender, instance, using, **kwargs):
     logger = logging.getLogger('essarch.core')
     logger.info('Information package %s was deleted' % instance.pk)
     instance.informationpackagegroupobjects_set.all().delete()
+    invalidate_object_visibility()
 
     try:
         if instance.aic is not None and not instance.aic.information_packages.exists():
@@ -75,6 +75,7 @@ from ESSArch_Core.util import (
     pretty_mb_per_sec,
     pretty_size,
     pretty_time_to_sec,
+    write_tar_index,
     zip_directory,
 )
 from ESSArch_Core.WorkflowEngine.models import ProcessTask
@@ -423,6 +424,9 @@ def CreateContainer(self, src, dst):
             new_tar.format = settings.TARFILE_FORMAT
             new_tar.add(src, base_dir)
 
+        if not compress:
+            write_tar_index(dst)
+
     msg = "Created {}".format(dst)
     self.create_success_event(msg)
 
@@ -515,7 +519,8 @@ def Validate(self, backend, path=None, context=None, include=None,
     validate_directory(path=path,
                        validators=validators,
                        ip=ip,
-                       responsible=user)
+                       responsible=user,
+                       progress_callback=self.set_progress)
 
     Notification.objects.create(
         message=gettext('{backend} job done for {ip}').format(
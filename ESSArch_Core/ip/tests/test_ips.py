@@ -1800,7 +1800,7 @@ class InformationPackageViewSetPreserveTestCase(ESSArchSearchBaseTestCase):
             f.write('application/x-tar tar\n')
 
     @TaskRunner()
-    @mock.patch('ESSArch_Core.tags.documents.requests.put')
+    @mock.patch('ESSArch_Core.tags.documents.tika_put')
     @mock.patch('ESSArch_Core.fixity.validation.backends.xml.validate_against_schema')
     def test_preserve_aip(self, mock_validate_schema, mock_requests_put):
         mock_requests_put.return_value.status_code = 200
@@ -1882,7 +1882,7 @@ class InformationPackageViewSetPreserveTestCase(ESSArchSearchBaseTestCase):
         self.assertEqual(os.listdir(tempdir), [])
 
     @TaskRunner()
-    @mock.patch('ESSArch_Core.tags.documents.requests.put')
+    @mock.patch('ESSArch_Core.tags.documents.tika_put')
     @mock.patch('ESSArch_Core.fixity.validation.backends.xml.validate_against_schema')
     def test_preserve_aip_to_disabled_method(self, _, mock_requests_put):
         mock_requests_put.return_value.status_code = 200
@@ -1929,7 +1929,7 @@ class InformationPackageViewSetPreserveTestCase(ESSArchSearchBaseTestCase):
         self.assertFalse(ip.archived)
 
     @TaskRunner()
-    @mock.patch('ESSArch_Core.tags.documents.requests.put')
+    @mock.patch('ESSArch_Core.tags.documents.tika_put')
     @mock.patch('ESSArch_Core.fixity.validation.backends.xml.validate_against_schema')
     def test_preserve_aip_to_disabled_target(self, _, mock_requests_put):
         mock_requests_put.return_value.status_code = 200
@@ -3943,7 +3943,7 @@ class ArchivedFilesActionTests(ESSArchSearchBaseTransactionTestCase):
         self.url = reverse('informationpackage-files', args=(self.ip.pk,))
         sa.lock_to_information_package(self.ip, self.user)
 
-    @mock.patch('ESSArch_Core.tags.documents.requests.put')
+    @mock.patch('ESSArch_Core.tags.documents.tika_put')
     def test_get_archived_dir_from_short_term(self, mock_requests_put):
         mock_requests_put.return_value.status_code = 200
         mock_requests_put.return_value.content = b"mocked tika content"
@@ -3987,7 +3987,7 @@ class ArchivedFilesActionTests(ESSArchSearchBaseTransactionTestCase):
             ]
         )
 
-    @mock.patch('ESSArch_Core.tags.documents.requests.put')
+    @mock.patch('ESSArch_Core.tags.documents.tika_put')
     def test_get_archived_file_from_short_term(self, mock_requests_put):
         mock_requests_put.return_value.status_code = 200
         mock_requests_put.return_value.content = b"mocked tika content"
@@ -4036,7 +4036,7 @@ class ArchivedFilesActionTests(ESSArchSearchBaseTransactionTestCase):
         self.assertContains(res, 'hello nested world')
         res.close()
 
-    @mock.patch('ESSArch_Core.tags.documents.requests.put')
+    @mock.patch('ESSArch_Core.tags.documents.tika_put')
     def test_get_archived_file_from_long_term(self, mock_requests_put):
         mock_requests_put.return_value.status_code = 200
         mock_requests_put.return_value.content = b"mocked tika content"
@@ -40,7 +40,11 @@ from ESSArch_Core.storage.tests.helpers import (
     add_storage_method_rel,
     add_storage_obj,
 )
-from ESSArch_Core.util import normalize_path, timestamp_to_datetime
+from ESSArch_Core.util import (
+    get_tar_index_path,
+    normalize_path,
+    timestamp_to_datetime,
+)
 from ESSArch_Core.WorkflowEngine.models import ProcessStep, ProcessTask
 from ESSArch_Core.WorkflowEngine.util import create_workflow
 
@@ -756,6 +760,25 @@ class InformationPackageGetPathTests(TestCase):
         self.assertEqual(ip.get_path(), "path/to/the/object.tar")
 
 
+class InformationPackageDeleteFilesTests(TestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+
+    def test_delete_container(self):
+        container = os.path.join(self.datadir, 'foo.tar')
+        files = [container, os.path.join(self.datadir, 'foo.xml'), get_tar_index_path(container)]
+        for f in files:
+            open(f, 'a').close()
+        open(os.path.join(self.datadir, 'bar.tar'), 'a').close()
+
+        InformationPackage.objects.create(object_path=container).delete_files()
+
+        for f in files:
+            self.assertFalse(os.path.exists(f))
+        self.assertEqual(os.listdir(self.datadir), ['bar.tar'])
+
+
 class InformationPackageGenerationTests(TestCase):
 
     def setUp(self):
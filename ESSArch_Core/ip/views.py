@@ -146,6 +146,7 @@ from ESSArch_Core.util import (
     remove_prefix,
     timestamp_to_datetime,
     wait_for_chunks,
+    write_file_chunk,
     zip_directory,
 )
 from ESSArch_Core.WorkflowEngine.filters import (
@@ -1436,17 +1437,7 @@ class InformationPackageViewSet(viewsets.ModelViewSet):
         if f.size != end - start + 1:
             raise exceptions.ParseError("File size doesn't match headers")
 
-        if start == 0:
-            with open(filename, 'wb') as dstf:
-                dstf.write(f.read())
-                dstf.flush()              # Flush Python buffer
-                os.fsync(dstf.fileno())   # Flush OS buffer to disk
-        else:
-            with open(filename, 'ab') as dstf:
-                dstf.seek(start)
-                dstf.write(f.read())
-                dstf.flush()              # Flush Python buffer
-                os.fsync(dstf.fileno())   # Flush OS buffer to disk
+        write_file_chunk(filename, f, start)
 
         upload_id = request.data.get('upload_id', uuid.uuid4().hex)
         return Response({'upload_id': upload_id})
@@ -3150,17 +3141,7 @@ class InformationPackageReceptionViewSet(viewsets.ViewSet, PaginatedViewMixin):
         if f.size != end - start + 1:
             raise exceptions.ParseError("File size doesn't match headers")
 
-        if start == 0:
-            with open(filename, 'wb') as dstf:
-                dstf.write(f.read())
-                dstf.flush()              # Flush Python buffer
-                os.fsync(dstf.fileno())   # Flush OS buffer to disk
-        else:
-            with open(filename, 'ab') as dstf:
-                dstf.seek(start)
-                dstf.write(f.read())
-                dstf.flush()              # Flush Python buffer
-                os.fsync(dstf.fileno())   # Flush OS buffer to disk
+        write_file_chunk(filename, f, start)
 
         upload_id = request.data.get('upload_id', uuid.uuid4().hex)
         return Response({'upload_id': upload_id})
@@ -1,10 +1,33 @@
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+import weakref
 from logging import Handler
 
 from django.core.cache import cache
+from django.db import close_old_connections, connections
 from django.utils.text import Truncator
 
 from ESSArch_Core._version import get_versions
 
+_buffered_handlers = weakref.WeakSet()
+
+_FLUSH = object()
+_STOP = object()
+
+
+def flush_buffered_handlers():
+    """
+    Writes all events queued in buffered handlers of the current process to
+    the database
+    """
+
+    for handler in list(_buffered_handlers):
+        handler.flush()
+
 
 class DBHandler(Handler):
     model_name = 'ESSArch_Core.ip.models.EventIP'
@@ -16,57 +39,202 @@ class DBHandler(Handler):
         self.agent_role = agent_role
         self.version = get_versions()['version']
 
-    def emit(self, record):
+    def get_event_model(self):
         try:
-            EventIP = self.get_model(self.model_name)
+            return self.get_model(self.model_name)
         except Exception:
             from ESSArch_Core.ip.models import EventIP
+            return EventIP
 
+    def get_event_type_model(self):
         try:
-            EventType = self.get_model(self.event_type_model_name)
+            return self.get_model(self.event_type_model_name)
         except Exception:
             from ESSArch_Core.configuration.models import EventType
+            return EventType
+
+    def is_enabled(self, event_type):
+        cache_name = 'event_type_%s_enabled' % event_type
+        enabled = cache.get(cache_name)
+
+        if enabled is None:
+            EventType = self.get_event_type_model()
+            try:
+                enabled = EventType.objects.values_list('enabled', flat=True).get(pk=event_type)
+            except EventType.DoesNotExist as e:
+                message_info = 'No "EventType" found for: {}'.format(event_type)
+                raise ValueError(message_info) from e
+            cache.set(cache_name, enabled, 3600)
+
+        return enabled
+
+    def build_event(self, record):
+        """
+        Returns an unsaved event for the record or None if no event should be
+        created
+        """
 
         if getattr(record, 'event_type', None) is None:
-            return
+            return None
 
         forced = getattr(record, 'force', False)
-        enabled = False
+        if not forced and not self.is_enabled(record.event_type):
+            return None
 
-        if not forced:
-            cache_name = 'event_type_%s_enabled' % record.event_type
-            enabled = cache.get(cache_name)
+        EventIP = self.get_event_model()
 
-            if enabled is None:
-                try:
-                    enabled = EventType.objects.values_list('enabled', flat=True).get(pk=record.event_type)
-                except EventType.DoesNotExist as e:
-                    message_info = 'No "EventType" found for: {}'.format(record.event_type)
-                    raise ValueError(message_info) from e
-                cache.set(cache_name, enabled, 3600)
-
-        if enabled or forced:
-            obj = getattr(record, 'object', '')
-            if obj is None:
-                obj = ''
-
-            agent = getattr(record, 'agent', '')
-            if agent is None:
-                agent = ''
-
-            EventIP.objects.create(
-                eventType_id=record.event_type,
-                application=self.application,
-                task_id=getattr(record, 'task', None),
-                eventVersion=self.version,
-                eventOutcome=getattr(record, 'outcome', EventIP.SUCCESS if record.levelno < 40 else EventIP.FAILURE),
-                eventOutcomeDetailNote=Truncator(record.getMessage()).chars(1024, truncate=' (truncated)'),
-                linkingAgentIdentifierValue=agent,
-                linkingAgentRole=self.agent_role,
-                linkingObjectIdentifierValue=obj,
-            )
+        obj = getattr(record, 'object', '')
+        if obj is None:
+            obj = ''
+
+        agent = getattr(record, 'agent', '')
+        if agent is None:
+            agent = ''
+
+        return EventIP(
+            eventType_id=record.event_type,
+            application=self.application,
+            task_id=getattr(record, 'task', None),
+            eventVersion=self.version,
+            eventOutcome=getattr(record, 'outcome', EventIP.SUCCESS if record.levelno < 40 else EventIP.FAILURE),
+            eventOutcomeDetailNote=Truncator(record.getMessage()).chars(1024, truncate=' (truncated)'),
+            linkingAgentIdentifierValue=agent,
+            linkingAgentRole=self.agent_role,
+            linkingObjectIdentifierValue=obj,
+        )
+
+    def emit(self, record):
+        event = self.build_event(record)
+        if event is not None:
+            event.save()
 
     def get_model(self, name):
         names = name.split('.')
         mod = __import__('.'.join(names[:-1]), fromlist=names[-1:])
         return getattr(mod, names[-1])
+
+
+class BufferedDBHandler(DBHandler):
+    """
+    Queues events and writes them to the database in batches from a
+    background thread, either when batch_size events have been queued or
+    flush_interval seconds after the first event in the batch was queued.
+
+    At most max_queue_size events are queued, when the queue is full the
+    logging thread waits for the writer for up to put_timeout seconds before
+    writing the event itself.
+
+    Queued events are written when the handler is flushed or closed, e.g. by
+    logging.shutdown() at exit.
+    """
+
+    def __init__(self, application="ESSArch", agent_role="", batch_size=100, flush_interval=1.0,
+                 max_queue_size=10000, put_timeout=30):
+        super().__init__(application=application, agent_role=agent_role)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.put_timeout = put_timeout
+
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        _buffered_handlers.add(self)
+
+    def _ensure_writer(self):
+        # threads don't survive a fork, start a new writer with an empty
+        # queue in the child, the parent writes what was already queued
+        if self._writer_is_running():
+            return
+
+        with self._start_lock:
+            if self._writer_is_running():
+                return
+
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(self.max_queue_size)
+                self._pid = os.getpid()
+
+            self._thread = threading.Thread(target=self._writer, name='BufferedDBHandler', daemon=True)
+            self._thread.start()
+
+    def _writer(self):
+        q = self._queue
+        try:
+            while True:
+                item = q.get()
+                batch = []
+                markers = 0
+                deadline = time.monotonic() + self.flush_interval
+
+                while True:
+                    if item is _FLUSH or item is _STOP:
+                        markers += 1
+                        break
+
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+
+                    try:
+                        item = q.get(timeout=max(0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+
+                try:
+                    if batch:
+                        close_old_connections()
+                        self.write_events(batch)
+                finally:
+                    for _ in range(len(batch) + markers):
+                        q.task_done()
+
+                if item is _STOP:
+                    return
+        finally:
+            connections.close_all()
+
+    def write_events(self, events):
+        try:
+            self.get_event_model().objects.bulk_create(events)
+        except Exception:
+            # write the events separately to only lose the invalid ones
+            for event in events:
+                try:
+                    event.save()
+                except Exception:
+                    traceback.print_exc(file=sys.stderr)
+
+    def emit(self, record):
+        event = self.build_event(record)
+        if event is None:
+            return
+
+        self._ensure_writer()
+        try:
+            self._queue.put(event, timeout=self.put_timeout)
+        except queue.Full:
+            event.save()
+
+    def _writer_is_running(self):
+        return self._pid == os.getpid() and self._thread is not None and self._thread.is_alive()
+
+    def flush(self):
+        """
+        Blocks until all queued events have been written
+        """
+
+        if self._writer_is_running():
+            self._queue.put(_FLUSH)
+            self._queue.join()
+
+    def close(self):
+        try:
+            if self._writer_is_running():
+                self._queue.put(_STOP)
+                self._thread.join()
+            self._thread = None
+        finally:
+            _buffered_handlers.discard(self)
+            super().close()
@@ -0,0 +1,123 @@
+import logging
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from ESSArch_Core.configuration.models import EventType
+from ESSArch_Core.ip.models import EventIP
+from ESSArch_Core.log.dbhandler import (
+    BufferedDBHandler,
+    DBHandler,
+    flush_buffered_handlers,
+)
+
+
+def make_record(msg='foo', **extra):
+    record = logging.LogRecord('essarch', logging.INFO, __file__, 1, msg, None, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class DBHandlerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.event_type = EventType.objects.create(eventType=10, category=EventType.CATEGORY_INFORMATION_PACKAGE)
+
+    def test_record_without_event_type(self):
+        DBHandler().emit(make_record())
+        self.assertFalse(EventIP.objects.exists())
+
+    def test_emit(self):
+        DBHandler(agent_role='Producer').emit(make_record('foo', event_type=10, object='bar', agent='baz'))
+
+        event = EventIP.objects.get()
+        self.assertEqual(event.eventOutcomeDetailNote, 'foo')
+        self.assertEqual(event.linkingObjectIdentifierValue, 'bar')
+        self.assertEqual(event.linkingAgentIdentifierValue, 'baz')
+        self.assertEqual(event.linkingAgentRole, 'Producer')
+
+    def test_missing_event_type(self):
+        with self.assertRaises(ValueError):
+            DBHandler().emit(make_record(event_type=999))
+
+    def test_write_events(self):
+        handler = BufferedDBHandler()
+        self.addCleanup(handler.close)
+        events = [handler.build_event(make_record(str(i), event_type=10)) for i in range(3)]
+
+        with self.assertNumQueries(1):
+            handler.write_events(events)
+
+        self.assertEqual(list(EventIP.objects.values_list('eventOutcomeDetailNote', flat=True)), ['0', '1', '2'])
+
+
+class BufferedDBHandlerTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(BufferedDBHandler, 'write_events')
+        self.mock_write = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_handler(self, **kwargs):
+        handler = BufferedDBHandler(**kwargs)
+        self.addCleanup(handler.close)
+        return handler
+
+    def test_events_are_written_in_batches(self):
+        handler = self.create_handler(batch_size=10, flush_interval=60)
+        for i in range(25):
+            handler.emit(make_record(str(i), event_type=10, force=True))
+        handler.flush()
+
+        written = [event for call in self.mock_write.call_args_list for event in call[0][0]]
+        self.assertEqual([e.eventOutcomeDetailNote for e in written], [str(i) for i in range(25)])
+        self.assertEqual([len(call[0][0]) for call in self.mock_write.call_args_list], [10, 10, 5])
+
+    def test_events_are_written_after_flush_interval(self):
+        written = threading.Event()
+        self.mock_write.side_effect = lambda events: written.set()
+
+        handler = self.create_handler(batch_size=10, flush_interval=0.01)
+        handler.emit(make_record(event_type=10, force=True))
+
+        self.assertTrue(written.wait(5))
+
+    def test_close_writes_queued_events(self):
+        handler = BufferedDBHandler(batch_size=10, flush_interval=60)
+        handler.emit(make_record(event_type=10, force=True))
+        handler.close()
+
+        self.assertEqual(len(self.mock_write.call_args[0][0]), 1)
+        self.assertIsNone(handler._thread)
+
+    def test_flush_buffered_handlers(self):
+        handler = self.create_handler(batch_size=10, flush_interval=60)
+        handler.emit(make_record(event_type=10, force=True))
+        flush_buffered_handlers()
+
+        self.mock_write.assert_called_once()
+
+    def test_event_is_saved_directly_when_queue_is_full(self):
+        release = threading.Event()
+        self.mock_write.side_effect = lambda events: release.wait(5)
+
+        handler = self.create_handler(batch_size=1, flush_interval=60, max_queue_size=1, put_timeout=0.01)
+        with mock.patch.object(EventIP, 'save') as mock_save:
+            for _ in range(3):
+                handler.emit(make_record(event_type=10, force=True))
+            release.set()
+
+        mock_save.assert_called()
+
+    def test_new_writer_in_forked_process(self):
+        handler = self.create_handler(batch_size=10, flush_interval=60)
+        handler.emit(make_record(event_type=10, force=True))
+        handler.flush()
+        thread = handler._thread
+
+        with mock.patch('ESSArch_Core.log.dbhandler.os.getpid', return_value=-1):
+            handler.emit(make_record(event_type=10, force=True))
+            self.assertIsNot(handler._thread, thread)
+            handler.close()
+
+        self.assertEqual(self.mock_write.call_count, 2)
@@ -806,7 +806,7 @@ class AppraisalJobViewSetRunTests(MaintenanceJobViewSetRunBaseTests):
 
     @TaskRunner()
     @override_settings(DELETE_PACKAGES_ON_APPRAISAL=True)
-    @mock.patch('ESSArch_Core.tags.documents.requests.put')
+    @mock.patch('ESSArch_Core.tags.documents.tika_put')
     @mock.patch('ESSArch_Core.fixity.validation.backends.xml.validate_against_schema')
     def test_delete_packages_with_file_pattern(self, m_validate, mock_requests_put):
         mock_requests_put.return_value.status_code = 200
@@ -898,7 +898,7 @@ class AppraisalJobViewSetRunTests(MaintenanceJobViewSetRunBaseTests):
 
     @TaskRunner()
     @override_settings(DELETE_PACKAGES_ON_APPRAISAL=False)
-    @mock.patch('ESSArch_Core.tags.documents.requests.put')
+    @mock.patch('ESSArch_Core.tags.documents.tika_put')
     @mock.patch('ESSArch_Core.fixity.validation.backends.xml.validate_against_schema')
     def test_inactivate_packages_with_file_pattern(self, m_validate, mock_requests_put):
         mock_requests_put.return_value.status_code = 200
@@ -957,7 +957,7 @@ class AppraisalJobViewSetRunTests(MaintenanceJobViewSetRunBaseTests):
 
     @TaskRunner()
     @override_settings(DELETE_PACKAGES_ON_APPRAISAL=True)
-    @mock.patch('ESSArch_Core.tags.documents.requests.put')
+    @mock.patch('ESSArch_Core.tags.documents.tika_put')
     @mock.patch('ESSArch_Core.fixity.validation.backends.xml.validate_against_schema')
     def test_delete_packages_files_using_document_tags(self, m_validate, mock_requests_put):
         mock_requests_put.return_value.status_code = 200
@@ -1593,7 +1593,7 @@ class ConversionJobViewSetRunTests(MaintenanceJobViewSetRunBaseTests):
         )
 
     @TaskRunner()
-    @mock.patch('ESSArch_Core.tags.documents.requests.put')
+    @mock.patch('ESSArch_Core.tags.documents.tika_put')
     @mock.patch('docker.models.containers.ContainerCollection.run')
     @mock.patch('ESSArch_Core.fixity.validation.backends.xml.validate_against_schema')
     def test_convert_packages_with_valid_specification(self, m_validate, mock_convert, mock_requests_put):
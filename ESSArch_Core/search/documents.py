@@ -1,10 +1,18 @@
 import logging
 import os
+import threading
 import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
 
 import elasticsearch_dsl as es
 from django.conf import settings
-from django.core.paginator import Paginator
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connections
 from elasticsearch import (
     ConnectionError,
     RequestError,
@@ -16,6 +24,89 @@ from elasticsearch_dsl.connections import get_connection as get_es_connection
 from ESSArch_Core.search.alias_migration import migrate
 from ESSArch_Core.util import pretty_size
 
+BULK_INITIAL_BACKOFF = 0.5
+BULK_MAX_BACKOFF = 60
+
+
+class BulkBackoff:
+    """
+    Delay shared between the threads sending bulk requests. It is doubled
+    each time Elasticsearch rejects a request with 429 Too Many Requests and
+    halved each time a request is accepted.
+    """
+
+    def __init__(self, initial=BULK_INITIAL_BACKOFF, maximum=BULK_MAX_BACKOFF):
+        self.initial = initial
+        self.maximum = maximum
+        self.delay = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        delay = self.delay
+        if delay:
+            time.sleep(delay)
+
+    def rejected(self):
+        with self._lock:
+            self.delay = min(self.maximum, max(self.initial, self.delay * 2))
+
+    def accepted(self):
+        with self._lock:
+            self.delay = 0 if self.delay <= self.initial else self.delay / 2
+
+
+def bulk_with_backoff(client, actions, backoff, max_retries=None, max_chunk_bytes=None):
+    """
+    Sends actions to Elasticsearch with the bulk API. Actions rejected with
+    429 Too Many Requests are retried after waiting for backoff, any other
+    failure raises BulkIndexError.
+    """
+
+    logger = logging.getLogger('essarch.search')
+    if max_retries is None:
+        max_retries = getattr(settings, 'ELASTICSEARCH_BULK_MAX_RETRIES', 10)
+    if max_chunk_bytes is None:
+        max_chunk_bytes = getattr(settings, 'ELASTICSEARCH_MAX_CHUNK_BYTES', 100 * 1024 * 1024)
+
+    actions = list(actions)
+    for attempt in range(max_retries + 1):
+        if not actions:
+            return
+
+        backoff.wait()
+        rejected = []
+        errors = []
+        try:
+            results = es_helpers.streaming_bulk(
+                client, actions, chunk_size=len(actions), max_chunk_bytes=max_chunk_bytes, raise_on_error=False,
+            )
+            for action, (ok, item) in zip(actions, results):
+                if ok:
+                    continue
+                if next(iter(item.values()))['status'] == 429:
+                    rejected.append(action)
+                else:
+                    errors.append(item)
+        except TransportError as e:
+            if e.status_code != 429 or attempt == max_retries:
+                raise
+            rejected = actions
+
+        if errors:
+            raise es_helpers.BulkIndexError('%i document(s) failed to index.' % len(errors), errors)
+
+        if not rejected:
+            backoff.accepted()
+            return
+
+        backoff.rejected()
+        logger.warning('Elasticsearch rejected {} of {} document(s), retrying in {}s'.format(
+            len(rejected), len(actions), backoff.delay,
+        ))
+        actions = rejected
+
+    raise es_helpers.BulkIndexError('%i document(s) rejected by Elasticsearch.' % len(actions), actions)
+
 
 class DocumentBase(es.Document):
     @classmethod
@@ -51,7 +142,17 @@ class DocumentBase(es.Document):
         migrate(cls, move_data=False, update_alias=True, delete_old_index=True)
 
     @classmethod
-    def index_documents(cls, batch_size=None, remove_stale=False, index_file_content=False, queryset=None):
+    def prepare_index_queryset(cls, queryset):
+        """
+        Adds the select_related and prefetch_related lookups needed by
+        from_obj to the queryset used for indexing.
+        """
+
+        return queryset
+
+    @classmethod
+    def index_documents(cls, batch_size=None, remove_stale=False, index_file_content=False, queryset=None,
+                        thread_count=None):
         """
         Main method for indexing the documents.
         """
@@ -64,99 +165,150 @@ class DocumentBase(es.Document):
             queryset = cls().get_index_queryset()
 
         # perform the indexing
-        if queryset:
-            cls.perform_index(queryset, batch_size, index_file_content)
+        cls.perform_index(queryset, batch_size, index_file_content, thread_count)
 
         # remove the stale values.
         if remove_stale:
             cls.remove_stale(queryset, batch_size)
 
     @classmethod
-    def perform_index(cls, queryset, batch_size, index_file_content=False):
+    def iter_index_batches(cls, queryset, batch_size):
+        """
+        Yields the objects in queryset in lists of at most batch_size objects,
+        paginated on the primary key instead of with offsets.
+        """
+
+        queryset = cls.prepare_index_queryset(queryset).order_by('pk')
+        last_pk = None
+        while True:
+            batch_qs = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            batch = list(batch_qs[:batch_size])
+            if batch:
+                yield batch
+            if len(batch) < batch_size:
+                return
+            last_pk = batch[-1].pk
+
+    @classmethod
+    def perform_index(cls, queryset, batch_size, index_file_content=False, thread_count=None):
         """
         Performs the indexing.
         """
         logger = logging.getLogger('essarch.search.documents.DocumentBase')
-        num = queryset.count()
-        logger.debug('Perform bulk index for {} objects with batch_size: {}'.format(num, batch_size))
-        conn = get_es_connection()
+        if thread_count is None:
+            thread_count = getattr(settings, 'ELASTICSEARCH_INDEX_THREADS', 1)
 
-        paginator = Paginator(queryset, batch_size)
-
-        for page_num in paginator.page_range:
-            batch_qs = paginator.page(page_num).object_list
+        logger.debug('Perform bulk index with batch_size: {} and {} threads'.format(batch_size, thread_count))
+        conn = get_es_connection()
+        backoff = BulkBackoff()
+        batches = cls.iter_index_batches(queryset, batch_size)
+
+        if thread_count <= 1:
+            for batch_qs in batches:
+                cls.index_batch(conn, batch_qs, index_file_content, backoff)
+            return
+
+        executor = ThreadPoolExecutor(max_workers=thread_count)
+        try:
+            pending = set()
+            for batch_qs in batches:
+                if len(pending) >= thread_count * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+
+                pending.add(executor.submit(cls._index_batch_in_thread, conn, batch_qs, index_file_content, backoff))
+
+            for future in as_completed(pending):
+                future.result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
 
-            try:
-                batch = cls.create_batch(batch_qs, index_file_content)
-                es_helpers.bulk(client=conn, actions=batch)
+    @classmethod
+    def _index_batch_in_thread(cls, conn, batch_qs, index_file_content, backoff):
+        try:
+            cls.index_batch(conn, batch_qs, index_file_content, backoff)
+        finally:
+            connections.close_all()
 
-            except TransportError as e:
-                if e.status_code != 413:
-                    logger.exception('Elasticsearch transport error during bulk indexing')
-                    raise
+    @classmethod
+    def index_batch(cls, conn, batch_qs, index_file_content=False, backoff=None):
+        """
+        Creates and sends the documents for a single batch of objects.
+        """
+        logger = logging.getLogger('essarch.search.documents.DocumentBase')
+        if backoff is None:
+            backoff = BulkBackoff()
 
-                logger.error(
-                    f'Bulk request too large (413) for batch size {len(batch_qs)}. '
-                    'Retrying documents individually.'
-                )
+        try:
+            batch = cls.create_batch(batch_qs, index_file_content)
+            bulk_with_backoff(conn, batch, backoff)
 
-                RETRY_WITHOUT_CONTENT_IF_TOO_LARGE = getattr(
-                    settings,
-                    'ELASTICSEARCH_RETRY_WITHOUT_CONTENT_IF_TOO_LARGE',
-                    False
-                )
+        except TransportError as e:
+            if e.status_code != 413:
+                logger.exception('Elasticsearch transport error during bulk indexing')
+                raise
 
-                for obj, action in zip(batch_qs, batch):
-                    try:
-                        es_helpers.bulk(client=conn, actions=[action])
+            logger.error(
+                f'Bulk request too large (413) for batch size {len(batch_qs)}. '
+                'Retrying documents individually.'
+            )
+
+            RETRY_WITHOUT_CONTENT_IF_TOO_LARGE = getattr(
+                settings,
+                'ELASTICSEARCH_RETRY_WITHOUT_CONTENT_IF_TOO_LARGE',
+                False
+            )
+
+            for obj, action in zip(batch_qs, batch):
+                try:
+                    bulk_with_backoff(conn, [action], backoff)
+
+                except TransportError as single_error:
+                    if single_error.status_code != 413:
+                        logger.exception(
+                            f"Elasticsearch error indexing document {obj.custom_fields.get('filename')} ({obj.pk})"
+                        )
+                        raise
 
-                    except TransportError as single_error:
-                        if single_error.status_code != 413:
-                            logger.exception(
-                                f"Elasticsearch error indexing document {obj.custom_fields.get('filename')} ({obj.pk})"
-                            )
-                            raise
+                    logger.warning(
+                        f"Document {obj.custom_fields.get('filename')} ({obj.pk}) too large for "
+                        "individual indexing."
+                    )
 
-                        logger.warning(
-                            f"Document {obj.custom_fields.get('filename')} ({obj.pk}) too large for "
-                            "individual indexing."
+                    if index_file_content and RETRY_WITHOUT_CONTENT_IF_TOO_LARGE:
+                        logger.info(
+                            f"Retrying document {obj.custom_fields.get('filename')} ({obj.pk}) without "
+                            "file content."
                         )
 
-                        if index_file_content and RETRY_WITHOUT_CONTENT_IF_TOO_LARGE:
-                            logger.info(
-                                f"Retrying document {obj.custom_fields.get('filename')} ({obj.pk}) without "
-                                "file content."
+                        try:
+                            single_batch = cls.create_batch(
+                                [obj],
+                                index_file_content=False
                             )
+                            bulk_with_backoff(conn, single_batch, backoff)
 
-                            try:
-                                single_batch = cls.create_batch(
-                                    [obj],
-                                    index_file_content=False
-                                )
-                                es_helpers.bulk(client=conn, actions=single_batch)
-
-                            except Exception:
-                                logger.exception(
-                                    f'Retry without content failed for document '
-                                    f"{obj.custom_fields.get('filename')} ({obj.pk})"
-                                )
-                                raise
-                        else:
-                            logger.error(
-                                f"Not retrying without content for {obj.custom_fields.get('filename')} "
-                                f"({obj.pk}) due to settings"
+                        except Exception:
+                            logger.exception(
+                                f'Retry without content failed for document '
+                                f"{obj.custom_fields.get('filename')} ({obj.pk})"
                             )
                             raise
+                    else:
+                        logger.error(
+                            f"Not retrying without content for {obj.custom_fields.get('filename')} "
+                            f"({obj.pk}) due to settings"
+                        )
+                        raise
 
-            except (ConnectionError, RequestError):
-                logger.exception('Elasticsearch connection/request error')
-                raise
-
-            except Exception:
-                logger.exception('Unexpected error indexing')
-                raise
+        except (ConnectionError, RequestError):
+            logger.exception('Elasticsearch connection/request error')
+            raise
 
-            time.sleep(0.3)
+        except Exception:
+            logger.exception('Unexpected error indexing')
+            raise
 
     @classmethod
     def create_batch(cls, objects, index_file_content=False):
@@ -165,7 +317,8 @@ class DocumentBase(es.Document):
         """
         logger = logging.getLogger('essarch.search')
         MAX_INDEX_SIZE = getattr(settings, 'ELASTICSEARCH_MAX_INDEX_SIZE', None)
-        batch = []
+        docs = []
+        content_jobs = []
         for obj in objects:
             doc = cls.from_obj(obj)
             obj_index_file_content = index_file_content
@@ -181,21 +334,97 @@ class DocumentBase(es.Document):
                 exclude_file_format_from_indexing_content = settings.EXCLUDE_FILE_FORMAT_FROM_INDEXING_CONTENT
                 format_registry_key = obj.custom_fields.get('formatkey', None)
                 if format_registry_key not in exclude_file_format_from_indexing_content:
-                    ip_file_path = os.path.join(obj.custom_fields['href'], obj.custom_fields['filename'])
-                    try:
-                        with obj.tag.information_package.open_file(ip_file_path, 'rb') as f:
-                            doc = cls.enrich_with_content(doc, file_obj=f)
-                        logger.debug('Indexed file content for {} with format registry key {} for ip {}'.format(
-                            obj.custom_fields['filename'], format_registry_key, obj.tag.information_package))
-                    except NotImplementedError:
-                        logger.warning('open_file is not implemented for the information package %s, skip to index '
-                                       'file content for %s', obj.tag.information_package, ip_file_path)
+                    content_jobs.append((doc, obj))
                 else:
                     logger.warning('Skip to index file content for {} with format registry key {} for ip {}'.format(
                         obj.custom_fields['filename'], format_registry_key, obj.tag.information_package))
 
-            batch.append(doc.to_dict(include_meta=True))
-        return batch
+            docs.append(doc)
+
+        cls.extract_batch_content(content_jobs)
+        return [doc.to_dict(include_meta=True) for doc in docs]
+
+    @classmethod
+    def extract_batch_content(cls, content_jobs):
+        """
+        Adds the file content to each (doc, obj) pair in content_jobs, with
+        up to TIKA_MAX_CONNECTIONS files extracted concurrently.
+        """
+
+        workers = min(len(content_jobs), getattr(settings, 'TIKA_MAX_CONNECTIONS', 4))
+        if workers <= 1:
+            for doc, obj in content_jobs:
+                cls.extract_content(doc, obj)
+            return
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(cls._extract_content_in_thread, doc, obj) for doc, obj in content_jobs]
+            for future in futures:
+                future.result()
+
+    @classmethod
+    def _extract_content_in_thread(cls, doc, obj):
+        try:
+            cls.extract_content(doc, obj)
+        finally:
+            connections.close_all()
+
+    @classmethod
+    def extract_content(cls, doc, obj):
+        logger = logging.getLogger('essarch.search')
+        format_registry_key = obj.custom_fields.get('formatkey', None)
+        ip_file_path = os.path.join(obj.custom_fields['href'], obj.custom_fields['filename'])
+        try:
+            with obj.tag.information_package.open_file(ip_file_path, 'rb') as f:
+                cls.enrich_with_content(doc, file_obj=f)
+            logger.debug('Indexed file content for {} with format registry key {} for ip {}'.format(
+                obj.custom_fields['filename'], format_registry_key, obj.tag.information_package))
+        except NotImplementedError:
+            logger.warning('open_file is not implemented for the information package %s, skip to index '
+                           'file content for %s', obj.tag.information_package, ip_file_path)
+
+    @classmethod
+    def iter_index_ids(cls, batch_size):
+        """
+        Yields the ids of all documents in the index in batches of at most
+        batch_size ids, without fetching the document sources.
+        """
+
+        s = cls.search().source(False).params(size=batch_size)
+        ids = []
+        for hit in s.scan():
+            ids.append(hit.meta.id)
+            if len(ids) >= batch_size:
+                yield ids
+                ids = []
+
+        if ids:
+            yield ids
+
+    @classmethod
+    def get_stale_ids(cls, queryset, batch_size):
+        """
+        Yields the ids of documents that are present in the index but not in
+        queryset. Each batch of index ids is checked against the db in a single
+        query, so only one batch is held in memory at a time.
+        """
+
+        pk_field = queryset.model._meta.pk
+        for index_ids in cls.iter_index_ids(batch_size):
+            pks = {}
+            for index_id in index_ids:
+                try:
+                    pks[index_id] = pk_field.to_python(index_id)
+                except DjangoValidationError:
+                    yield index_id
+
+            db_ids = {
+                str(pk) for pk in
+                queryset.filter(pk__in=pks.values()).values_list('pk', flat=True)
+            }
+            for index_id in pks:
+                if index_id not in db_ids:
+                    yield index_id
 
     @classmethod
     def remove_stale(cls, queryset, batch_size):
@@ -204,18 +433,12 @@ class DocumentBase(es.Document):
         Index meta id and db instance pk needs to be same.
         """
 
-        db_ids = list(str(obj_id) for obj_id in queryset.values_list('id', flat=True))
-        s = cls.search()
-        resp = s.execute()
-        total_index = resp.hits.total['value']
-        removed = []
-        for start in range(0, total_index, batch_size):
-            end = start + batch_size
-            items = resp.hits[start:end]
-            for item in items:
-                if str(item.meta.id) not in db_ids:
-                    removed.append(item.meta.id)
-        actions = [{"_op_type": "delete", "_index": cls._index._name, "_id": rid} for rid in removed]
-        es_helpers.bulk(client=get_es_connection(), actions=actions)
+        logger = logging.getLogger('essarch.search.documents.DocumentBase')
+        actions = (
+            {"_op_type": "delete", "_index": cls._index._name, "_id": stale_id}
+            for stale_id in cls.get_stale_ids(queryset, batch_size)
+        )
+        removed, _ = es_helpers.bulk(client=get_es_connection(), actions=actions, chunk_size=batch_size)
+        logger.debug('Removed {} stale documents from {}'.format(removed, cls._index._name))
 
         time.sleep(0.5)
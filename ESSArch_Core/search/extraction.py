@@ -0,0 +1,104 @@
+import os
+import threading
+from urllib.parse import urljoin
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+from ESSArch_Core.fixity.checksum import calculate_checksum
+
+TIKA_TIMEOUT = 600
+
+_session = None
+_session_pid = None
+_semaphore = None
+_session_lock = threading.Lock()
+
+
+def get_tika_url():
+    base_url = getattr(settings, 'TIKA_URL', 'http://localhost:9998')
+    return urljoin(base_url.rstrip('/') + '/', 'tika')
+
+
+def get_tika_max_connections():
+    return max(1, getattr(settings, 'TIKA_MAX_CONNECTIONS', 4))
+
+
+def get_tika_session():
+    """
+    Returns the session shared by all threads in the current process together
+    with the semaphore limiting the number of concurrent requests to Tika.
+    The connections in the session are reused between requests.
+    """
+
+    global _session, _session_pid, _semaphore
+
+    with _session_lock:
+        # connections can't be shared with forked worker processes
+        if _session is None or _session_pid != os.getpid():
+            max_connections = get_tika_max_connections()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+
+            _session = session
+            _session_pid = os.getpid()
+            _semaphore = threading.BoundedSemaphore(max_connections)
+
+        return _session, _semaphore
+
+
+def tika_put(file_obj):
+    """
+    Streams file_obj to Tika and returns the response with the extracted
+    text.
+    """
+
+    session, semaphore = get_tika_session()
+    file_obj.seek(0)
+
+    with semaphore:
+        return session.put(
+            get_tika_url(),
+            data=file_obj,
+            headers={"Accept": "text/plain; charset=utf-8"},
+            timeout=TIKA_TIMEOUT,
+        )
+
+
+def get_content_cache_key(file_obj, checksum=None, checksum_algorithm='SHA-256'):
+    """
+    Returns the cache key of the text extracted from file_obj, based on the
+    checksum of its content, or None if the cache is disabled.
+
+    Files on disk are checksummed with SHA-256, other files are only cached
+    if their checksum is already known and given as checksum to avoid reading
+    them twice.
+    """
+
+    if not getattr(settings, 'TIKA_CONTENT_CACHE_TIMEOUT', 0):
+        return None
+
+    name = getattr(file_obj, 'name', None)
+    if isinstance(name, str) and os.path.isabs(name) and os.path.isfile(name):
+        checksum = calculate_checksum(name, 'SHA-256')
+        checksum_algorithm = 'SHA-256'
+    elif checksum is None:
+        return None
+
+    return 'tika_content_{}_{}'.format(checksum_algorithm.upper(), checksum.lower())
+
+
+def cache_content(cache_key, content):
+    """
+    Caches the text extracted by Tika unless it is larger than
+    TIKA_CONTENT_CACHE_MAX_SIZE characters.
+    """
+
+    if len(content) > getattr(settings, 'TIKA_CONTENT_CACHE_MAX_SIZE', 0):
+        return
+
+    cache.set(cache_key, content, settings.TIKA_CONTENT_CACHE_TIMEOUT)
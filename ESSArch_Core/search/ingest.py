@@ -1,11 +1,16 @@
+import itertools
 import logging
 import os
 import uuid
 
 from django.conf import settings
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
 from elasticsearch import ConnectionError, RequestError, TransportError
+from elasticsearch_dsl.connections import get_connection as get_es_connection
 
 from ESSArch_Core.fixity.format import FormatIdentifier
+from ESSArch_Core.search.documents import BulkBackoff
 from ESSArch_Core.tags.documents import Directory, File
 from ESSArch_Core.tags.models import (
     Tag,
@@ -20,28 +25,25 @@ from ESSArch_Core.util import (
 )
 
 
-def index_document(tag_version, filepath, index_file_content=True):
-    logger = logging.getLogger('essarch.search.ingest')
-    exclude_file_format_from_indexing_content = settings.EXCLUDE_FILE_FORMAT_FROM_INDEXING_CONTENT
+def get_document_fields(ip, filepath, name, fid=None, file_format=None):
+    if file_format is None:
+        if fid is None:
+            fid = FormatIdentifier()
+        file_format = fid.identify_file_format(filepath)
 
-    fid = FormatIdentifier()
-    (format_name, format_version, format_registry_key) = fid.identify_file_format(filepath)
-    if format_registry_key in exclude_file_format_from_indexing_content:
-        index_file_content = False
-
-    ip = tag_version.tag.information_package
-    extension = os.path.splitext(tag_version.name)[1][1:]
+    (format_name, format_version, format_registry_key) = file_format
+    extension = os.path.splitext(name)[1][1:]
     dirname = os.path.dirname(filepath)
     href = normalize_path(os.path.relpath(dirname, ip.object_path))
     href = '' if href == '.' else href
     size, _ = get_tree_size_and_count(filepath)
     modified = timestamp_to_datetime(os.stat(filepath).st_mtime)
 
-    tag_version.custom_fields = {
+    return {
         'extension': extension,
         'dirname': dirname,
         'href': href,
-        'filename': tag_version.name,
+        'filename': name,
         'size': size,
         'modified': modified,
         'formatname': format_name,
@@ -49,6 +51,27 @@ def index_document(tag_version, filepath, index_file_content=True):
         'formatkey': format_registry_key,
     }
 
+
+def get_directory_fields(ip, dirpath):
+    parent_dir = os.path.dirname(dirpath)
+    href = normalize_path(os.path.relpath(parent_dir, ip.object_path))
+    href = '' if href == '.' else href
+
+    return {
+        'href': href,
+    }
+
+
+def index_document(tag_version, filepath, index_file_content=True):
+    logger = logging.getLogger('essarch.search.ingest')
+    exclude_file_format_from_indexing_content = settings.EXCLUDE_FILE_FORMAT_FROM_INDEXING_CONTENT
+
+    ip = tag_version.tag.information_package
+    tag_version.custom_fields = get_document_fields(ip, filepath, tag_version.name)
+    size = tag_version.custom_fields['size']
+    if tag_version.custom_fields['formatkey'] in exclude_file_format_from_indexing_content:
+        index_file_content = False
+
     doc = File.from_obj(tag_version)
 
     MAX_INDEX_SIZE = getattr(settings, 'ELASTICSEARCH_MAX_INDEX_SIZE', None)
@@ -99,13 +122,7 @@ def index_document(tag_version, filepath, index_file_content=True):
 
 def index_directory(tag_version, dirpath):
     ip = tag_version.tag.information_package
-    parent_dir = os.path.dirname(dirpath)
-    href = normalize_path(os.path.relpath(parent_dir, ip.object_path))
-    href = '' if href == '.' else href
-
-    tag_version.custom_fields = {
-        'href': href,
-    }
+    tag_version.custom_fields = get_directory_fields(ip, dirpath)
 
     doc = Directory.from_obj(tag_version)
     doc.save()
@@ -165,3 +182,130 @@ def index_path(ip, path, parent=None, group=None, index_file_content=True):
 
     if group:
         group.add_object(tag_version)
+
+
+def _get_or_create_tag_versions(ip, paths, document_type, directory_type, parent=None):
+    """
+    Gets or creates the tag and tag version of each path, using the same ids
+    as index_path, with a constant number of queries.
+    """
+
+    entries = []
+    for path in paths:
+        isfile = os.path.isfile(path)
+        tag_id = generate_tag_id(ip, os.path.relpath(path, ip.object_path))
+        entries.append((path, isfile, tag_id, os.path.basename(path)))
+
+    tag_ids = {tag_id for _, _, tag_id, _ in entries}
+    existing_tags = set(Tag.objects.filter(pk__in=tag_ids).values_list('pk', flat=True))
+    Tag.objects.bulk_create([
+        Tag(id=tag_id, information_package=ip) for tag_id in tag_ids if tag_id not in existing_tags
+    ])
+
+    tag_versions = {
+        (tag_version.tag_id, tag_version.name): tag_version
+        for tag_version in TagVersion.objects.filter(tag_id__in=tag_ids)
+    }
+
+    new_tag_versions = {}
+    result = []
+    for path, isfile, tag_id, name in entries:
+        key = (tag_id, name)
+        tag_version = tag_versions.get(key)
+        if tag_version is None:
+            tag_version = new_tag_versions.get(key)
+        if tag_version is None:
+            tag_version = TagVersion(
+                tag_id=tag_id,
+                name=name,
+                elastic_index="document" if isfile else "directory",
+                type=document_type if isfile else directory_type,
+            )
+            new_tag_versions[key] = tag_version
+        result.append((path, isfile, tag_version))
+
+    if parent:
+        existing_structures = set(TagStructure.objects.filter(
+            tag__in=tag_ids, parent=parent, structure=parent.structure,
+        ).values_list('tag_id', flat=True))
+
+        # TagStructure is an MPTT tree which can't be bulk created
+        for tag_id in tag_ids - existing_structures:
+            TagStructure.objects.create(tag_id=tag_id, parent=parent, structure=parent.structure)
+
+    return result, new_tag_versions.values()
+
+
+def index_paths(ip, paths, parent=None, group=None, index_file_content=True, batch_size=None):
+    """
+    Indexes the files and directories in paths to elasticsearch in batches,
+    with a constant number of queries and a single bulk request to
+    elasticsearch for each batch
+
+    :param ip: The IP the paths belong to
+    :type ip: InformationPackage
+    :param paths: The paths of the files and directories
+    :type paths: iterable of str
+    :param parent: The parent of the tags
+    :type parent: TagStructure
+    :param batch_size: The number of paths in each batch
+    :type batch_size: int
+    """
+
+    logger = logging.getLogger('essarch.search.ingest')
+    if not batch_size:
+        batch_size = settings.ELASTICSEARCH_BATCH_SIZE
+
+    document_type = TagVersionType.objects.get_or_create(name="document", archive_type=False)[0]
+    directory_type = TagVersionType.objects.get_or_create(name="directory", archive_type=False)[0]
+    fid = FormatIdentifier()
+    conn = get_es_connection()
+    backoff = BulkBackoff()
+
+    paths = iter(paths)
+    while True:
+        batch = list(itertools.islice(paths, batch_size))
+        if not batch:
+            break
+
+        logger.debug('indexing {} paths'.format(len(batch)))
+        entries, new_tag_versions = _get_or_create_tag_versions(ip, batch, document_type, directory_type, parent)
+
+        file_paths = [path for path, isfile, _ in entries if isfile]
+        file_formats = dict(zip(file_paths, fid.identify_file_formats(file_paths)))
+
+        now = timezone.now()
+        for path, isfile, tag_version in entries:
+            if isfile:
+                tag_version.custom_fields = get_document_fields(
+                    ip, path, tag_version.name, file_format=file_formats[path],
+                )
+            else:
+                tag_version.custom_fields = get_directory_fields(ip, path)
+            tag_version.revise_date = now
+
+        new_tag_versions = TagVersion.objects.bulk_create(new_tag_versions)
+        new_pks = {tag_version.pk for tag_version in new_tag_versions}
+        if new_tag_versions:
+            # bulk_create doesn't send post_save which sets the current version of new tags
+            Tag.objects.filter(
+                pk__in={tag_version.tag_id for tag_version in new_tag_versions}, current_version__isnull=True,
+            ).update(current_version=Subquery(
+                TagVersion.objects.filter(tag=OuterRef('pk')).order_by('create_date', 'pk').values('pk')[:1]
+            ))
+        TagVersion.objects.bulk_update(
+            {tag_version.pk: tag_version for _, _, tag_version in entries if tag_version.pk not in new_pks}.values(),
+            ['custom_fields', 'revise_date'],
+        )
+
+        file_pks = [tag_version.pk for _, isfile, tag_version in entries if isfile]
+        dir_pks = [tag_version.pk for _, isfile, tag_version in entries if not isfile]
+        if file_pks:
+            files = File.prepare_index_queryset(TagVersion.objects.filter(pk__in=file_pks))
+            File.index_batch(conn, list(files), index_file_content, backoff)
+        if dir_pks:
+            dirs = Directory.prepare_index_queryset(TagVersion.objects.filter(pk__in=dir_pks))
+            Directory.index_batch(conn, list(dirs), backoff=backoff)
+
+        if group:
+            group.add_objects(tag_version for _, _, tag_version in entries)
@@ -0,0 +1,152 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from elasticsearch import TransportError, helpers as es_helpers
+
+from ESSArch_Core.search.documents import BulkBackoff, bulk_with_backoff
+from ESSArch_Core.tags.documents import StructureUnitDocument
+from ESSArch_Core.tags.models import (
+    Structure,
+    StructureType,
+    StructureUnit,
+    StructureUnitType,
+)
+
+
+def bulk_results(*statuses):
+    return [
+        (status < 300, {'index': {'_id': str(i), 'status': status}})
+        for i, status in enumerate(statuses)
+    ]
+
+
+class BulkBackoffTests(SimpleTestCase):
+    def test_rejected_and_accepted(self):
+        backoff = BulkBackoff(initial=1, maximum=5)
+        self.assertEqual(backoff.delay, 0)
+
+        backoff.rejected()
+        self.assertEqual(backoff.delay, 1)
+        backoff.rejected()
+        backoff.rejected()
+        self.assertEqual(backoff.delay, 4)
+        backoff.rejected()
+        self.assertEqual(backoff.delay, 5)
+
+        backoff.accepted()
+        self.assertEqual(backoff.delay, 2.5)
+        backoff.accepted()
+        self.assertEqual(backoff.delay, 1.25)
+        backoff.accepted()
+        backoff.accepted()
+        self.assertEqual(backoff.delay, 0)
+
+    @mock.patch('ESSArch_Core.search.documents.time.sleep')
+    def test_wait(self, mock_sleep):
+        backoff = BulkBackoff(initial=1, maximum=5)
+        backoff.wait()
+        mock_sleep.assert_not_called()
+
+        backoff.rejected()
+        backoff.wait()
+        mock_sleep.assert_called_once_with(1)
+
+
+@mock.patch('ESSArch_Core.search.documents.time.sleep')
+@mock.patch('ESSArch_Core.search.documents.es_helpers.streaming_bulk')
+class BulkWithBackoffTests(SimpleTestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+        self.actions = [{'_id': str(i)} for i in range(3)]
+
+    def test_accepted(self, mock_bulk, mock_sleep):
+        mock_bulk.return_value = bulk_results(201, 201, 201)
+        backoff = BulkBackoff()
+
+        bulk_with_backoff(self.client, self.actions, backoff)
+
+        mock_bulk.assert_called_once()
+        mock_sleep.assert_not_called()
+        self.assertEqual(backoff.delay, 0)
+
+    def test_rejected_documents_are_retried(self, mock_bulk, mock_sleep):
+        mock_bulk.side_effect = [bulk_results(201, 429, 201), bulk_results(201)]
+        backoff = BulkBackoff(initial=1)
+
+        bulk_with_backoff(self.client, self.actions, backoff)
+
+        self.assertEqual(mock_bulk.call_count, 2)
+        self.assertEqual(mock_bulk.call_args[0][1], [self.actions[1]])
+        mock_sleep.assert_called_once_with(1)
+        self.assertEqual(backoff.delay, 0)
+
+    def test_rejected_request_is_retried(self, mock_bulk, mock_sleep):
+        mock_bulk.side_effect = [TransportError(429, 'rejected'), bulk_results(201, 201, 201)]
+        backoff = BulkBackoff(initial=1)
+
+        bulk_with_backoff(self.client, self.actions, backoff)
+
+        self.assertEqual(mock_bulk.call_args[0][1], self.actions)
+        mock_sleep.assert_called_once_with(1)
+
+    def test_max_retries(self, mock_bulk, mock_sleep):
+        mock_bulk.side_effect = lambda client, actions, **kwargs: bulk_results(*[429] * len(actions))
+
+        with self.assertRaises(es_helpers.BulkIndexError):
+            bulk_with_backoff(self.client, self.actions, BulkBackoff(), max_retries=2)
+
+        self.assertEqual(mock_bulk.call_count, 3)
+
+    def test_failed_documents(self, mock_bulk, mock_sleep):
+        mock_bulk.return_value = bulk_results(201, 400, 429)
+
+        with self.assertRaises(es_helpers.BulkIndexError):
+            bulk_with_backoff(self.client, self.actions, BulkBackoff())
+
+        mock_bulk.assert_called_once()
+
+    def test_other_transport_errors_are_raised(self, mock_bulk, mock_sleep):
+        mock_bulk.side_effect = TransportError(413, 'too large')
+
+        with self.assertRaises(TransportError):
+            bulk_with_backoff(self.client, self.actions, BulkBackoff())
+
+        mock_bulk.assert_called_once()
+
+
+class IterIndexBatchesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        structure = Structure.objects.create(type=StructureType.objects.create(), is_template=False)
+        unit_type = StructureUnitType.objects.create(structure_type=structure.type)
+        cls.units = [
+            StructureUnit.objects.create(structure=structure, type=unit_type, reference_code=str(i))
+            for i in range(5)
+        ]
+
+    def test_batches(self):
+        batches = list(StructureUnitDocument.iter_index_batches(StructureUnit.objects.all(), 2))
+
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(
+            [unit.pk for batch in batches for unit in batch],
+            sorted(unit.pk for unit in self.units),
+        )
+
+    def test_exact_multiple_of_batch_size(self):
+        batches = list(StructureUnitDocument.iter_index_batches(StructureUnit.objects.all(), 5))
+        self.assertEqual([len(batch) for batch in batches], [5])
+
+    def test_empty_queryset(self):
+        batches = list(StructureUnitDocument.iter_index_batches(StructureUnit.objects.none(), 2))
+        self.assertEqual(batches, [])
+
+    @mock.patch('ESSArch_Core.search.documents.get_es_connection')
+    @mock.patch('ESSArch_Core.search.documents.bulk_with_backoff')
+    def test_perform_index_with_threads(self, mock_bulk, mock_conn):
+        with mock.patch.object(StructureUnitDocument, 'create_batch', side_effect=lambda objs, *args: list(objs)), \
+                mock.patch('ESSArch_Core.search.documents.connections'):
+            StructureUnitDocument.perform_index(StructureUnit.objects.all(), 2, thread_count=2)
+
+        indexed = [unit for call in mock_bulk.call_args_list for unit in call[0][1]]
+        self.assertCountEqual(indexed, self.units)
@@ -0,0 +1,141 @@
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from ESSArch_Core.search import extraction
+from ESSArch_Core.search.extraction import (
+    get_content_cache_key,
+    get_tika_session,
+)
+from ESSArch_Core.tags.documents import File
+
+FOO_SHA256 = '2c26b46b68ffc68ff99b453c1d30413413422d706483bfa0f98a5e886266e7ae'
+BAR_SHA256 = 'fcde2b2edba56bf408601fb721fe9b5c338d10ee429ea04fae5511b68fbf8fb9'
+
+
+class GetTikaSessionTests(SimpleTestCase):
+    def setUp(self):
+        self.addCleanup(setattr, extraction, '_session', None)
+
+    def test_session_is_reused(self):
+        session, semaphore = get_tika_session()
+        self.assertIs(get_tika_session()[0], session)
+        self.assertIs(get_tika_session()[1], semaphore)
+
+    @override_settings(TIKA_MAX_CONNECTIONS=2)
+    def test_connection_pool_size(self):
+        extraction._session = None
+        session, _ = get_tika_session()
+        self.assertEqual(session.get_adapter('http://localhost').poolmanager.connection_pool_kw['maxsize'], 2)
+
+    def test_new_session_in_new_process(self):
+        session, _ = get_tika_session()
+        with mock.patch('ESSArch_Core.search.extraction.os.getpid', return_value=-1):
+            self.assertIsNot(get_tika_session()[0], session)
+
+
+@override_settings(TIKA_CONTENT_CACHE_TIMEOUT=60)
+class GetContentCacheKeyTests(SimpleTestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+
+        self.filepath = os.path.join(self.datadir, 'foo.txt')
+        with open(self.filepath, 'wb') as f:
+            f.write(b'foo')
+
+    def test_same_key_for_same_content(self):
+        with open(self.filepath, 'rb') as f:
+            key = get_content_cache_key(f)
+            self.assertEqual(f.tell(), 0)
+
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(key, get_content_cache_key(f))
+
+        self.assertEqual(key, get_content_cache_key(io.BytesIO(b'foo'), checksum=FOO_SHA256))
+        self.assertNotEqual(key, get_content_cache_key(io.BytesIO(b'bar'), checksum=BAR_SHA256))
+
+    def test_file_not_on_disk_without_checksum(self):
+        file_obj = io.BytesIO(b'foo')
+        self.assertIsNone(get_content_cache_key(file_obj))
+        self.assertEqual(file_obj.tell(), 0)
+
+    def test_checksum_algorithm_is_part_of_key(self):
+        self.assertNotEqual(
+            get_content_cache_key(io.BytesIO(b'foo'), checksum='abc', checksum_algorithm='MD5'),
+            get_content_cache_key(io.BytesIO(b'foo'), checksum='abc', checksum_algorithm='SHA-1'),
+        )
+
+    @override_settings(TIKA_CONTENT_CACHE_TIMEOUT=0)
+    def test_cache_disabled(self):
+        self.assertIsNone(get_content_cache_key(io.BytesIO(b'foo'), checksum=FOO_SHA256))
+
+
+@override_settings(TIKA_CONTENT_CACHE_TIMEOUT=60)
+@mock.patch('ESSArch_Core.tags.documents.tika_put')
+class EnrichWithContentTests(SimpleTestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+
+    def test_extracted_content_is_cached(self, mock_tika_put):
+        mock_tika_put.return_value = mock.Mock(status_code=200, content='foo content'.encode('utf-8'))
+
+        doc = File.enrich_with_content(
+            File(id='foo', filename='foo.txt', size=3), io.BytesIO(b'foo'), checksum=FOO_SHA256,
+        )
+        self.assertEqual(doc.content, 'foo content')
+
+        doc = File.enrich_with_content(
+            File(id='bar', filename='bar.txt', size=3), io.BytesIO(b'foo'), checksum=FOO_SHA256,
+        )
+        self.assertEqual(doc.content, 'foo content')
+        mock_tika_put.assert_called_once()
+
+        File.enrich_with_content(File(id='baz', filename='baz.txt', size=3), io.BytesIO(b'bar'), checksum=BAR_SHA256)
+        self.assertEqual(mock_tika_put.call_count, 2)
+
+    def test_content_without_checksum_is_not_cached(self, mock_tika_put):
+        mock_tika_put.return_value = mock.Mock(status_code=200, content='foo content'.encode('utf-8'))
+
+        File.enrich_with_content(File(id='foo', filename='foo.txt', size=3), io.BytesIO(b'foo'))
+        File.enrich_with_content(File(id='bar', filename='bar.txt', size=3), io.BytesIO(b'foo'))
+        self.assertEqual(mock_tika_put.call_count, 2)
+
+    @override_settings(TIKA_CONTENT_CACHE_MAX_SIZE=5)
+    def test_large_content_is_not_cached(self, mock_tika_put):
+        mock_tika_put.return_value = mock.Mock(status_code=200, content='foo content'.encode('utf-8'))
+
+        File.enrich_with_content(File(id='foo', filename='foo.txt', size=3), io.BytesIO(b'foo'), checksum=FOO_SHA256)
+
+        self.assertIsNone(cache.get(get_content_cache_key(io.BytesIO(b'foo'), checksum=FOO_SHA256)))
+
+    def test_failed_extraction_is_not_cached(self, mock_tika_put):
+        mock_tika_put.return_value = mock.Mock(status_code=500, text='error')
+
+        with self.assertRaises(Exception):
+            File.enrich_with_content(
+                File(id='foo', filename='foo.txt', size=3), io.BytesIO(b'foo'), checksum=FOO_SHA256,
+            )
+
+        self.assertIsNone(cache.get(get_content_cache_key(io.BytesIO(b'foo'), checksum=FOO_SHA256)))
+
+
+@override_settings(TIKA_MAX_CONNECTIONS=4)
+@mock.patch('ESSArch_Core.search.documents.connections')
+class ExtractBatchContentTests(SimpleTestCase):
+    @mock.patch.object(File, 'extract_content')
+    def test_all_jobs_are_extracted(self, mock_extract, mock_connections):
+        jobs = [(mock.Mock(), mock.Mock()) for _ in range(10)]
+        File.extract_batch_content(jobs)
+
+        self.assertCountEqual([call[0] for call in mock_extract.call_args_list], jobs)
+
+    @mock.patch.object(File, 'extract_content', side_effect=ValueError)
+    def test_errors_are_raised(self, mock_extract, mock_connections):
+        with self.assertRaises(ValueError):
+            File.extract_batch_content([(mock.Mock(), mock.Mock()) for _ in range(3)])
@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import TestCase
+
+from ESSArch_Core.auth.models import Group, GroupType
+from ESSArch_Core.ip.models import InformationPackage
+from ESSArch_Core.search.ingest import generate_tag_id, index_paths
+from ESSArch_Core.tags.documents import Directory, File
+from ESSArch_Core.tags.models import (
+    Tag,
+    TagVersion,
+    TagVersionGroupObjects,
+    TagVersionType,
+)
+
+
+@mock.patch('ESSArch_Core.search.ingest.get_es_connection')
+@mock.patch.object(Directory, 'index_batch')
+@mock.patch.object(File, 'index_batch')
+@mock.patch('ESSArch_Core.search.ingest.FormatIdentifier')
+class IndexPathsTests(TestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+        self.ip = InformationPackage.objects.create(object_path=self.datadir)
+
+        self.paths = [os.path.join(self.datadir, 'content')]
+        os.makedirs(self.paths[0])
+        for i in range(5):
+            path = os.path.join(self.paths[0], '{}.txt'.format(i))
+            with open(path, 'w') as f:
+                f.write('foo')
+            self.paths.append(path)
+
+    def set_up_format_identifier(self, mock_fid):
+        file_format = ('Plain Text File', None, 'x-fmt/111')
+        mock_fid.return_value.identify_file_format.return_value = file_format
+        mock_fid.return_value.identify_file_formats.side_effect = lambda paths: [file_format] * len(paths)
+
+    def test_index_paths(self, mock_fid, mock_file_batch, mock_dir_batch, mock_conn):
+        self.set_up_format_identifier(mock_fid)
+        index_paths(self.ip, self.paths, batch_size=4)
+
+        self.assertEqual(Tag.objects.filter(information_package=self.ip).count(), 6)
+        self.assertEqual(TagVersion.objects.filter(elastic_index='document').count(), 5)
+        self.assertEqual(TagVersion.objects.filter(elastic_index='directory').count(), 1)
+
+        tag_version = TagVersion.objects.get(tag__pk=generate_tag_id(self.ip, os.path.join('content', '0.txt')))
+        self.assertEqual(tag_version.name, '0.txt')
+        self.assertEqual(tag_version.custom_fields['href'], 'content')
+        self.assertEqual(tag_version.custom_fields['size'], 3)
+        self.assertEqual(tag_version.custom_fields['formatkey'], 'x-fmt/111')
+
+        tag_version = TagVersion.objects.get(tag__pk=generate_tag_id(self.ip, 'content'))
+        self.assertEqual(tag_version.custom_fields, {'href': ''})
+
+        for tag in Tag.objects.filter(information_package=self.ip):
+            self.assertEqual(tag.current_version, tag.versions.get())
+
+        indexed_files = [obj for call in mock_file_batch.call_args_list for obj in call[0][1]]
+        indexed_dirs = [obj for call in mock_dir_batch.call_args_list for obj in call[0][1]]
+        self.assertEqual(len(indexed_files), 5)
+        self.assertEqual(len(indexed_dirs), 1)
+        self.assertEqual(mock_file_batch.call_count, 2)
+        mock_fid.return_value.identify_file_format.assert_not_called()
+        self.assertEqual(mock_fid.return_value.identify_file_formats.call_count, 2)
+        # the current_version field of the documents
+        for obj in indexed_files + indexed_dirs:
+            self.assertEqual(obj.tag.current_version_id, obj.pk)
+
+    def test_existing_tags_are_reused(self, mock_fid, mock_file_batch, mock_dir_batch, mock_conn):
+        self.set_up_format_identifier(mock_fid)
+        index_paths(self.ip, self.paths)
+        pks = set(TagVersion.objects.values_list('pk', flat=True))
+
+        with open(self.paths[1], 'w') as f:
+            f.write('foobar')
+
+        index_paths(self.ip, self.paths)
+
+        self.assertEqual(set(TagVersion.objects.values_list('pk', flat=True)), pks)
+        tag_version = TagVersion.objects.get(tag__pk=generate_tag_id(self.ip, os.path.join('content', '0.txt')))
+        self.assertEqual(tag_version.custom_fields['size'], 6)
+
+    def test_group(self, mock_fid, mock_file_batch, mock_dir_batch, mock_conn):
+        self.set_up_format_identifier(mock_fid)
+        group = Group.objects.create(group_type=GroupType.objects.create(codename='organization'))
+        group.add_object(TagVersion.objects.create(
+            tag=Tag.objects.create(id=generate_tag_id(self.ip, 'content'), information_package=self.ip),
+            name='content', elastic_index='directory',
+            type=TagVersionType.objects.create(name='directory', archive_type=False),
+        ))
+
+        index_paths(self.ip, self.paths, group=group)
+
+        self.assertEqual(TagVersionGroupObjects.objects.filter(group=group).count(), 6)
+
+    def test_number_of_queries_is_independent_of_number_of_paths(self, mock_fid, mock_file_batch, mock_dir_batch,
+                                                                 mock_conn):
+        self.set_up_format_identifier(mock_fid)
+        index_paths(self.ip, self.paths[:2])
+
+        for i in range(5, 20):
+            path = os.path.join(self.paths[0], '{}.txt'.format(i))
+            with open(path, 'w') as f:
+                f.write('foo')
+            self.paths.append(path)
+
+        with self.assertNumQueries(12):
+            index_paths(self.ip, self.paths)
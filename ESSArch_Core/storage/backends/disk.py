@@ -10,7 +10,12 @@ from glob2 import iglob
 from ESSArch_Core.storage.backends.base import BaseStorageBackend
 from ESSArch_Core.storage.copy import DEFAULT_BLOCK_SIZE, copy
 from ESSArch_Core.storage.models import DISK, StorageObject
-from ESSArch_Core.util import normalize_path, open_file
+from ESSArch_Core.util import (
+    get_tar_index_path,
+    normalize_path,
+    open_file,
+    write_tar_index,
+)
 
 
 class DiskStorageBackend(BaseStorageBackend):
@@ -103,6 +108,17 @@ class DiskStorageBackend(BaseStorageBackend):
             if idx == 0:
                 content_location_value = new
 
+            if container and os.path.isfile(new) and tarfile.is_tarfile(new):
+                index = get_tar_index_path(f)
+                if os.path.isfile(index):
+                    copy(index, dst, block_size=block_size)
+                else:
+                    try:
+                        write_tar_index(new)
+                    except tarfile.ReadError:
+                        # compressed containers are not indexed
+                        pass
+
         _, content_location_value = os.path.split(content_location_value)
 
         return StorageObject.objects.create(
@@ -145,13 +161,14 @@ class DiskStorageBackend(BaseStorageBackend):
                     raise
         else:
             tar = path
+            index = get_tar_index_path(tar)
             xml = os.path.splitext(tar)[0] + '.xml'
             aic_xml = True if storage_object.ip.aic else False
             if aic_xml:
                 aic_xml = os.path.join(os.path.dirname(tar), str(storage_object.ip.aic.pk) + '.xml')
-                files = [tar, xml, aic_xml]
+                files = [tar, index, xml, aic_xml]
             else:
-                files = [tar, xml]
+                files = [tar, index, xml]
             for f in files:
                 try:
                     os.remove(f)
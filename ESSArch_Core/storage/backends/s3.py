@@ -1,15 +1,28 @@
 import errno
 import io
+import json
 import logging
 import os
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
 from os import walk
 
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
 from django.conf import settings
 
 from ESSArch_Core.storage.backends.base import BaseStorageBackend
 from ESSArch_Core.storage.copy import DEFAULT_BLOCK_SIZE
 from ESSArch_Core.storage.models import CAS, StorageObject
+from ESSArch_Core.util import (
+    FileSlice,
+    find_tar_index_member,
+    get_tar_index_digest,
+    get_tar_index_path,
+    normalize_path,
+    write_tar_index,
+)
 
 AWS = settings.AWS
 
@@ -18,6 +31,81 @@ s3 = boto3.resource('s3',
                     aws_secret_access_key=AWS.get('SECRET_ACCESS_KEY'),
                     endpoint_url=AWS.get('ENDPOINT_URL'))
 
+# Options passed to boto3.s3.transfer.TransferConfig, e.g. max_concurrency
+# and multipart_chunksize
+transfer_config = TransferConfig(**AWS.get('TRANSFER_CONFIG', {}))
+
+# Number of files transferred concurrently when reading or writing directories
+TRANSFER_WORKERS = AWS.get('TRANSFER_WORKERS', 4)
+
+# Size of each range request made when reading opened objects
+RANGE_READ_BUFFER_SIZE = 1024 * 1024
+
+
+class S3ObjectFile(io.RawIOBase):
+    """
+    A read-only, seekable file object for an S3 object where each read is
+    served by a range request instead of downloading the whole object
+    """
+
+    def __init__(self, s3_object):
+        self.s3_object = s3_object
+        self.size = s3_object.content_length
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError('Invalid whence ({}, should be 0, 1 or 2)'.format(whence))
+
+        if position < 0:
+            raise OSError(errno.EINVAL, os.strerror(errno.EINVAL))
+
+        self.position = position
+        return self.position
+
+    def readinto(self, b):
+        if self.position >= self.size:
+            return 0
+
+        end = min(self.position + len(b), self.size) - 1
+        body = self.s3_object.get(Range='bytes={}-{}'.format(self.position, end))['Body']
+        data = body.read()
+        body.close()
+
+        n = len(data)
+        b[:n] = data
+        self.position += n
+        return n
+
+    def readall(self):
+        # fetch the rest of the object with a single range request instead of
+        # one for each chunk of io.DEFAULT_BUFFER_SIZE
+        if self.position >= self.size:
+            return b''
+
+        b = bytearray(self.size - self.position)
+        n = self.readinto(b)
+        return bytes(b[:n])
+
+
+def open_s3_object(bucket_name, key, buffer_size=RANGE_READ_BUFFER_SIZE):
+    return io.BufferedReader(S3ObjectFile(s3.Object(bucket_name, key)), buffer_size=buffer_size)
+
 
 class S3StorageBackend(BaseStorageBackend):
     type = CAS
@@ -25,14 +113,73 @@ class S3StorageBackend(BaseStorageBackend):
     def _extract(self, storage_object, dst):
         raise NotImplementedError
 
+    def _open_indexed_member(self, bucket_name, key, container, file, container_prefix):
+        try:
+            body = s3.Object(bucket_name, get_tar_index_path(key)).get()['Body']
+            index = json.loads(body.read())
+        except (ClientError, ValueError):
+            return None
+
+        if index.get('size') != container.size or index.get('digest') != get_tar_index_digest(
+            container, container.size,
+        ):
+            return None
+
+        member = find_tar_index_member(index['members'], file, container_prefix)
+        if member is None:
+            return None
+
+        offset, size = member
+        return io.BufferedReader(FileSlice(container, offset, size), buffer_size=RANGE_READ_BUFFER_SIZE)
+
+    def _open_container_member(self, bucket_name, key, file, container_prefix):
+        container = S3ObjectFile(s3.Object(bucket_name, key))
+
+        f = self._open_indexed_member(bucket_name, key, container, file, container_prefix)
+        if f is not None:
+            return f
+
+        try:
+            # the headers are read from the unbuffered object, each with a
+            # small range request, until the requested member is found
+            container.seek(0)
+            tar = tarfile.open(fileobj=container, mode='r:')
+        except tarfile.ReadError:
+            # compressed containers can only be read from the start
+            tar = tarfile.open(fileobj=open_s3_object(bucket_name, key))
+
+        names = {file, normalize_path(os.path.join(container_prefix, file))}
+        member = tar.next()
+        while member is not None and member.name not in names:
+            if tar.fileobj is container:
+                # skip to the next header, otherwise tarfile reads the last
+                # byte of the current member to check that it exists
+                container.seek(tar.offset)
+            member = tar.next()
+
+        if member is None:
+            raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), os.path.join(key, file))
+
+        if member.isfile() and not member.issparse() and tar.fileobj is container:
+            return io.BufferedReader(
+                FileSlice(container, member.offset_data, member.size), buffer_size=RANGE_READ_BUFFER_SIZE,
+            )
+
+        f = tar.extractfile(member)
+        if f is None:
+            raise OSError(errno.EISDIR, os.strerror(errno.EISDIR), os.path.join(key, file))
+        return f
+
     def open(self, storage_object, file, *args, **kwargs):
-        data = io.BytesIO()
         bucket_name, key = storage_object.content_location_value.split('/', 1)
+
+        if storage_object.container:
+            return self._open_container_member(
+                bucket_name, key, file, storage_object.ip.object_identifier_value,
+            )
+
         key = os.path.join(key, file)
-        bucket = s3.Bucket(bucket_name)
-        bucket.download_fileobj(key, data)
-        data.seek(0)
-        return data
+        return open_s3_object(bucket_name, key)
 
     def read(self, storage_object, dst, extract=False, include_xml=True, block_size=DEFAULT_BLOCK_SIZE):
         bucket_name, key = storage_object.content_location_value.split('/', 1)
@@ -51,19 +198,29 @@ class S3StorageBackend(BaseStorageBackend):
                 dst_aic_xml = os.path.join(dst, os.path.basename(src_aic_xml))
 
             if include_xml:
-                bucket.download_file(src_xml, dst_xml)
+                bucket.download_file(src_xml, dst_xml, Config=transfer_config)
                 if aic_xml:
-                    bucket.download_file(src_aic_xml, dst_aic_xml)
+                    bucket.download_file(src_aic_xml, dst_aic_xml, Config=transfer_config)
             if extract:
                 return self._extract(storage_object, dst)
             else:
-                bucket.download_file(src_tar, dst_tar)
+                bucket.download_file(src_tar, dst_tar, Config=transfer_config)
                 return dst_tar
         else:
+            downloads = []
             for object_summary in bucket.objects.filter(Prefix=key):
                 dst_file = os.path.join(dst, os.path.relpath(object_summary.key, key))
                 os.makedirs(os.path.dirname(dst_file), exist_ok=True)
-                bucket.download_file(object_summary.key, dst_file)
+                downloads.append((object_summary.key, dst_file))
+
+            # clients, unlike resources, are thread safe
+            client = s3.meta.client
+            with ThreadPoolExecutor(max_workers=TRANSFER_WORKERS) as executor:
+                for future in [
+                    executor.submit(client.download_file, bucket_name, src_key, dst_file, Config=transfer_config)
+                    for src_key, dst_file in downloads
+                ]:
+                    future.result()
             return dst
 
     def write(self, src, ip, container, storage_medium, block_size=DEFAULT_BLOCK_SIZE):
@@ -77,22 +234,41 @@ class S3StorageBackend(BaseStorageBackend):
         bucket = s3.Bucket(bucket_name)
 
         content_location_value = None
+        client = s3.meta.client
         for f in src:
             try:
                 key = os.path.basename(f)
-                bucket.upload_file(f, key)
+                bucket.upload_file(f, key, Config=transfer_config)
                 if content_location_value is None:
                     content_location_value = '{}/{}'.format(bucket_name, key)
+
+                if container and tarfile.is_tarfile(f):
+                    index = get_tar_index_path(f)
+                    try:
+                        if not os.path.isfile(index):
+                            write_tar_index(f)
+                    except tarfile.ReadError:
+                        # compressed containers are not indexed
+                        pass
+                    else:
+                        bucket.upload_file(index, get_tar_index_path(key), Config=transfer_config)
             except IOError as e:
                 if e.errno != errno.EISDIR:
                     raise
 
                 parent_dir = os.path.dirname(f)
-                for root, _dirs, files in walk(f):
-                    for fi in files:
-                        srcf = os.path.join(root, fi)
-                        dstf = os.path.relpath(os.path.join(root, fi), parent_dir)
-                        bucket.upload_file(srcf, dstf)
+                with ThreadPoolExecutor(max_workers=TRANSFER_WORKERS) as executor:
+                    futures = []
+                    for root, _dirs, files in walk(f):
+                        for fi in files:
+                            srcf = os.path.join(root, fi)
+                            dstf = os.path.relpath(os.path.join(root, fi), parent_dir)
+                            futures.append(
+                                executor.submit(client.upload_file, srcf, bucket_name, dstf, Config=transfer_config)
+                            )
+
+                    for future in futures:
+                        future.result()
 
                 if content_location_value is None:
                     content_location_value = '{}/{}'.format(bucket_name, os.path.basename(f))
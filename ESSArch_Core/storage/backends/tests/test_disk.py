@@ -9,6 +9,11 @@ from ESSArch_Core.ip.models import InformationPackage
 from ESSArch_Core.storage.backends.disk import DiskStorageBackend
 from ESSArch_Core.storage.copy import DEFAULT_BLOCK_SIZE
 from ESSArch_Core.storage.models import DISK
+from ESSArch_Core.util import (
+    get_tar_index_path,
+    read_tar_index,
+    write_tar_index,
+)
 
 
 class DiskStorageBackendTests(TestCase):
@@ -242,6 +247,23 @@ class DiskStorageBackendTests(TestCase):
         mock_copy.assert_has_calls(expected_copy_calls)
         mock_extract.assert_called_once_with(mock_storage_obj, "some_dest")
 
+    @mock.patch("ESSArch_Core.storage.models.StorageObject.objects.create")
+    @mock.patch("ESSArch_Core.storage.models.StorageMedium")
+    def test_write_container_with_index(self, mock_st_medium, mock_st_obj):
+        dst = os.path.join(self.root_dir, "dst")
+        os.makedirs(dst)
+        mock_st_medium.storage_target.target = dst
+
+        self.create_file("foo", "txt")
+        tar_path = shutil.make_archive(os.path.join(self.root_dir, "archive_file"), "tar", self.datadir)
+        write_tar_index(tar_path)
+
+        DiskStorageBackend().write(src=tar_path, ip=mock.ANY, container=True, storage_medium=mock_st_medium)
+
+        dst_tar = os.path.join(dst, "archive_file.tar")
+        self.assertTrue(os.path.isfile(get_tar_index_path(dst_tar)))
+        self.assertEqual(read_tar_index(dst_tar), read_tar_index(tar_path))
+
     @mock.patch("ESSArch_Core.storage.models.StorageObject")
     def test_delete(self, mock_storage_obj):
         disk_storage_backend = DiskStorageBackend()
@@ -264,6 +286,7 @@ class DiskStorageBackendTests(TestCase):
         xml_file = self.create_file(archive_filename, "xml")
         aic_xml = self.create_file(aic_pk, "xml")
         tar_path = self.create_container_files(archive_filename, "tar")
+        index_path = write_tar_index(tar_path)
 
         mock_storage_obj.container = True
         mock_storage_obj.ip.aic.pk = aic_pk
@@ -280,6 +303,7 @@ class DiskStorageBackendTests(TestCase):
         self.assertFalse(os.path.exists(xml_file))
         self.assertFalse(os.path.exists(aic_xml))
         self.assertFalse(os.path.exists(tar_path))
+        self.assertFalse(os.path.exists(index_path))
 
     @mock.patch("ESSArch_Core.storage.models.StorageObject")
     def test_extract(self, mock_storage_obj):
@@ -0,0 +1,213 @@
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+from unittest import mock
+
+from botocore.exceptions import ClientError
+from django.test import SimpleTestCase, override_settings
+
+from ESSArch_Core.util import TAR_INDEX_DIGEST_SIZE, write_tar_index
+
+
+class FakeS3Object:
+    def __init__(self, data):
+        self.data = data
+        self.content_length = len(data)
+        self.ranges = []
+
+    def get(self, Range=None):
+        if Range is None:
+            return {'Body': io.BytesIO(self.data)}
+
+        start, end = (int(x) for x in Range[len('bytes='):].split('-'))
+        self.ranges.append((start, end))
+        return {'Body': io.BytesIO(self.data[start:end + 1])}
+
+    @property
+    def bytes_fetched(self):
+        return sum(end - start + 1 for start, end in self.ranges)
+
+
+class S3StorageBackendTestCase(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        # the s3 module reads the AWS configuration when it is imported
+        with override_settings(AWS={}):
+            from ESSArch_Core.storage.backends import s3
+        cls.s3 = s3
+
+
+class S3ObjectFileTests(S3StorageBackendTestCase):
+    def setUp(self):
+        self.data = os.urandom(1000)
+        self.obj = FakeS3Object(self.data)
+        self.f = self.s3.S3ObjectFile(self.obj)
+
+    def test_read(self):
+        self.assertEqual(self.f.read(), self.data)
+
+    def test_seek_and_read(self):
+        self.f.seek(100)
+        self.assertEqual(self.f.read(10), self.data[100:110])
+        self.assertEqual(self.obj.ranges, [(100, 109)])
+
+        self.f.seek(-10, io.SEEK_END)
+        self.assertEqual(self.f.read(), self.data[-10:])
+        self.assertEqual(self.f.tell(), 1000)
+
+        self.f.seek(-20, io.SEEK_CUR)
+        self.assertEqual(self.f.read(5), self.data[980:985])
+
+    def test_read_past_end(self):
+        self.f.seek(2000)
+        self.assertEqual(self.f.read(10), b'')
+        self.assertEqual(self.obj.ranges, [])
+
+    def test_seek_before_start(self):
+        with self.assertRaises(OSError):
+            self.f.seek(-1)
+
+
+class S3StorageBackendOpenTests(S3StorageBackendTestCase):
+    def setUp(self):
+        self.objects = {}
+        patcher = mock.patch.object(self.s3.s3, 'Object', side_effect=self.get_object)
+        self.mock_object = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_object(self, bucket_name, key):
+        try:
+            return self.objects[(bucket_name, key)]
+        except KeyError:
+            obj = mock.Mock()
+            obj.get.side_effect = ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+            return obj
+
+    def create_tar(self, members):
+        data = io.BytesIO()
+        with tarfile.open(fileobj=data, mode='w') as tar:
+            for name, content in members.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+        return data.getvalue()
+
+    def create_container(self, members, index=True):
+        tar_data = self.create_tar(members)
+        obj = FakeS3Object(tar_data)
+        self.objects[('bucket', 'foo.tar')] = obj
+
+        if index:
+            tmpdir = tempfile.mkdtemp()
+            self.addCleanup(shutil.rmtree, tmpdir)
+            container = os.path.join(tmpdir, 'foo.tar')
+            with open(container, 'wb') as f:
+                f.write(tar_data)
+            with open(write_tar_index(container), 'rb') as f:
+                self.objects[('bucket', 'foo.tar.index.json')] = FakeS3Object(f.read())
+
+        return obj
+
+    def get_storage_object(self, content_location_value, container):
+        storage_object = mock.Mock(content_location_value=content_location_value, container=container)
+        storage_object.ip.object_identifier_value = 'foo'
+        return storage_object
+
+    def test_open_file_in_container(self):
+        obj = self.create_container({
+            'foo/small.txt': b'small content',
+            'foo/large.bin': os.urandom(10 * 1024 * 1024),
+        }, index=False)
+        storage_object = self.get_storage_object('bucket/foo.tar', container=True)
+
+        f = self.s3.S3StorageBackend().open(storage_object, 'small.txt')
+        self.assertEqual(f.read(), b'small content')
+
+        self.assertLess(obj.bytes_fetched, len(obj.data) / 2)
+
+    def test_open_first_of_many_large_members_without_index(self):
+        members = {'foo/{}.bin'.format(i): os.urandom(int(1.5 * 1024 * 1024)) for i in range(20)}
+        obj = self.create_container(members, index=False)
+        storage_object = self.get_storage_object('bucket/foo.tar', container=True)
+
+        f = self.s3.S3StorageBackend().open(storage_object, '0.bin')
+        self.assertEqual(f.read(), members['foo/0.bin'])
+
+        # the header of the member and its data
+        self.assertEqual(len(obj.ranges), 2)
+        self.assertEqual(obj.bytes_fetched, tarfile.BLOCKSIZE + len(members['foo/0.bin']))
+
+    def test_open_last_of_many_large_members_without_index(self):
+        members = {'foo/{}.bin'.format(i): os.urandom(int(1.5 * 1024 * 1024)) for i in range(20)}
+        obj = self.create_container(members, index=False)
+        storage_object = self.get_storage_object('bucket/foo.tar', container=True)
+
+        f = self.s3.S3StorageBackend().open(storage_object, '19.bin')
+        self.assertEqual(f.read(), members['foo/19.bin'])
+
+        # the header of every member and the data of the last one
+        self.assertEqual(len(obj.ranges), 21)
+        self.assertEqual(obj.bytes_fetched, 20 * tarfile.BLOCKSIZE + len(members['foo/19.bin']))
+
+    def test_open_last_of_many_large_members_with_index(self):
+        members = {'foo/{}.bin'.format(i): os.urandom(int(1.5 * 1024 * 1024)) for i in range(20)}
+        obj = self.create_container(members)
+        storage_object = self.get_storage_object('bucket/foo.tar', container=True)
+
+        f = self.s3.S3StorageBackend().open(storage_object, '19.bin')
+        self.assertEqual(f.read(), members['foo/19.bin'])
+
+        # the start and end of the container to validate the index and the
+        # data of the member
+        self.assertEqual(len(obj.ranges), 3)
+        self.assertEqual(obj.bytes_fetched, 2 * TAR_INDEX_DIGEST_SIZE + len(members['foo/19.bin']))
+
+    def test_stale_index_is_ignored(self):
+        self.create_container({'foo/small.txt': b'small content'})
+        self.create_container({'foo/small.txt': b'other content'}, index=False)
+        storage_object = self.get_storage_object('bucket/foo.tar', container=True)
+
+        f = self.s3.S3StorageBackend().open(storage_object, 'small.txt')
+        self.assertEqual(f.read(), b'other content')
+
+    def test_open_missing_file_in_container(self):
+        self.create_container({'foo/small.txt': b'small content'})
+        storage_object = self.get_storage_object('bucket/foo.tar', container=True)
+
+        with self.assertRaises(FileNotFoundError):
+            self.s3.S3StorageBackend().open(storage_object, 'missing.txt')
+
+    def test_open_file_in_directory(self):
+        self.objects[('bucket', 'foo/bar/baz.txt')] = FakeS3Object(b'content')
+        storage_object = self.get_storage_object('bucket/foo', container=False)
+
+        f = self.s3.S3StorageBackend().open(storage_object, 'bar/baz.txt')
+        self.assertEqual(f.read(), b'content')
+
+        self.mock_object.assert_called_once_with('bucket', 'foo/bar/baz.txt')
+
+
+class S3StorageBackendWriteTests(S3StorageBackendTestCase):
+    @mock.patch('ESSArch_Core.storage.backends.s3.StorageObject.objects.create')
+    def test_write_container_with_index(self, mock_create):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        container = os.path.join(tmpdir, 'foo.tar')
+        with tarfile.open(container, 'w') as tar:
+            info = tarfile.TarInfo('foo/bar.txt')
+            tar.addfile(info, io.BytesIO(b''))
+
+        storage_medium = mock.Mock()
+        storage_medium.storage_target.target = 'bucket'
+
+        with mock.patch.object(self.s3.s3, 'Bucket') as mock_bucket:
+            self.s3.S3StorageBackend().write(container, mock.ANY, True, storage_medium)
+
+        mock_bucket.return_value.upload_file.assert_has_calls([
+            mock.call(container, 'foo.tar', Config=mock.ANY),
+            mock.call(container + '.index.json', 'foo.tar.index.json', Config=mock.ANY),
+        ])
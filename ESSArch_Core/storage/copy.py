@@ -1,11 +1,15 @@
 import errno
+import hashlib
 import logging
 import os
 import shutil
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from os import walk
 
+from django.conf import settings
 from requests import RequestException
+from requests.adapters import DEFAULT_POOLSIZE, HTTPAdapter
 from requests_toolbelt import MultipartEncoder
 from tenacity import (
     before_sleep_log,
@@ -15,7 +19,6 @@ from tenacity import (
     wait_fixed,
 )
 
-from ESSArch_Core.fixity.checksum import calculate_checksum
 from ESSArch_Core.storage.util import enough_space_available
 from ESSArch_Core.util import (
     pretty_mb_per_sec,
@@ -26,21 +29,38 @@ from ESSArch_Core.util import (
 MB = 1024 * 1024
 DEFAULT_BLOCK_SIZE = 10 * MB
 
+# Files smaller than this are copied concurrently when copying directories
+SMALL_FILE_SIZE = 1 * MB
+
+# Chunks sent to remote hosts are resized to take about this many seconds
+# each, within the given limits
+REMOTE_CHUNK_TARGET_TIME = 5
+REMOTE_CHUNK_MIN_SIZE = 1 * MB
+REMOTE_CHUNK_MAX_SIZE = 64 * MB
+
+# Errors from copy_file_range(2) telling that it can't be used for the given
+# files, e.g. when they are on different filesystems on older kernels
+COPY_FILE_RANGE_UNSUPPORTED_ERRNOS = {
+    errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EPERM,
+}
+
 
 @retry(retry=retry_if_exception_type(RequestException), reraise=True, stop=stop_after_attempt(5),
        wait=wait_fixed(60), before_sleep=before_sleep_log(logging.getLogger('essarch.storage.copy'), logging.DEBUG))
-def copy_chunk_remotely(src, dst, offset, file_size, requests_session, upload_id=None, block_size=DEFAULT_BLOCK_SIZE):
+def copy_chunk_remotely(src, dst, offset, file_size, requests_session, upload_id=None, block_size=DEFAULT_BLOCK_SIZE,
+                        chunk=None):
     logger = logging.getLogger('essarch.storage.copy')
     filename = os.path.basename(src)
 
-    with open(src, 'rb') as srcf:
-        srcf.seek(offset)
-        chunk = srcf.read(block_size)
+    if chunk is None:
+        with open(src, 'rb') as srcf:
+            srcf.seek(offset)
+            chunk = srcf.read(block_size)
 
     start = offset
     end = offset + block_size - 1
 
-    if end > file_size:
+    if end >= file_size:
         end = file_size - 1
 
     HTTP_CONTENT_RANGE = 'bytes %s-%s/%s' % (start, end, file_size)
@@ -73,6 +93,63 @@ def copy_chunk_remotely(src, dst, offset, file_size, requests_session, upload_id
     return response.json()['upload_id']
 
 
+def _get_mb_per_sec(size, time_elapsed):
+    size_mb = size / MB
+    try:
+        return size_mb / time_elapsed
+    except ZeroDivisionError:
+        return size_mb
+
+
+def _copy_file_range(fsrc, fdst):
+    """
+    Copies the content of fsrc to fdst using copy_file_range(2), which lets
+    the kernel copy the data without passing it through user space, or
+    share the extents (reflink) on filesystems supporting it such as Btrfs
+    and XFS
+
+    Returns:
+        False if nothing could be copied since copy_file_range(2) isn't
+        supported for the given files, else True
+    """
+
+    size = os.fstat(fsrc.fileno()).st_size
+    offset = 0
+
+    while offset < size:
+        try:
+            copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), size - offset)
+        except OSError as e:
+            if offset == 0 and e.errno in COPY_FILE_RANGE_UNSUPPORTED_ERRNOS:
+                return False
+            raise
+
+        if copied == 0:
+            if offset == 0:
+                return False
+            break
+
+        offset += copied
+
+    return True
+
+
+def _copyfile(src, dst):
+    if not hasattr(os, 'copy_file_range'):
+        shutil.copyfile(src, dst)
+        return
+
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        raise shutil.SameFileError('{!r} and {!r} are the same file'.format(src, dst))
+
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        if _copy_file_range(fsrc, fdst):
+            return
+
+    # fall back to shutil which uses sendfile(2) on platforms supporting it
+    shutil.copyfile(src, dst)
+
+
 def copy_file_locally(src, dst):
     logger = logging.getLogger('essarch.storage.copy')
     fsize = os.stat(src).st_size
@@ -81,21 +158,19 @@ def copy_file_locally(src, dst):
     os.makedirs(directory, exist_ok=True)
 
     time_start = time.time()
-    shutil.copyfile(src, dst)
+    _copyfile(src, dst)
     time_end = time.time()
 
     time_elapsed = time_end - time_start
-    fsize_mb = fsize / MB
-    try:
-        mb_per_sec = fsize_mb / time_elapsed
-    except ZeroDivisionError:
-        mb_per_sec = fsize_mb
+    mb_per_sec = _get_mb_per_sec(fsize, time_elapsed)
 
     logger.info(
         'Copied {} ({}) to {} at {} MB/Sec ({} sec)'.format(
             src, pretty_size(fsize), dst, pretty_mb_per_sec(mb_per_sec), pretty_time_to_sec(time_elapsed)
-        )
+        ),
+        extra={'src': src, 'dst': dst, 'size': fsize, 'time_elapsed': time_elapsed, 'mb_per_sec': mb_per_sec},
     )
+    return fsize
 
 
 @retry(retry=retry_if_exception_type(RequestException), reraise=True, stop=stop_after_attempt(5),
@@ -105,22 +180,95 @@ def _send_completion_request(requests_session, completion_url, data, headers):
     response.raise_for_status()
 
 
-def copy_file_remotely(src, dst, requests_session, block_size=DEFAULT_BLOCK_SIZE):
+def _get_remote_chunk_size(chunk_size, time_elapsed, min_size, max_size):
+    try:
+        size = int(chunk_size / time_elapsed * REMOTE_CHUNK_TARGET_TIME)
+    except ZeroDivisionError:
+        size = max_size
+
+    return max(min_size, min(size, max_size))
+
+
+def _mount_pooled_adapter(requests_session, url, pool_size):
+    # requests only keeps DEFAULT_POOLSIZE connections per host, any
+    # concurrent requests beyond that would open new connections for each
+    # request
+    if pool_size > DEFAULT_POOLSIZE:
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        requests_session.mount(url, adapter)
+
+
+def copy_file_remotely(src, dst, requests_session, block_size=DEFAULT_BLOCK_SIZE, workers=None):
+    """
+    Copies the given file to the given remote destination
+
+    The first chunk is sent by itself to create the file at the destination,
+    after that up to ``workers`` chunks are sent concurrently while the next
+    chunks are read. The size of the chunks is adapted to the measured
+    throughput, starting from block_size.
+
+    Args:
+        src: The file to copy
+        dst: The URL that the file should be copied to
+        requests_session: The request session to be used
+        block_size: Size of the first chunk
+        workers: The number of concurrent chunk uploads, defaults to
+            settings.STORAGE_REMOTE_COPY_WORKERS
+    Returns:
+        None
+    """
+
     logger = logging.getLogger('essarch.storage.copy')
     fsize = os.stat(src).st_size
-    idx = 0
 
-    time_start = time.time()
-    upload_id = copy_chunk_remotely(src, dst, idx * block_size, requests_session=requests_session,
-                                    file_size=fsize, block_size=block_size)
-    idx += 1
+    if workers is None:
+        workers = getattr(settings, 'STORAGE_REMOTE_COPY_WORKERS', 1)
+
+    min_block_size = min(block_size, REMOTE_CHUNK_MIN_SIZE)
+    max_block_size = max(block_size, REMOTE_CHUNK_MAX_SIZE)
+    _mount_pooled_adapter(requests_session, dst, workers)
 
-    while idx * block_size <= fsize:
-        copy_chunk_remotely(src, dst, idx * block_size, requests_session=requests_session,
-                            file_size=fsize, block_size=block_size, upload_id=upload_id)
-        idx += 1
+    def send_chunk(chunk, offset, upload_id=None):
+        chunk_time_start = time.time()
+        upload_id = copy_chunk_remotely(src, dst, offset, requests_session=requests_session, file_size=fsize,
+                                        block_size=len(chunk), upload_id=upload_id, chunk=chunk)
+        return upload_id, len(chunk), time.time() - chunk_time_start
 
-    md5 = calculate_checksum(src, algorithm='MD5', block_size=block_size)
+    md5 = hashlib.md5()
+    time_start = time.time()
+
+    with open(src, 'rb') as srcf:
+        chunk = srcf.read(block_size)
+        md5.update(chunk)
+        upload_id, chunk_size, chunk_time = send_chunk(chunk, 0)
+        block_size = _get_remote_chunk_size(chunk_size, chunk_time, min_block_size, max_block_size)
+        offset = chunk_size
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = set()
+            try:
+                while offset < fsize:
+                    chunk = srcf.read(block_size)
+                    if not chunk:
+                        break
+
+                    md5.update(chunk)
+                    pending.add(executor.submit(send_chunk, chunk, offset, upload_id))
+                    offset += len(chunk)
+
+                    while len(pending) >= workers:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            _, chunk_size, chunk_time = future.result()
+                            block_size = _get_remote_chunk_size(
+                                chunk_size, chunk_time, min_block_size, max_block_size,
+                            )
+
+                for future in pending:
+                    future.result()
+            except BaseException:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
 
     completion_url = dst.rstrip('/') + '_complete/'
 
@@ -128,7 +276,7 @@ def copy_file_remotely(src, dst, requests_session, block_size=DEFAULT_BLOCK_SIZE
         fields={
             'path': os.path.basename(src),
             'upload_id': upload_id,
-            'md5': md5,
+            'md5': md5.hexdigest(),
             'dst': requests_session.params.get('dst')
         }
     )
@@ -138,20 +286,17 @@ def copy_file_remotely(src, dst, requests_session, block_size=DEFAULT_BLOCK_SIZE
     time_end = time.time()
 
     time_elapsed = time_end - time_start
-    fsize_mb = fsize / MB
-    try:
-        mb_per_sec = fsize_mb / time_elapsed
-    except ZeroDivisionError:
-        mb_per_sec = fsize_mb
+    mb_per_sec = _get_mb_per_sec(fsize, time_elapsed)
 
     logger.info(
         'Copied {} ({}) to {} at {} MB/Sec ({} sec)'.format(
             src, pretty_size(fsize), dst, pretty_mb_per_sec(mb_per_sec), pretty_time_to_sec(time_elapsed)
-        )
+        ),
+        extra={'src': src, 'dst': dst, 'size': fsize, 'time_elapsed': time_elapsed, 'mb_per_sec': mb_per_sec},
     )
 
 
-def copy_file(src, dst, requests_session=None, block_size=DEFAULT_BLOCK_SIZE):
+def copy_file(src, dst, requests_session=None, block_size=DEFAULT_BLOCK_SIZE, workers=None):
     """
     Copies the given file to the given destination
 
@@ -160,6 +305,8 @@ def copy_file(src, dst, requests_session=None, block_size=DEFAULT_BLOCK_SIZE):
         dst: Where the file should be copied to
         requests_session: The request session to be used
         block_size: Size of each block to copy
+        workers: The number of chunks sent concurrently when copying to a
+            remote destination
     Returns:
         None
     """
@@ -171,7 +318,7 @@ def copy_file(src, dst, requests_session=None, block_size=DEFAULT_BLOCK_SIZE):
     logger.info('Copying %s to %s' % (src, dst))
 
     if requests_session is not None:
-        copy_file_remotely(src, dst, requests_session, block_size=block_size)
+        copy_file_remotely(src, dst, requests_session, block_size=block_size, workers=workers)
     else:
         try:
             enough_space_available(os.path.dirname(dst), src, True)
@@ -183,7 +330,26 @@ def copy_file(src, dst, requests_session=None, block_size=DEFAULT_BLOCK_SIZE):
     return dst
 
 
-def copy_dir(src, dst, requests_session=None, block_size=DEFAULT_BLOCK_SIZE):
+def copy_dir(src, dst, requests_session=None, block_size=DEFAULT_BLOCK_SIZE, workers=None):
+    """
+    Copies the given directory to the given destination
+
+    Available space is only checked once for the whole tree. Locally, files
+    smaller than SMALL_FILE_SIZE are copied concurrently using the given
+    number of threads while larger files are copied one at a time.
+
+    Args:
+        src: The directory to copy
+        dst: Where the directory should be copied to
+        requests_session: The request session to be used
+        block_size: Size of each block to copy
+        workers: The number of threads used to copy small files locally,
+            defaults to settings.STORAGE_COPY_WORKERS
+    Returns:
+        dst
+    """
+
+    logger = logging.getLogger('essarch.storage.copy')
     if os.path.isfile(dst):
         raise ValueError(f'Cannot overwrite non-directory {dst} with directory {src}')
 
@@ -193,21 +359,58 @@ def copy_dir(src, dst, requests_session=None, block_size=DEFAULT_BLOCK_SIZE):
         os.makedirs(dst, exist_ok=True)
         enough_space_available(dst, src, True)
 
+    if requests_session is not None:
+        for root, _dirs, files in walk(src):
+            for f in files:
+                src_filepath = os.path.join(root, f)
+                src_relpath = os.path.relpath(src_filepath, src)
+                dst_filepath = os.path.join(dst, src_relpath)
+
+                os.makedirs(os.path.dirname(dst_filepath), exist_ok=True)
+                copy_file(src_filepath, dst_filepath, requests_session=requests_session, block_size=block_size)
+        return dst
+
+    if workers is None:
+        workers = getattr(settings, 'STORAGE_COPY_WORKERS', 1)
+
+    small_files = []
+    large_files = []
     for root, dirs, files in walk(src):
+        for d in dirs:
+            os.makedirs(os.path.join(dst, os.path.relpath(os.path.join(root, d), src)), exist_ok=True)
+
         for f in files:
             src_filepath = os.path.join(root, f)
-            src_relpath = os.path.relpath(src_filepath, src)
-            dst_filepath = os.path.join(dst, src_relpath)
-
-            os.makedirs(os.path.dirname(dst_filepath), exist_ok=True)
-            copy_file(src_filepath, dst_filepath, requests_session=requests_session, block_size=block_size)
-
-        if requests_session is None:
-            for d in dirs:
-                src_dir = os.path.join(root, d)
-                src_relpath = os.path.relpath(src_dir, src)
-                dst_dir = os.path.join(dst, src_relpath)
-                os.makedirs(dst_dir, exist_ok=True)
+            dst_filepath = os.path.join(dst, os.path.relpath(src_filepath, src))
+            if workers > 1 and os.path.getsize(src_filepath) < SMALL_FILE_SIZE:
+                small_files.append((src_filepath, dst_filepath))
+            else:
+                large_files.append((src_filepath, dst_filepath))
+
+    time_start = time.time()
+    total_size = 0
+
+    if small_files:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            total_size += sum(executor.map(lambda paths: copy_file_locally(*paths), small_files))
+
+    for src_filepath, dst_filepath in large_files:
+        total_size += copy_file_locally(src_filepath, dst_filepath)
+
+    time_elapsed = time.time() - time_start
+    mb_per_sec = _get_mb_per_sec(total_size, time_elapsed)
+    file_count = len(small_files) + len(large_files)
+
+    logger.info(
+        'Copied {} ({} files, {}) to {} at {} MB/Sec ({} sec)'.format(
+            src, file_count, pretty_size(total_size), dst, pretty_mb_per_sec(mb_per_sec),
+            pretty_time_to_sec(time_elapsed),
+        ),
+        extra={
+            'src': src, 'dst': dst, 'size': total_size, 'files': file_count,
+            'time_elapsed': time_elapsed, 'mb_per_sec': mb_per_sec,
+        },
+    )
     return dst
 
 
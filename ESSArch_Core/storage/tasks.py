@@ -16,7 +16,7 @@ from ESSArch_Core.ip.models import InformationPackage
 from ESSArch_Core.ip.utils import generate_aic_mets, generate_package_mets
 from ESSArch_Core.storage.copy import copy_file
 from ESSArch_Core.storage.models import StorageMethod, StorageTarget
-from ESSArch_Core.util import zip_directory
+from ESSArch_Core.util import write_tar_index, zip_directory
 from ESSArch_Core.WorkflowEngine.models import ProcessStep
 
 User = get_user_model()
@@ -146,6 +146,7 @@ def StorageMigration(self, storage_method, temp_path):
             with tarfile.open(container_path, 'w') as new_tar:
                 new_tar.format = settings.TARFILE_FORMAT
                 new_tar.add(dir_path)
+            write_tar_index(container_path)
         elif container_format == 'zip':
             zip_directory(dirname=dir_path, zipname=container_path, compress=False)
         else:
@@ -1,7 +1,9 @@
 import errno
+import hashlib
 import os
 import shutil
 import tempfile
+import unittest
 import uuid
 from collections import namedtuple
 from filecmp import cmp
@@ -108,7 +110,7 @@ class CopyFileTestCase(SimpleTestCase):
 
     @mock.patch('ESSArch_Core.storage.copy._send_completion_request')
     @mock.patch('ESSArch_Core.storage.copy.copy_chunk_remotely', return_value='test_upload_id')
-    def test_copy_file_remotely(self, mock_copy, _mock_req):
+    def test_copy_file_remotely(self, mock_copy, mock_req):
         src = os.path.join(self.datadir, 'foo.txt')
         with open(src, 'w') as f:
             f.write('test')
@@ -116,11 +118,47 @@ class CopyFileTestCase(SimpleTestCase):
         session = requests.Session()
 
         copy_file(src, dst, requests_session=session, block_size=1)
-        mock_copy.assert_has_calls(
-            [mock.call(src, dst, 0, block_size=1, file_size=4, requests_session=session)] +
-            [mock.call(src, dst, i, block_size=1, file_size=4, requests_session=session, upload_id='test_upload_id')
-             for i in range(1, 5)]
-        )
+        mock_copy.assert_has_calls([
+            mock.call(src, dst, 0, block_size=1, file_size=4, requests_session=session, upload_id=None, chunk=b't'),
+            mock.call(src, dst, 1, block_size=3, file_size=4, requests_session=session, upload_id='test_upload_id',
+                      chunk=b'est'),
+        ])
+        self.assertEqual(mock_req.call_args[0][2].fields['md5'], hashlib.md5(b'test').hexdigest())
+
+    @mock.patch('ESSArch_Core.storage.copy.REMOTE_CHUNK_MAX_SIZE', 10)
+    @mock.patch('ESSArch_Core.storage.copy._send_completion_request')
+    @mock.patch('ESSArch_Core.storage.copy.copy_chunk_remotely', return_value='test_upload_id')
+    def test_copy_file_remotely_concurrently(self, mock_copy, mock_req):
+        content = os.urandom(1000)
+        src = os.path.join(self.datadir, 'foo.txt')
+        with open(src, 'wb') as f:
+            f.write(content)
+        session = requests.Session()
+
+        copy_file(src, 'bar', requests_session=session, block_size=10, workers=4)
+
+        self.assertEqual(mock_copy.call_count, 100)
+        received = bytearray(len(content))
+        for c in mock_copy.call_args_list:
+            offset, chunk = c.args[2], c.kwargs['chunk']
+            received[offset:offset + len(chunk)] = chunk
+
+        self.assertEqual(received, content)
+        self.assertEqual(mock_req.call_args[0][2].fields['md5'], hashlib.md5(content).hexdigest())
+
+    @mock.patch('ESSArch_Core.storage.copy.REMOTE_CHUNK_MAX_SIZE', 10)
+    @mock.patch('ESSArch_Core.storage.copy._send_completion_request')
+    @mock.patch('ESSArch_Core.storage.copy.copy_chunk_remotely')
+    def test_copy_file_remotely_failed_chunk(self, mock_copy, mock_req):
+        mock_copy.side_effect = ['test_upload_id'] + [requests.exceptions.HTTPError] * 99
+        src = os.path.join(self.datadir, 'foo.txt')
+        with open(src, 'wb') as f:
+            f.write(os.urandom(1000))
+
+        with self.assertRaises(requests.exceptions.HTTPError):
+            copy_file(src, 'bar', requests_session=requests.Session(), block_size=10, workers=4)
+
+        mock_req.assert_not_called()
 
     def test_copy_with_not_enough_space_at_dst(self):
         src = os.path.join(self.datadir, 'foo.txt')
@@ -200,3 +238,56 @@ class CopyDirTests(SimpleTestCase):
         with mock_size, mock_free:
             with self.assertRaises(NoSpaceLeftError):
                 copy_dir(src, dst)
+
+    def test_copy_many_small_files_concurrently(self):
+        src = os.path.join(self.root, 'src')
+        os.makedirs(os.path.join(src, 'a', 'b'))
+
+        expected = {}
+        for i in range(20):
+            relpath = os.path.join('a' if i % 2 else 'a/b', f'{i}.txt')
+            expected[relpath] = os.urandom(i * 100)
+            with open(os.path.join(src, relpath), 'wb') as f:
+                f.write(expected[relpath])
+
+        dst = os.path.join(self.root, 'dst')
+        with mock.patch('ESSArch_Core.storage.copy.enough_space_available') as mock_space:
+            copy_dir(src, dst, workers=4)
+
+        mock_space.assert_called_once_with(dst, src, True)
+        for relpath, content in expected.items():
+            with open(os.path.join(dst, relpath), 'rb') as f:
+                self.assertEqual(f.read(), content)
+
+
+class CopyFileRangeTests(SimpleTestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+
+        self.src = os.path.join(self.datadir, 'src.bin')
+        self.dst = os.path.join(self.datadir, 'dst.bin')
+        with open(self.src, 'wb') as f:
+            f.write(os.urandom(3 * 1024 * 1024 + 1))
+
+    @unittest.skipUnless(hasattr(os, 'copy_file_range'), 'copy_file_range is not available')
+    def test_copy_file_range(self):
+        with mock.patch('ESSArch_Core.storage.copy.shutil.copyfile') as mock_copyfile:
+            copy_file(self.src, self.dst)
+
+        mock_copyfile.assert_not_called()
+        self.assertTrue(cmp(self.src, self.dst, shallow=False))
+
+    @unittest.skipUnless(hasattr(os, 'copy_file_range'), 'copy_file_range is not available')
+    def test_fallback_when_copy_file_range_is_unsupported(self):
+        error = OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+        with mock.patch('ESSArch_Core.storage.copy.os.copy_file_range', side_effect=error):
+            copy_file(self.src, self.dst)
+
+        self.assertTrue(cmp(self.src, self.dst, shallow=False))
+
+    def test_copy_onto_itself(self):
+        with self.assertRaises(shutil.SameFileError):
+            copy_file(self.src, self.src)
+
+        self.assertEqual(os.path.getsize(self.src), 3 * 1024 * 1024 + 1)
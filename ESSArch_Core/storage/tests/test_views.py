@@ -1053,28 +1053,21 @@ class StorageMigrationTests(StorageMigrationTestsBase):
             run_state=mock.ANY,
             queue=mock.ANY,
         ))
-        for ip in [ips[0], ips[5], ips[3], ips[1], ips[2], ips[4]]:
-            # calls.append(mock.call(name='Migrate Information Package', eager=False, information_package=ip,
-            #                        context=mock.ANY, responsible=mock.ANY, label=mock.ANY, part_root=mock.ANY,
-            #                        run_state=mock.ANY))
-            calls.append(mock.call(name='Write to storage methods', parallel=mock.ANY, parent=mock.ANY,
-                                   parent_pos=mock.ANY, eager=False, information_package=ip, context=mock.ANY,
-                                   responsible=mock.ANY, queue=mock.ANY))
-            calls.append(mock.call(name='Write non-containers', parallel=mock.ANY, parent=mock.ANY,
-                                   parent_pos=mock.ANY, eager=False, information_package=ip, context=mock.ANY,
-                                   responsible=mock.ANY, queue=mock.ANY))
-            calls.append(mock.call(name='Write non-containers to storage methods', parallel=mock.ANY, parent=mock.ANY,
-                                   parent_pos=mock.ANY, eager=False, information_package=ip, context=mock.ANY,
-                                   responsible=mock.ANY, queue=mock.ANY))
-            calls.append(mock.call(name='Write containers to storage methods', parallel=mock.ANY, parent=mock.ANY,
-                                   parent_pos=mock.ANY, eager=False, information_package=ip, context=mock.ANY,
-                                   responsible=mock.ANY, queue=mock.ANY))
-            calls.append(mock.call(name='Delete temporary files', parallel=mock.ANY, parent=mock.ANY,
-                                   parent_pos=mock.ANY, eager=False, information_package=ip, context=mock.ANY,
-                                   responsible=mock.ANY, queue=mock.ANY))
-
         mock_task.assert_has_calls(calls)
 
+        # there are no containers to write, so that step is removed
+        step_names = [
+            'Write to storage methods',
+            'Write non-containers',
+            'Write non-containers to storage methods',
+            'Delete temporary files',
+        ]
+        steps = ProcessStep.objects.filter(name__in=step_names).order_by('tree_id', 'lft')
+        self.assertEqual(
+            [(step.name, step.information_package) for step in steps],
+            [(name, ip) for ip in [ips[0], ips[5], ips[3], ips[1], ips[2], ips[4]] for name in step_names],
+        )
+
     @mock.patch(
         'ESSArch_Core.storage.serializers.ProcessStep.objects.create',
         side_effect=ProcessStep.objects.create
@@ -1123,28 +1116,21 @@ class StorageMigrationTests(StorageMigrationTestsBase):
             run_state=mock.ANY,
             queue=mock.ANY,
         ))
-        for ip in [ips[0], ips[5], ips[3], ips[1], ips[2], ips[4]]:
-            # calls.append(mock.call(name='Migrate Information Package', eager=False, information_package=ip,
-            #                        context=mock.ANY, responsible=mock.ANY, label=mock.ANY, part_root=mock.ANY,
-            #                        run_state=mock.ANY))
-            calls.append(mock.call(name='Write to storage methods', parallel=mock.ANY, parent=mock.ANY,
-                                   parent_pos=mock.ANY, eager=False, information_package=ip, context=mock.ANY,
-                                   responsible=mock.ANY, queue=mock.ANY))
-            calls.append(mock.call(name='Write non-containers', parallel=mock.ANY, parent=mock.ANY,
-                                   parent_pos=mock.ANY, eager=False, information_package=ip, context=mock.ANY,
-                                   responsible=mock.ANY, queue=mock.ANY))
-            calls.append(mock.call(name='Write non-containers to storage methods', parallel=mock.ANY, parent=mock.ANY,
-                                   parent_pos=mock.ANY, eager=False, information_package=ip, context=mock.ANY,
-                                   responsible=mock.ANY, queue=mock.ANY))
-            calls.append(mock.call(name='Write containers to storage methods', parallel=mock.ANY, parent=mock.ANY,
-                                   parent_pos=mock.ANY, eager=False, information_package=ip, context=mock.ANY,
-                                   responsible=mock.ANY, queue=mock.ANY))
-            calls.append(mock.call(name='Delete temporary files', parallel=mock.ANY, parent=mock.ANY,
-                                   parent_pos=mock.ANY, eager=False, information_package=ip, context=mock.ANY,
-                                   responsible=mock.ANY, queue=mock.ANY))
-
         mock_task.assert_has_calls(calls)
 
+        # there are no containers to write, so that step is removed
+        step_names = [
+            'Write to storage methods',
+            'Write non-containers',
+            'Write non-containers to storage methods',
+            'Delete temporary files',
+        ]
+        steps = ProcessStep.objects.filter(name__in=step_names).order_by('tree_id', 'lft')
+        self.assertEqual(
+            [(step.name, step.information_package) for step in steps],
+            [(name, ip) for ip in [ips[0], ips[5], ips[3], ips[1], ips[2], ips[4]] for name in step_names],
+        )
+
     @mock.patch('ESSArch_Core.ip.views.ProcessStep.run')
     @TaskRunner()
     def test_queue_duplicate_migrations(self, mock_task):
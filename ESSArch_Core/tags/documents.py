@@ -1,9 +1,8 @@
 import logging
 import time
-from urllib.parse import urljoin
 
 import requests
-from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 from elasticsearch.exceptions import NotFoundError
 from elasticsearch_dsl import (
@@ -24,6 +23,11 @@ from elasticsearch_dsl import (
 )
 
 from ESSArch_Core.search.documents import DocumentBase
+from ESSArch_Core.search.extraction import (
+    cache_content,
+    get_content_cache_key,
+    tika_put,
+)
 from ESSArch_Core.tags.models import StructureUnit, TagVersion
 from ESSArch_Core.util import (
     pretty_mb_per_sec,
@@ -211,6 +215,10 @@ class Component(VersionedDocType):
     def get_index_queryset(cls):
         return TagVersion.objects.select_related('tag', 'type').filter(elastic_index='component')
 
+    @classmethod
+    def prepare_index_queryset(cls, queryset):
+        return queryset.select_related('tag__task', 'type').prefetch_related('agent_links')
+
     @classmethod
     def from_obj(cls, obj, archive=None):
         units = StructureUnit.objects.filter(tagstructure__tag__versions=obj)
@@ -238,12 +246,12 @@ class Component(VersionedDocType):
             date_render_format=obj.type.date_render_format,
             archive=archive_doc,
             structure_units=[ComponentStructureUnitDocument.from_obj(unit) for unit in units],
-            current_version=obj.tag.current_version == obj,
+            current_version=obj.tag.current_version_id == obj.pk,
             name=obj.name,
             desc=obj.description,
             reference_code=obj.reference_code,
             type=obj.type.name,
-            agents=[str(pk) for pk in obj.agents.values_list('pk', flat=True)] + archive_agents,
+            agents=[str(link.agent_id) for link in obj.agent_links.all()] + archive_agents,
             security_level=obj.security_level,
             **obj.custom_fields,
         )
@@ -277,6 +285,10 @@ class Archive(VersionedDocType):
     def get_index_queryset(cls):
         return TagVersion.objects.select_related('tag', 'type').filter(elastic_index='archive')
 
+    @classmethod
+    def prepare_index_queryset(cls, queryset):
+        return queryset.select_related('tag__task', 'type').prefetch_related('agent_links')
+
     @classmethod
     def from_obj(cls, obj):
         if obj.tag.task is None:
@@ -289,11 +301,11 @@ class Archive(VersionedDocType):
             id=str(obj.pk),
             task_id=task_id,
             appraisal_date=obj.tag.appraisal_date,
-            current_version=obj.tag.current_version == obj,
+            current_version=obj.tag.current_version_id == obj.pk,
             name=obj.name,
             type=obj.type.name,
             reference_code=obj.reference_code,
-            agents=[str(pk) for pk in obj.agents.values_list('pk', flat=True)],
+            agents=[str(link.agent_id) for link in obj.agent_links.all()],
             security_level=obj.security_level,
             **obj.custom_fields,
         )
@@ -368,6 +380,12 @@ class File(Component):
             'tag', 'tag__information_package', 'type',
         ).filter(elastic_index='document')
 
+    @classmethod
+    def prepare_index_queryset(cls, queryset):
+        return queryset.select_related(
+            'tag__task', 'tag__information_package', 'tag__current_version', 'type',
+        ).prefetch_related('agent_links')
+
     @classmethod
     def from_obj(cls, obj, archive=None):
         units = StructureUnit.objects.filter(tagstructure__tag__versions=obj)
@@ -408,13 +426,13 @@ class File(Component):
             appraisal_date=obj.tag.appraisal_date,
             archive=archive_doc,
             structure_units=[ComponentStructureUnitDocument.from_obj(unit) for unit in units],
-            current_version=obj.tag.current_version == obj,
+            current_version=obj.tag.current_version_id == obj.pk,
             name=obj.name,
             desc=obj.description,
             reference_code=obj.reference_code,
             type=obj.type.name,
             ip=ip_id,
-            agents=[str(pk) for pk in obj.agents.values_list('pk', flat=True)],
+            agents=[str(link.agent_id) for link in obj.agent_links.all()],
             start_date=getattr(current_version, 'start_date', None),
             end_date=getattr(current_version, 'end_date', None),
             date_render_format=obj.type.date_render_format,
@@ -426,20 +444,20 @@ class File(Component):
         return doc
 
     @classmethod
-    def enrich_with_content(cls, doc, file_obj):
+    def enrich_with_content(cls, doc, file_obj, checksum=None, checksum_algorithm='SHA-256'):
         logger = logging.getLogger('essarch.search')
-        base_url = getattr(settings, 'TIKA_URL', 'http://localhost:9998')
-        TIKA_URL = urljoin(base_url.rstrip('/') + '/', 'tika')
-        file_obj.seek(0)
+
+        cache_key = get_content_cache_key(file_obj, checksum, checksum_algorithm)
+        if cache_key is not None:
+            content = cache.get(cache_key)
+            if content is not None:
+                doc.content = content
+                logger.debug(f'Using cached content for file name {doc.filename} ({doc.id})')
+                return doc
 
         try:
             time_start = time.time()
-            response = requests.put(
-                TIKA_URL,
-                data=file_obj,
-                headers={"Accept": "text/plain; charset=utf-8"},
-                timeout=600
-            )
+            response = tika_put(file_obj)
             time_end = time.time()
             time_elapsed = time_end - time_start
             fsize_mb = doc.size / MB
@@ -457,6 +475,8 @@ class File(Component):
                     f'{pretty_size(response_size_bytes)}, decoded: {response_size_chars} characters, filesize: '
                     f'{pretty_size(doc.size)}, speed: {pretty_mb_per_sec(mb_per_sec)} MB/Sec '
                     f'({pretty_time_to_sec(time_elapsed)} sec)')
+                if cache_key is not None:
+                    cache_content(cache_key, doc.content)
             else:
                 logger.warning(
                     f'Failed to extract content for file name {doc.filename} ({doc.id}) using Tika, '
@@ -489,6 +509,12 @@ class Directory(Component):
             'tag', 'tag__information_package', 'type',
         ).filter(elastic_index='directory')
 
+    @classmethod
+    def prepare_index_queryset(cls, queryset):
+        return queryset.select_related(
+            'tag__task', 'tag__information_package', 'type',
+        ).prefetch_related('agent_links')
+
     @classmethod
     def from_obj(cls, obj, archive=None):
         units = StructureUnit.objects.filter(tagstructure__tag__versions=obj)
@@ -512,13 +538,13 @@ class Directory(Component):
             appraisal_date=obj.tag.appraisal_date,
             archive=archive_doc,
             structure_units=[ComponentStructureUnitDocument.from_obj(unit) for unit in units],
-            current_version=obj.tag.current_version == obj,
+            current_version=obj.tag.current_version_id == obj.pk,
             name=obj.name,
             desc=obj.description,
             reference_code=obj.reference_code,
             type=obj.type.name,
             ip=str(obj.tag.information_package.pk),
-            agents=[str(pk) for pk in obj.agents.values_list('pk', flat=True)],
+            agents=[str(link.agent_id) for link in obj.agent_links.all()],
             **obj.custom_fields,
         )
         return doc
@@ -556,6 +582,10 @@ class StructureUnitDocument(DocumentBase):
     def get_index_queryset(cls):
         return StructureUnit.objects.filter(structure__is_template=False)
 
+    @classmethod
+    def prepare_index_queryset(cls, queryset):
+        return queryset.select_related('task', 'type', 'structure')
+
     @classmethod
     def from_obj(cls, obj):
         structure_set = obj.structure.tagstructure_set
@@ -11,7 +11,7 @@ import tempfile
 import requests
 from django.conf import settings
 from django.core.cache import cache
-from django.core.exceptions import ValidationError
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.core.mail import EmailMessage
 from django.db import models, transaction
 from django.db.models import Prefetch
@@ -33,7 +33,11 @@ from weasyprint import HTML
 
 from ESSArch_Core.agents.models import AgentTagLink
 from ESSArch_Core.auth.serializers import ChangeOrganizationSerializer
-from ESSArch_Core.auth.util import get_group_objs_model, get_objects_for_user
+from ESSArch_Core.auth.util import (
+    get_group_objs_model,
+    get_object_visibility_version,
+    get_objects_for_user,
+)
 from ESSArch_Core.configuration.decorators import feature_enabled_or_404
 from ESSArch_Core.ip.models import InformationPackage
 from ESSArch_Core.maintenance.models import AppraisalJob
@@ -62,6 +66,42 @@ SORTABLE_FIELDS = (
 )
 
 
+def get_search_visibility(user):
+    """
+    Returns the ids of the archives and information packages visible to user
+    in the current organization. The ids are cached for each user and
+    organization until the visibility of any object changes, or for at most
+    SEARCH_VISIBILITY_CACHE_TIMEOUT seconds.
+    """
+
+    timeout = getattr(settings, 'SEARCH_VISIBILITY_CACHE_TIMEOUT', 0)
+    if timeout:
+        try:
+            organization = user.user_profile.current_organization
+        except ObjectDoesNotExist:
+            organization = None
+
+        # changes of these flags don't invalidate the visibility of objects
+        cache_key = 'search_visibility_{}_{}_{}_{:d}{:d}'.format(
+            get_object_visibility_version(), user.pk, getattr(organization, 'pk', None),
+            user.is_active, user.is_superuser,
+        )
+        visibility = cache.get(cache_key)
+        if visibility is not None:
+            return visibility
+
+    archives = TagVersion.objects.filter(elastic_index='archive').for_user(user, [])
+    ips = InformationPackage.objects.for_user(user, [])
+    visibility = (
+        [str(pk) for pk in archives.values_list('pk', flat=True)],
+        [str(pk) for pk in ips.values_list('pk', flat=True)],
+    )
+
+    if timeout:
+        cache.set(cache_key, visibility, timeout)
+    return visibility
+
+
 class ComponentSearch(FacetedSearch):
     index = ['component', 'document', 'structure_unit']
     fields = [
@@ -116,8 +156,7 @@ class ComponentSearch(FacetedSearch):
         components and `_id` on archives.
         """
 
-        organization_archives = TagVersion.objects.filter(elastic_index='archive').for_user(self.user, [])
-        organization_archives = [str(x) for x in list(organization_archives.values_list('pk', flat=True))]
+        organization_archives, organization_ips = get_search_visibility(self.user)
 
         s = super().search()
         s = s.source(excludes=["attachment.content"])
@@ -145,24 +184,22 @@ class ComponentSearch(FacetedSearch):
         #   permission to see files in other user's IPs. Otherwise, only get documents
         #   from IPs that the user is responsible for
 
-        organization_ips = InformationPackage.objects.for_user(self.user, []).values_list('pk', flat=True)
-
         if self.user.has_perm('ip.see_other_user_ip_files'):
             document_ips = organization_ips
         else:
-            document_ips = self.user.information_packages.values_list('pk', flat=True)
+            document_ips = [str(pk) for pk in self.user.information_packages.values_list('pk', flat=True)]
 
         s = s.filter(Q('bool', minimum_should_match=1, should=[
             Q('bool', must=[
                 Q('bool', minimum_should_match=1, should=[
                     ~Q('exists', field='ip'),
-                    Q('terms', ip=list(organization_ips))
+                    Q('terms', ip=organization_ips)
                 ]),
                 Q('bool', **{'must_not': {'terms': {'_index': ['document-*']}}}),
             ]),
             Q('bool', must=[
                 Q('terms', _index=['document-*']),
-                Q('bool', minimum_should_match=1, should=[~Q('exists', field='ip'), Q('terms', ip=list(document_ips))])
+                Q('bool', minimum_should_match=1, should=[~Q('exists', field='ip'), Q('terms', ip=document_ips)])
             ]),
         ]))
 
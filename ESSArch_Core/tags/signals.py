@@ -4,6 +4,7 @@ from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from elasticsearch.exceptions import NotFoundError
 
+from ESSArch_Core.auth.util import invalidate_object_visibility
 from ESSArch_Core.tags.documents import StructureUnitDocument
 from ESSArch_Core.tags.models import StructureUnit, Tag, TagVersion
 
@@ -20,6 +21,13 @@ def set_current_version_after_creation(sender, instance, created, **kwargs):
         logger.debug(f"TagVersion '{instance}' was updated.")
 
 
+@receiver(post_save, sender=TagVersion)
+@receiver(post_delete, sender=TagVersion)
+def archive_visibility_change(sender, instance, **kwargs):
+    if instance.elastic_index == 'archive':
+        invalidate_object_visibility()
+
+
 @receiver(pre_delete, sender=TagVersion)
 def pre_tag_version_delete(sender, instance, **kwargs):
     logger = logging.getLogger('essarch.core')
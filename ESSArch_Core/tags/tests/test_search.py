@@ -7,7 +7,10 @@ from countries_plus.models import Country
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Permission
-from django.test import override_settings, tag
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.timezone import make_aware
@@ -50,6 +53,7 @@ from ESSArch_Core.tags.models import (
     TagVersion,
     TagVersionType,
 )
+from ESSArch_Core.tags.search import get_search_visibility
 
 User = get_user_model()
 
@@ -450,6 +454,41 @@ class DocumentSearchTestCase(ESSArchSearchBaseTestCase):
         self.assertEqual(res.data['hits'][0]['_id'], str(document_tag_version.pk))
 
 
+class RemoveStaleTestCase(ESSArchSearchBaseTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.component_type = TagVersionType.objects.create(name='component', archive_type=False)
+
+    def create_component(self):
+        tag_version = TagVersion.objects.create(
+            tag=Tag.objects.create(),
+            type=self.component_type,
+            elastic_index="component",
+        )
+        Component.from_obj(tag_version).save(refresh='true')
+        return tag_version
+
+    def get_index_ids(self):
+        Component._index.refresh()
+        return {hit.meta.id for hit in Component.search().source(False).scan()}
+
+    def test_remove_stale(self):
+        components = [self.create_component() for _ in range(7)]
+        Component(_id='invalid').save(refresh='true')
+
+        stale = {components[1], components[4], components[5]}
+        queryset = TagVersion.objects.exclude(pk__in=[c.pk for c in stale])
+
+        Component.remove_stale(queryset, batch_size=2)
+        self.assertEqual(self.get_index_ids(), {str(c.pk) for c in components if c not in stale})
+
+    def test_remove_stale_without_stale_documents(self):
+        components = [self.create_component() for _ in range(3)]
+
+        Component.remove_stale(TagVersion.objects.all(), batch_size=2)
+        self.assertEqual(self.get_index_ids(), {str(c.pk) for c in components})
+
+
 class SecurityLevelTestCase(ESSArchSearchBaseTestCase):
     fixtures = ['countries_data', 'languages_data']
 
@@ -567,3 +606,78 @@ class SecurityLevelTestCase(ESSArchSearchBaseTestCase):
                     res = self.client.get(self.url)
                     self.assertEqual(res.status_code, status.HTTP_200_OK)
                     self.assertEqual(len(res.data['hits']), 0)
+
+
+@override_settings(SEARCH_VISIBILITY_CACHE_TIMEOUT=60)
+class SearchVisibilityTests(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+
+        self.org_group_type = GroupType.objects.create(codename='organization')
+        self.group = Group.objects.create(name='group', group_type=self.org_group_type)
+        self.user = User.objects.create(username='user')
+        self.group.add_member(self.user.essauth_member)
+        self.user.user_profile.current_organization = self.group
+        self.user.user_profile.save()
+
+        self.ip = InformationPackage.objects.create()
+        self.group.add_object(self.ip)
+
+    def test_cached(self):
+        self.assertEqual(get_search_visibility(self.user), ([], [str(self.ip.pk)]))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_search_visibility(self.user), ([], [str(self.ip.pk)]))
+
+    def test_invalidated_when_objects_are_added_to_groups(self):
+        get_search_visibility(self.user)
+
+        other_ip = InformationPackage.objects.create()
+        other_group = Group.objects.create(name='other', group_type=self.org_group_type)
+        other_group.add_object(other_ip)
+        self.assertEqual(get_search_visibility(self.user), ([], [str(self.ip.pk)]))
+
+        self.group.add_objects([other_ip])
+        self.assertCountEqual(get_search_visibility(self.user)[1], [str(self.ip.pk), str(other_ip.pk)])
+
+    def test_invalidated_when_objects_are_deleted(self):
+        get_search_visibility(self.user)
+
+        self.ip.delete()
+        self.assertEqual(get_search_visibility(self.user), ([], []))
+
+    def test_cached_per_organization(self):
+        get_search_visibility(self.user)
+
+        other_group = Group.objects.create(name='other', group_type=self.org_group_type)
+        other_group.add_member(self.user.essauth_member)
+        self.user.user_profile.current_organization = other_group
+        self.user.user_profile.save()
+
+        self.assertEqual(get_search_visibility(self.user), ([], []))
+
+    def test_not_cached_when_user_becomes_superuser(self):
+        other_ip = InformationPackage.objects.create()
+        Group.objects.create(name='other', group_type=self.org_group_type).add_object(other_ip)
+        self.assertEqual(get_search_visibility(self.user), ([], [str(self.ip.pk)]))
+
+        self.user.is_superuser = True
+        self.user.save()
+
+        self.assertCountEqual(get_search_visibility(self.user)[1], [str(self.ip.pk), str(other_ip.pk)])
+
+    def test_not_cached_when_user_is_deactivated(self):
+        get_search_visibility(self.user)
+
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(get_search_visibility(self.user), ([], []))
+
+    @override_settings(SEARCH_VISIBILITY_CACHE_TIMEOUT=0)
+    def test_cache_disabled(self):
+        get_search_visibility(self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            get_search_visibility(self.user)
+        self.assertGreater(len(queries), 0)
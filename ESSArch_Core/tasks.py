@@ -147,7 +147,7 @@ def GenerateXML(self, filesToCreate=None, folderToParse=None, extra_paths_to_par
     )
     generator.generate(
         filesToCreate, folderToParse=folderToParse, extra_paths_to_parse=extra_paths_to_parse,
-        parsed_files=parsed_files, algorithm=algorithm,
+        parsed_files=parsed_files, algorithm=algorithm, progress_callback=self.set_progress,
     )
 
     if filesToCreate is None:
@@ -305,7 +305,7 @@ def ValidateWorkarea(self, workarea, validators, stop_at_failure=True):
     try:
         validation.validate_path(workarea.path, validators, validation_profile, data=profile_data, ip=ip,
                                  task=self.get_processtask(), stop_at_failure=stop_at_failure,
-                                 responsible=responsible)
+                                 responsible=responsible, progress_callback=self.set_progress)
     except ValidationError:
         create_notification(ip)
     else:
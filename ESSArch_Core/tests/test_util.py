@@ -1,10 +1,13 @@
 import datetime
 import os
+import pathlib
 import shutil
+import tarfile
 import tempfile
 from subprocess import PIPE
 from unittest import mock
 
+from django.core.cache import cache
 from django.core.files.base import ContentFile
 from django.http.response import FileResponse
 from django.test import SimpleTestCase, TestCase
@@ -14,16 +17,25 @@ from rest_framework.exceptions import NotFound, ValidationError
 from ESSArch_Core.util import (
     convert_file,
     delete_path,
+    delete_tar_index,
     find_destination,
     flatten,
     generate_file_response,
+    get_cache_version,
     get_files_and_dirs,
+    get_tar_index_path,
     get_value_from_path,
     getSchemas,
+    invalidate_cache_version,
     list_files,
+    list_tar_files,
     nested_lookup,
     normalize_path,
+    open_file,
     parse_content_range_header,
+    read_tar_index,
+    write_file_chunk,
+    write_tar_index,
 )
 
 
@@ -530,6 +542,59 @@ class DeletePathTests(SimpleTestCase):
         delete_path(path)
         self.assertFalse(os.path.exists(path))
 
+    def test_delete_tar_with_index(self):
+        path = os.path.join(self.datadir, 'foo.tar')
+        open(path, 'a').close()
+        open(get_tar_index_path(path), 'a').close()
+
+        delete_path(path)
+        self.assertEqual(os.listdir(self.datadir), [])
+
+
+class DeleteTarIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+
+    def test_delete_index(self):
+        path = os.path.join(self.datadir, 'foo.tar')
+        open(get_tar_index_path(path), 'a').close()
+
+        delete_tar_index(pathlib.Path(path))
+        delete_tar_index(path)
+        self.assertEqual(os.listdir(self.datadir), [])
+
+    def test_only_tar_containers(self):
+        path = os.path.join(self.datadir, 'foo.zip')
+        open(get_tar_index_path(path), 'a').close()
+
+        delete_tar_index(path)
+        self.assertEqual(os.listdir(self.datadir), [os.path.basename(get_tar_index_path(path))])
+
+
+class CacheVersionTests(SimpleTestCase):
+    def setUp(self):
+        self.key = 'test_cache_version'
+        cache.delete(self.key)
+        self.addCleanup(cache.delete, self.key)
+
+    def test_version_is_stable(self):
+        self.assertEqual(get_cache_version(self.key), get_cache_version(self.key))
+
+    def test_invalidate(self):
+        version = get_cache_version(self.key)
+        invalidate_cache_version(self.key)
+        self.assertNotEqual(get_cache_version(self.key), version)
+
+    def test_invalidate_missing_version(self):
+        invalidate_cache_version(self.key)
+        self.assertIsNotNone(cache.get(self.key))
+
+    def test_evicted_version_is_not_reused(self):
+        version = get_cache_version(self.key)
+        cache.delete(self.key)
+        self.assertGreater(get_cache_version(self.key), version)
+
 
 class FindDestinationTests(SimpleTestCase):
     def test_find_destination(self):
@@ -595,3 +660,107 @@ class FindDestinationTests(SimpleTestCase):
         for value, expected in tests:
             with self.subTest(value=value):
                 self.assertEqual(find_destination(value, structure), expected)
+
+
+class WriteFileChunkTests(SimpleTestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+        self.filepath = os.path.join(self.datadir, 'foo.txt')
+
+    def test_out_of_order_chunks(self):
+        write_file_chunk(self.filepath, ContentFile(b'abc'), 0)
+        write_file_chunk(self.filepath, ContentFile(b'ghi'), 6)
+        write_file_chunk(self.filepath, ContentFile(b'def'), 3)
+
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(f.read(), b'abcdefghi')
+
+    def test_newlines_are_written_unchanged(self):
+        write_file_chunk(self.filepath, ContentFile(b'a\nb\r\n'), 0)
+        write_file_chunk(self.filepath, ContentFile(b'\rc\n\n'), 5)
+
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(f.read(), b'a\nb\r\n\rc\n\n')
+
+    def test_first_chunk_truncates_file(self):
+        with open(self.filepath, 'wb') as f:
+            f.write(b'old content')
+
+        write_file_chunk(self.filepath, ContentFile(b'abc'), 0)
+
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(f.read(), b'abc')
+
+
+class TarIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+
+        self.srcdir = os.path.join(self.datadir, 'foo')
+        os.makedirs(os.path.join(self.srcdir, 'bar'))
+        self.content = {
+            'foo/a.txt': b'a' * 1000,
+            'foo/bar/b.txt': b'b' * 100000,
+            'foo/bar/empty.txt': b'',
+        }
+        for name, content in self.content.items():
+            with open(os.path.join(self.datadir, name), 'wb') as f:
+                f.write(content)
+
+        self.container = os.path.join(self.datadir, 'foo.tar')
+        with tarfile.open(self.container, 'w') as tar:
+            tar.add(self.srcdir, 'foo')
+        write_tar_index(self.container)
+
+    def test_index_contains_only_files(self):
+        index = read_tar_index(self.container)
+        self.assertEqual(set(index.keys()), set(self.content.keys()))
+
+    @mock.patch('ESSArch_Core.util.tarfile.open', side_effect=tarfile.open)
+    def test_open_file_using_index(self, mock_tar_open):
+        for name, content in self.content.items():
+            with self.subTest(name=name):
+                with open_file(name, container=self.container) as f:
+                    self.assertEqual(f.read(), content)
+
+        with open_file('bar/b.txt', container=self.container, container_prefix='foo') as f:
+            f.seek(-10, os.SEEK_END)
+            self.assertEqual(f.read(), b'b' * 10)
+
+        mock_tar_open.assert_not_called()
+
+    def test_open_file_without_index(self):
+        os.remove(self.container + '.index.json')
+
+        with open_file('foo/a.txt', container=self.container) as f:
+            self.assertEqual(f.read(), self.content['foo/a.txt'])
+
+    def test_stale_index_is_ignored(self):
+        with tarfile.open(self.container, 'a') as tar:
+            tar.add(os.path.join(self.srcdir, 'a.txt'), 'foo/c.txt')
+
+        self.assertIsNone(read_tar_index(self.container))
+        with open_file('foo/c.txt', container=self.container) as f:
+            self.assertEqual(f.read(), self.content['foo/a.txt'])
+
+    def test_copied_index_is_used(self):
+        dst = os.path.join(self.datadir, 'copy.tar')
+        shutil.copyfile(self.container, dst)
+        shutil.copyfile(self.container + '.index.json', dst + '.index.json')
+        os.utime(dst, ns=(0, 0))
+
+        self.assertEqual(read_tar_index(dst), read_tar_index(self.container))
+
+    def test_list_tar_files(self):
+        with_index = list_tar_files(self.container)
+        os.remove(self.container + '.index.json')
+        without_index = list_tar_files(self.container)
+
+        key = lambda entry: entry['name']  # noqa: E731
+        self.assertEqual(sorted(with_index, key=key), sorted(without_index, key=key))
+        self.assertEqual(
+            {entry['name']: entry['size'] for entry in with_index},
+            {name: len(content) for name, content in self.content.items()},
+        )
@@ -24,6 +24,7 @@
 
 import errno
 import glob
+import hashlib
 import io
 import itertools
 import json
@@ -42,6 +43,7 @@ import zipfile
 from copy import deepcopy
 from datetime import datetime
 from decimal import Decimal
+from functools import lru_cache
 from os import scandir, walk
 from pathlib import Path
 from subprocess import PIPE, Popen
@@ -66,6 +68,11 @@ from ESSArch_Core.crypto import decrypt_remote_credentials
 from ESSArch_Core.exceptions import NoFileChunksFound
 from ESSArch_Core.fixity.format import FormatIdentifier
 
+TAR_INDEX_SUFFIX = '.index.json'
+# The start and the end of a container, up to this many bytes each, are
+# hashed to tell if an index belongs to it
+TAR_INDEX_DIGEST_SIZE = 64 * 1024
+
 XSD_NAMESPACE = "http://www.w3.org/2001/XMLSchema"
 XSI_NAMESPACE = "http://www.w3.org/2001/XMLSchema-instance"
 VERSION = get_versions()['version']
@@ -123,6 +130,30 @@ def stable_path(path):
     return True
 
 
+def get_cache_version(key):
+    """
+    Returns the current version stored in the cache at key. Values derived
+    from the versioned data can be cached using this version until
+    invalidate_cache_version is called with the same key.
+    """
+
+    version = cache.get(key)
+    if version is None:
+        # start from the current time to never reuse versions after eviction
+        version = time.time_ns()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+
+    return version
+
+
+def invalidate_cache_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
 def get_elements_without_namespace(root, path, value=None):
     element_path = []
     splits = path.split("/")
@@ -520,6 +551,23 @@ def delete_path(path, remote_host=None, remote_credentials=None, task=None):
             else:
                 raise
 
+        delete_tar_index(path)
+
+
+def delete_tar_index(container):
+    """
+    Deletes the index written next to container, if container is a tar
+    """
+
+    container = os.fspath(container)
+    if os.path.splitext(container)[1].lower() != '.tar':
+        return
+
+    try:
+        os.remove(get_tar_index_path(container))
+    except FileNotFoundError:
+        pass
+
 
 def delete_content(folder):
     for entry in scandir(folder):
@@ -752,22 +800,11 @@ def list_files(path, force_download=False, expand_container=False, request=None,
 
     if os.path.isfile(path):
         if expand_container and tarfile.is_tarfile(path):
-            with tarfile.open(path) as tar:
-                entries = []
-                for member in tar.getmembers():
-                    if not member.isfile():
-                        continue
-
-                    entries.append({
-                        "name": member.name,
-                        "type": 'file',
-                        "size": member.size,
-                        "modified": timestamp_to_datetime(member.mtime),
-                    })
-                if paginator is not None:
-                    paginated = paginator.paginate_queryset(entries, request)
-                    return paginator.get_paginated_response(paginated)
-                return Response(entries)
+            entries = list_tar_files(path)
+            if paginator is not None:
+                paginated = paginator.paginate_queryset(entries, request)
+                return paginator.get_paginated_response(paginated)
+            return Response(entries)
 
         elif expand_container and zipfile.is_zipfile(path) and os.path.splitext(path)[1] == '.zip':
             with zipfile.ZipFile(path) as zipf:
@@ -813,6 +850,11 @@ def list_files(path, force_download=False, expand_container=False, request=None,
         tar_path, tar_subpath = path.split('.tar/')
         tar_path += '.tar'
 
+        f = open_indexed_tar_member(tar_path, tar_subpath)
+        if f is not None:
+            content_type = fid.get_mimetype(tar_subpath)
+            return generate_file_response(f, content_type, force_download, name=tar_subpath)
+
         with tarfile.open(tar_path) as tar:
             try:
                 f = io.BytesIO(tar.extractfile(tar_subpath).read())
@@ -870,6 +912,28 @@ def merge_file_chunks(chunks_path, filepath):
         os.fsync(f.fileno())   # Flush OS buffer to disk
 
 
+def write_file_chunk(filepath, chunk, start):
+    """
+    Writes the uploaded chunk at the given offset of filepath.
+
+    The first chunk, starting at offset 0, truncates the file. Other chunks
+    are written in place which allows them to be received in any order, and
+    concurrently, once the first chunk has been written.
+    """
+
+    # O_BINARY is required on Windows to not translate newlines
+    flags = os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+    if start == 0:
+        flags |= os.O_TRUNC
+
+    with open(os.open(filepath, flags, 0o666), 'wb') as dstf:
+        dstf.seek(start)
+        for c in chunk.chunks():
+            dstf.write(c)
+        dstf.flush()              # Flush Python buffer
+        os.fsync(dstf.fileno())   # Flush OS buffer to disk
+
+
 def turn_off_auto_now(ModelClass, field_name):
     def auto_now_off(field):
         field.auto_now = False
@@ -939,12 +1003,262 @@ def has_write_access(directory):
         return os.access(directory, os.W_OK)
 
 
+def get_tar_index_path(container):
+    return container + TAR_INDEX_SUFFIX
+
+
+def get_tar_index_digest(fileobj, size):
+    """
+    Returns the SHA-256 of the first and last TAR_INDEX_DIGEST_SIZE bytes of
+    the container in the seekable fileobj of the given size. Together with
+    the size it identifies the container an index was written for, also
+    after the container has been copied.
+    """
+
+    h = hashlib.sha256()
+    fileobj.seek(0)
+    h.update(fileobj.read(min(size, TAR_INDEX_DIGEST_SIZE)))
+
+    tail_start = max(TAR_INDEX_DIGEST_SIZE, size - TAR_INDEX_DIGEST_SIZE)
+    if tail_start < size:
+        fileobj.seek(tail_start)
+        h.update(fileobj.read(size - tail_start))
+
+    return h.hexdigest()
+
+
+@lru_cache(maxsize=32)
+def _get_local_tar_index_digest(container, mtime_ns, size):
+    with open(container, 'rb') as f:
+        return get_tar_index_digest(f, size)
+
+
+def write_tar_index(container):
+    """
+    Writes a sidecar index of the files in the uncompressed tar container,
+    mapping the name of each file to the offset and size of its data and
+    its modification time. This allows files to be listed and read without
+    scanning all headers in the container.
+
+    Args:
+        container: The tar file to index
+
+    Returns:
+        The path of the index
+    """
+
+    with tarfile.open(container, 'r:') as tar:
+        members = tar.getmembers()
+
+    st = os.stat(container)
+    index = {
+        'size': st.st_size,
+        'digest': _get_local_tar_index_digest(container, st.st_mtime_ns, st.st_size),
+        'members': {
+            member.name: [None if member.issparse() else member.offset_data, member.size, member.mtime]
+            for member in members if member.isfile()
+        },
+    }
+
+    index_path = get_tar_index_path(container)
+    with open(index_path, 'w') as f:
+        json.dump(index, f)
+
+    return index_path
+
+
+@lru_cache(maxsize=32)
+def _load_tar_index(index_path, mtime_ns, size):
+    with open(index_path) as f:
+        return json.load(f)
+
+
+def read_tar_index(container):
+    """
+    Reads the sidecar index of the tar container
+
+    Returns:
+        A dict mapping the name of each file in the container to the offset
+        and size of its data and its modification time, or None if there is
+        no valid index
+    """
+
+    index_path = get_tar_index_path(container)
+    try:
+        container_st = os.stat(container)
+        index_st = os.stat(index_path)
+        index = _load_tar_index(index_path, index_st.st_mtime_ns, index_st.st_size)
+
+        # the index is stale if the container has been rewritten since
+        if index.get('size') != container_st.st_size:
+            return None
+        if index.get('digest') != _get_local_tar_index_digest(
+            container, container_st.st_mtime_ns, container_st.st_size,
+        ):
+            return None
+    except (OSError, ValueError):
+        return None
+
+    return index['members']
+
+
+def find_tar_index_member(members, path, container_prefix=''):
+    """
+    Looks up the file at path, relative to the container or to
+    container_prefix inside it, in the members of a tar index
+
+    Returns:
+        A tuple with the offset and size of the data of the file, or None if
+        it isn't in the index or can't be read directly from the container
+    """
+
+    for name in (path, normalize_path(os.path.join(container_prefix, path))):
+        try:
+            offset, size, _mtime = members[name]
+        except KeyError:
+            continue
+
+        if offset is None:
+            return None
+
+        return offset, size
+
+    return None
+
+
+class FileSlice(io.RawIOBase):
+    """
+    A read-only, seekable view of size bytes starting at offset in fileobj
+    """
+
+    def __init__(self, fileobj, offset, size):
+        self.fileobj = fileobj
+        self.offset = offset
+        self.size = size
+        self.position = 0
+
+    @property
+    def name(self):
+        return getattr(self.fileobj, 'name', '')
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError('Invalid whence ({}, should be 0, 1 or 2)'.format(whence))
+
+        if position < 0:
+            raise OSError(errno.EINVAL, os.strerror(errno.EINVAL))
+
+        self.position = position
+        return self.position
+
+    def readinto(self, b):
+        n = max(0, min(len(b), self.size - self.position))
+        if n == 0:
+            return 0
+
+        self.fileobj.seek(self.offset + self.position)
+        n = self.fileobj.readinto(memoryview(b)[:n])
+        self.position += n
+        return n
+
+    def readall(self):
+        # read the rest in as few reads of the underlying file as possible
+        # instead of in chunks of io.DEFAULT_BUFFER_SIZE
+        data = bytearray()
+        while self.position < self.size:
+            b = bytearray(self.size - self.position)
+            n = self.readinto(b)
+            if not n:
+                break
+            data += b[:n]
+        return bytes(data)
+
+    def close(self):
+        if not self.closed:
+            self.fileobj.close()
+        super().close()
+
+
+def open_indexed_tar_member(container, path, container_prefix=''):
+    """
+    Opens the file at path in the tar container using the sidecar index of
+    the container
+
+    Returns:
+        A file object reading the data of the file directly from the
+        container, or None if the file can't be found using the index
+    """
+
+    index = read_tar_index(container)
+    if index is None:
+        return None
+
+    member = find_tar_index_member(index, path, container_prefix)
+    if member is None:
+        return None
+
+    offset, size = member
+    return io.BufferedReader(FileSlice(open(container, 'rb'), offset, size))
+
+
+def list_tar_files(container):
+    """
+    Lists the files in the tar container, using its sidecar index if
+    available
+    """
+
+    index = read_tar_index(container)
+    if index is not None:
+        return [
+            {
+                "name": name,
+                "type": 'file',
+                "size": size,
+                "modified": timestamp_to_datetime(mtime),
+            }
+            for name, (_offset, size, mtime) in index.items()
+        ]
+
+    with tarfile.open(container) as tar:
+        entries = []
+        for member in tar.getmembers():
+            if not member.isfile():
+                continue
+
+            entries.append({
+                "name": member.name,
+                "type": 'file',
+                "size": member.size,
+                "modified": timestamp_to_datetime(member.mtime),
+            })
+        return entries
+
+
 def open_file(path='', *args, container=None, container_prefix='', **kwargs):
     logger = logging.getLogger('essarch')
     if container is None:
         return open(path, *args, **kwargs)
 
     if container is not None and path:
+        f = open_indexed_tar_member(container, path, container_prefix)
+        if f is not None:
+            return f
+
         try:
             with tarfile.open(container) as tar:
                 try: